@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+BarTab API benchmark suite
+
+Seeds a local database with a configurable volume of data, drives every
+endpoint in server.py with concurrent requests and reports latency
+percentiles and throughput, optionally as JSON for comparing commits.
+
+Usage:
+    # Seed the database the server points at (MONGO_URL / MONGO_DB_NAME, or SQLITE_PATH
+    # with STORAGE_BACKEND=sqlite)
+    MONGO_DB_NAME=bartab_bench python benchmark.py seed --drinks 100 --guests 10000 --transactions 1000000
+
+    # Benchmark a running server...
+    python benchmark.py run --base-url http://localhost:8001 --output before.json
+    # ...or the app in-process, against the same database
+    MONGO_DB_NAME=bartab_bench python benchmark.py run --in-process --output after.json
+
+    # Compare two runs
+    python benchmark.py compare before.json after.json
+
+    # Time serializing a 10k-row transaction list the old and new way
+    python benchmark.py serialize --rows 10000
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+
+SEED_BATCH_SIZE = 5000
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Seeding
+
+def make_drink(index):
+    volume_unit = random.choice(["ml", "oz"])
+    return {
+        "name": f"Bench Drink {index}",
+        "base_cost": round(random.uniform(15, 120), 2),
+        "total_volume": random.choice([750.0, 1000.0, 1750.0]) if volume_unit == "ml" else random.choice([25.0, 33.8, 59.2]),
+        "volume_unit": volume_unit,
+        "volume_served": random.choice([1.5, 2.0, 2.5]),
+        "mixer_cost": round(random.uniform(0, 1), 2),
+        "flat_cost": round(random.uniform(0, 0.5), 2)
+    }
+
+
+async def seed(args):
+    import server
+
+    server.connect_storage()
+    random.seed(args.seed)
+    if args.drop:
+        await server.store.drop_all()
+    await server.ensure_indexes()
+
+    now = datetime.now()
+    drinks = []
+    for index in range(args.drinks):
+        drink = make_drink(index)
+        drink.update({"id": str(uuid.uuid4()), "created_at": now})
+        drink.update(server.drink_price_fields(drink))
+        drinks.append(drink)
+    if drinks:
+        await server.store.insert_many("drinks", drinks)
+        await server.drinks_changed()
+    print(f"Seeded {len(drinks)} drinks")
+
+    guests = [f"Bench Guest {index:06d}" for index in range(args.guests)]
+    start = now - timedelta(days=args.days)
+    span = args.days * 86400
+
+    written = 0
+    while written < args.transactions:
+        batch = []
+        for _ in range(min(SEED_BATCH_SIZE, args.transactions - written)):
+            drink = random.choice(drinks)
+            guest_name = random.choice(guests)
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "guest_name": guest_name,
+                "guest_key": server.normalize_guest_key(guest_name),
+                "drink_id": drink["id"],
+                "calculated_price": drink["calculated_price"],
+                "price_cents": drink["price_cents"],
+                "date": start + timedelta(seconds=random.randrange(span)),
+                "created_at": now
+            })
+        await server.insert_transactions(batch)
+        written += len(batch)
+        print(f"\rSeeded {written}/{args.transactions} transactions", end="", flush=True)
+    print()
+
+    written = 0
+    while written < args.payments:
+        batch = []
+        for _ in range(min(SEED_BATCH_SIZE, args.payments - written)):
+            guest_name = random.choice(guests)
+            amount_cents = random.randint(500, 6000)
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "guest_name": guest_name,
+                "guest_key": server.normalize_guest_key(guest_name),
+                "amount": server.from_cents(amount_cents),
+                "amount_cents": amount_cents,
+                "date": start + timedelta(seconds=random.randrange(span)),
+                "notes": "benchmark",
+                "created_at": now
+            })
+        await server.insert_payments(batch)
+        written += len(batch)
+        print(f"\rSeeded {written}/{args.payments} payments", end="", flush=True)
+    print()
+    # Invalidate ETags handed out before the seed
+    await server.bump_versions("transactions", "payments", "balances")
+    server.close_storage()
+    return 0
+
+
+# Load generation
+
+class Context:
+    """Sample ids and names from the seeded data for building requests"""
+
+    def __init__(self):
+        self.drink_ids = []
+        self.guest_names = []
+        self.transaction_ids = []
+        self.payment_ids = []
+        self.created_transaction_ids = []
+        self.created_payment_ids = []
+
+    async def load(self, client):
+        self.drink_ids = [d["id"] for d in (await client.get("/api/drinks")).json()]
+        self.guest_names = [g["guest_name"] for g in (await client.get("/api/guests/balances")).json()]
+        self.transaction_ids = [t["id"] for t in (await client.get("/api/transactions", params={"limit": 200})).json()]
+        self.payment_ids = [p["id"] for p in (await client.get("/api/payments", params={"limit": 200})).json()]
+        if not self.drink_ids or not self.guest_names:
+            raise SystemExit("No drinks or guests found; run the seed command first")
+
+    def guest(self):
+        return random.choice(self.guest_names)
+
+    def drink(self):
+        return random.choice(self.drink_ids)
+
+
+async def create_transaction(client, ctx):
+    response = await client.post("/api/transactions", json={"guest_name": ctx.guest(), "drink_id": ctx.drink()})
+    if response.status_code == 200:
+        ctx.created_transaction_ids.append(response.json()["id"])
+    return response
+
+
+async def delete_transaction(client, ctx):
+    return await client.delete(f"/api/transactions/{ctx.created_transaction_ids.pop()}")
+
+
+async def create_payment(client, ctx):
+    response = await client.post("/api/payments", json={"guest_name": ctx.guest(), "amount": 10.0, "notes": "benchmark"})
+    if response.status_code == 200:
+        ctx.created_payment_ids.append(response.json()["id"])
+    return response
+
+
+async def delete_payment(client, ctx):
+    return await client.delete(f"/api/payments/{ctx.created_payment_ids.pop()}")
+
+
+async def create_round(client, ctx):
+    items = [{"guest_name": ctx.guest(), "drink_id": ctx.drink()} for _ in range(12)]
+    return await client.post("/api/transactions/batch", json={"items": items})
+
+
+async def suggest_guests(client, ctx):
+    # What a guest name field sends while it is typed: a prefix of a real name
+    guest_name = ctx.guest()
+    prefix = guest_name[:random.randint(1, len(guest_name))]
+    return await client.get("/api/guests/suggest", params={"prefix": prefix})
+
+
+async def export_guest_csv(client, ctx):
+    # A full export of a seeded history is a bulk job, not a latency benchmark
+    async with client.stream("GET", "/api/transactions/export/csv", params={"guest_name": ctx.guest()}) as response:
+        async for _ in response.aiter_bytes():
+            pass
+    return response
+
+
+# Scenario name -> request builder. Deletes consume the ids created by the
+# matching create scenario, so they run after it with the same request count.
+SCENARIOS = {
+    "GET /": lambda client, ctx: client.get("/"),
+    "GET /api/drinks": lambda client, ctx: client.get("/api/drinks"),
+    "GET /api/drinks/{id}": lambda client, ctx: client.get(f"/api/drinks/{ctx.drink()}"),
+    "POST /api/calculate-price": lambda client, ctx: client.post("/api/calculate-price", json={"drink_id": ctx.drink()}),
+    "POST /api/transactions": create_transaction,
+    "POST /api/transactions/batch": create_round,
+    "GET /api/transactions?limit=50": lambda client, ctx: client.get("/api/transactions", params={"limit": 50}),
+    "GET /api/transactions?guest_name": lambda client, ctx: client.get("/api/transactions", params={"guest_name": ctx.guest(), "limit": 50}),
+    "GET /api/transactions/{id}": lambda client, ctx: client.get(f"/api/transactions/{random.choice(ctx.transaction_ids)}"),
+    "GET /api/transactions/export/csv?guest_name": export_guest_csv,
+    "DELETE /api/transactions/{id}": delete_transaction,
+    "POST /api/payments": create_payment,
+    "GET /api/payments?limit=50": lambda client, ctx: client.get("/api/payments", params={"limit": 50}),
+    "GET /api/payments/{id}": lambda client, ctx: client.get(f"/api/payments/{random.choice(ctx.payment_ids)}"),
+    "DELETE /api/payments/{id}": delete_payment,
+    "GET /api/guests/balances": lambda client, ctx: client.get("/api/guests/balances"),
+    "GET /api/guests/{name}/balance": lambda client, ctx: client.get(f"/api/guests/{ctx.guest()}/balance"),
+    "GET /api/guests/suggest?prefix": suggest_guests,
+    "GET /api/cache/stats": lambda client, ctx: client.get("/api/cache/stats"),
+    "GET /api/reports?interval=day": lambda client, ctx: client.get("/api/reports", params={"interval": "day"}),
+    "GET /api/reports?interval=total&group_by=drink": lambda client, ctx: client.get(
+        "/api/reports", params={"interval": "total", "group_by": "drink"}
+    ),
+}
+
+
+async def run_scenario(client, ctx, make_request, requests, concurrency):
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, ctx)
+                if response.status_code >= 400:
+                    errors += 1
+            except (httpx.HTTPError, IndexError):
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0
+    }
+
+
+async def run(args):
+    if args.in_process:
+        import server
+        await server.app.router.startup()
+        transport = httpx.ASGITransport(app=server.app)
+        base_url = "http://bench"
+    else:
+        server = None
+        transport = None
+        base_url = args.base_url
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    selected = [name for name in SCENARIOS if not args.only or any(part in name for part in args.only)]
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=args.timeout) as client:
+            ctx = Context()
+            await ctx.load(client)
+            for name in selected:
+                make_request = SCENARIOS[name]
+                # Warm up connections and caches before measuring
+                await run_scenario(client, ctx, make_request, args.warmup, min(args.warmup, args.concurrency) or 1)
+                results[name] = await run_scenario(client, ctx, make_request, args.requests, args.concurrency)
+                print_result(name, results[name])
+    finally:
+        if server:
+            await server.app.router.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "target": "in-process" if args.in_process else base_url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "dataset": {
+            "drinks": len(ctx.drink_ids),
+            "guests": len(ctx.guest_names)
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"\nWrote results to {args.output}")
+    return 0
+
+
+def print_result(name, result):
+    print(
+        f"{name:<48} {result['requests_per_sec']:>9.1f} req/s  "
+        f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+        f"p99 {result['p99_ms']:>8.2f} ms  errors {result['errors']}"
+    )
+
+
+# Serialization
+
+def time_repeats(fn, repeats):
+    """Best wall time of fn over the repeats, in milliseconds"""
+    best = math.inf
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def serialize(args):
+    """Compare per-row model serialization with the orjson row fast path"""
+    from fastapi.responses import JSONResponse
+    from fastapi.utils import create_response_field
+
+    import server
+
+    now = datetime.now()
+    documents = []
+    for i in range(args.rows):
+        price_cents = random.randint(200, 1500)
+        documents.append({
+            "id": str(uuid.uuid4()),
+            "guest_name": f"Guest {i % 1000}",
+            "drink_id": str(uuid.uuid4()),
+            "calculated_price": server.from_cents(price_cents),
+            "price_cents": price_cents,
+            "date": now - timedelta(minutes=i),
+            "created_at": now
+        })
+    field = create_response_field(name="Response", type_=server.List[server.Transaction])
+
+    def model_path():
+        # What list routes did before: build a model per row, then FastAPI
+        # validates the list against response_model and serializes it again
+        models = [server.Transaction(**document) for document in documents]
+        value, errors = field.validate(models, {}, loc=("response",))
+        JSONResponse(field.serialize(value, mode="json"))
+
+    def row_path():
+        server.ORJSONResponse(server.TRANSACTION_ROWS.rows(documents))
+
+    results = {
+        "models": time_repeats(model_path, args.repeats),
+        "orjson_rows": time_repeats(row_path, args.repeats)
+    }
+    for name, elapsed in results.items():
+        print(f"{name:<12} {elapsed:>9.2f} ms per {args.rows} rows")
+    print(f"speedup      {results['models'] / results['orjson_rows']:>9.1f}x")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.candidate) as candidate_file:
+        candidate = json.load(candidate_file)
+
+    print(f"Baseline {baseline.get('commit')} vs candidate {candidate.get('commit')}")
+    regressions = 0
+    for name, result in candidate["results"].items():
+        before = baseline["results"].get(name)
+        if not before or not before["p95_ms"]:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:<48} p95 {before['p95_ms']:>8.2f} -> {result['p95_ms']:>8.2f} ms ({change:+.1f}%){flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BarTab API benchmark suite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="Load benchmark data straight into the configured store")
+    seed_parser.add_argument("--drinks", type=int, default=100)
+    seed_parser.add_argument("--guests", type=int, default=10000)
+    seed_parser.add_argument("--transactions", type=int, default=1000000)
+    seed_parser.add_argument("--payments", type=int, default=100000)
+    seed_parser.add_argument("--days", type=int, default=365, help="Spread history over this many days")
+    seed_parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducible data")
+    seed_parser.add_argument("--drop", action="store_true", help="Drop the database's collections first")
+
+    run_parser = subparsers.add_parser("run", help="Benchmark every endpoint")
+    run_parser.add_argument("--base-url", default="http://localhost:8001")
+    run_parser.add_argument("--in-process", action="store_true", help="Drive the ASGI app directly instead of over HTTP")
+    run_parser.add_argument("--requests", type=int, default=500, help="Measured requests per endpoint")
+    run_parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint")
+    run_parser.add_argument("--concurrency", type=int, default=20)
+    run_parser.add_argument("--timeout", type=float, default=60.0)
+    run_parser.add_argument("--only", nargs="*", help="Only run scenarios whose name contains one of these strings")
+    run_parser.add_argument("--output", help="Write results as JSON to this file")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two JSON result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="p95 increase (%%) reported as a regression")
+
+    serialize_parser = subparsers.add_parser("serialize", help="Time list serialization without a database")
+    serialize_parser.add_argument("--rows", type=int, default=10000)
+    serialize_parser.add_argument("--repeats", type=int, default=5, help="Report the best of this many runs")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        return asyncio.run(seed(args))
+    if args.command == "run":
+        return asyncio.run(run(args))
+    if args.command == "serialize":
+        return serialize(args)
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
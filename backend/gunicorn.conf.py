@@ -0,0 +1,46 @@
+"""
+Production gunicorn settings for the BarTab API
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Send SIGHUP to the master (e.g. `supervisorctl signal HUP backend`) to reload
+gracefully: new workers start and old ones finish in-flight requests first.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Each worker imports the app itself and opens its own store (Mongo pool or
+# SQLite connection) on startup
+preload_app = False
+
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.environ.get("WORKER_TIMEOUT", "60"))
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info").lower()
+
+# Workers write Prometheus samples here so /metrics on any worker covers all of
+# them; it must be set before the workers import server.py
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "bartab-metrics")
+)
+
+
+def on_starting(server):
+    # Samples from a previous master would otherwise be reported forever
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
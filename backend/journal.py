@@ -0,0 +1,164 @@
+"""
+Durable local journal for write-behind writes
+
+Records are appended as JSON lines to segment files in one directory and
+fsynced in groups: every append waits for an fsync that covers it, and
+appends that arrive while an fsync runs share the next one. Each process
+holds an flock on its own segments, so a segment nobody has locked belongs
+to a process that died before flushing it and can be claimed and replayed.
+"""
+
+from typing import List, Optional
+import asyncio
+import fcntl
+import glob
+import itertools
+import json
+import os
+import uuid
+
+
+class Segment:
+    """One locked journal file and the records written to it"""
+
+    def __init__(self, path: str, fd: int, records: Optional[List[dict]] = None):
+        self.path = path
+        self.fd = fd
+        self.records = records if records is not None else []
+        self.written = 0
+        self.synced = 0
+        self.syncing = None
+
+    @classmethod
+    def create(cls, path: str) -> "Segment":
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return cls(path, fd)
+
+    @classmethod
+    def claim(cls, path: str) -> Optional["Segment"]:
+        """Lock and read a segment no live process holds, or return None"""
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        if not os.path.exists(path):
+            # Flushed and removed by its owner between the listing and the lock
+            os.close(fd)
+            return None
+
+        records = []
+        with open(path, "rb") as file:
+            for line in file:
+                # A torn last line was never acknowledged, so it is dropped
+                if not line.endswith(b"\n"):
+                    break
+                records.append(json.loads(line))
+        return cls(path, fd, records)
+
+    def write(self, record: dict):
+        data = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        os.write(self.fd, data)
+        self.records.append(record)
+        self.written += len(data)
+
+    async def sync(self):
+        """Wait until everything written so far is on disk"""
+        target = self.written
+        while self.synced < target:
+            if self.syncing is None:
+                self.syncing = asyncio.ensure_future(self.fsync())
+            await asyncio.shield(self.syncing)
+
+    async def fsync(self):
+        upto = self.written
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, self.fd)
+            self.synced = max(self.synced, upto)
+        finally:
+            self.syncing = None
+
+    async def remove(self):
+        """Delete a segment whose records were all flushed"""
+        os.unlink(self.path)
+        await self.close()
+
+    async def set_aside(self) -> str:
+        """Rename a segment that cannot be flushed so it is no longer replayed, keeping its records"""
+        path = self.path + ".failed"
+        os.rename(self.path, path)
+        await self.close()
+        return path
+
+    async def close(self):
+        if self.syncing is not None:
+            await asyncio.shield(self.syncing)
+        os.close(self.fd)
+
+
+class Journal:
+    """This process's journal segments in a shared directory.
+
+    New records go to the current segment; seal() closes it for appends so it
+    can be flushed while appends continue in a fresh one.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+        # Unique per journal, so a recycled pid never reuses a dead process's file names
+        self.prefix = f"{name}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.counter = itertools.count()
+        self.segment = None
+        self.sealed = []
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment = self.new_segment()
+
+    def new_segment(self) -> Segment:
+        path = os.path.join(self.directory, f"{self.prefix}-{next(self.counter)}.jsonl")
+        return Segment.create(path)
+
+    async def append(self, record: dict):
+        """Write a record and return once it is durable"""
+        segment = self.segment
+        segment.write(record)
+        await segment.sync()
+
+    def pending(self) -> int:
+        return len(self.segment.records) + sum(len(segment.records) for segment in self.sealed)
+
+    def seal(self):
+        if self.segment.records:
+            self.sealed.append(self.segment)
+            self.segment = self.new_segment()
+
+    def claim_orphans(self) -> List[Segment]:
+        """Segments left behind by processes that exited without flushing them"""
+        own = {self.segment.path, *(segment.path for segment in self.sealed)} if self.segment else set()
+        orphans = []
+        for path in sorted(glob.glob(os.path.join(self.directory, f"{self.name}-*.jsonl"))):
+            if path in own:
+                continue
+            segment = Segment.claim(path)
+            if segment:
+                orphans.append(segment)
+        return orphans
+
+    async def close(self):
+        """Remove the empty current segment; segments still holding records stay for replay"""
+        for segment in self.sealed:
+            await segment.close()
+        self.sealed = []
+        if self.segment is not None:
+            if self.segment.records:
+                await self.segment.close()
+            else:
+                await self.segment.remove()
+            self.segment = None
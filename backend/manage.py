@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+BarTab maintenance commands
+
+Usage:
+    python manage.py rebuild-balances
+    python manage.py verify-balances
+    python manage.py ensure-indexes
+    python manage.py backfill-drink-prices
+    python manage.py backfill-guest-keys
+    python manage.py migrate-money-to-cents
+    python manage.py rebuild-rollups
+    python manage.py archive-history [--days N]
+    python manage.py import {drinks,transactions,payments} FILE [--format {csv,jsonl}]
+    python manage.py replay-journal [--directory DIR]
+    python manage.py apply-pending
+"""
+
+import argparse
+import asyncio
+import sys
+
+import server
+
+
+async def rebuild_balances(args):
+    guests = await server.rebuild_guest_balances()
+    print(f"Rebuilt balance ledger for {guests} guests")
+    return 0
+
+
+async def verify_balances(args):
+    mismatches = await server.verify_guest_balances()
+    if not mismatches:
+        print("Balance ledger matches transaction and payment history")
+        return 0
+
+    for mismatch in mismatches:
+        print(
+            f"{mismatch['guest_name']}: {mismatch['field']} is "
+            f"{mismatch['actual'] / 100:.2f}, expected {mismatch['expected'] / 100:.2f}"
+        )
+    print(f"{len(mismatches)} mismatches found; run rebuild-balances to repair")
+    return 1
+
+
+async def ensure_indexes(args):
+    report = await server.ensure_indexes()
+    for collection_name, index_names in report.items():
+        print(f"{collection_name}: {', '.join(index_names)}")
+    return 0
+
+
+async def backfill_drink_prices(args):
+    updated = await server.backfill_drink_prices()
+    print(f"Stored prices on {updated} drinks")
+    return 0
+
+
+async def backfill_guest_keys(args):
+    for kind in ("transactions", "payments"):
+        updated = await server.backfill_guest_keys(kind)
+        print(f"Stored guest keys on {updated} {kind}")
+    return 0
+
+
+async def migrate_money_to_cents(args):
+    counts = await server.migrate_money_to_cents()
+    print(f"Stored cents on {counts['drinks']} drinks, {counts['transactions']} transactions "
+          f"and {counts['payments']} payments")
+    print(f"Rebuilt balance ledger for {counts['guests']} guests")
+    return 0
+
+
+async def rebuild_rollups(args):
+    written = await server.rebuild_sales_rollups()
+    print(f"Rebuilt {written} sales rollup buckets")
+    return 0
+
+
+async def archive_history(args):
+    moved = await server.archive_history(args.days)
+    print(f"Archived {moved['transactions']} transactions and {moved['payments']} payments, "
+          f"removed {moved['guests']} settled guests from the ledger")
+    return 0
+
+
+def add_archive_history_arguments(parser):
+    parser.add_argument("--days", type=int, default=90,
+                        help="Archive guests settled and idle for this many days, and older deletions (default 90)")
+
+
+async def read_chunks(path, chunk_size=64 * 1024):
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def import_file(args):
+    file_format = args.format or ("jsonl" if args.file.endswith(".jsonl") else "csv")
+    records = server.iter_import_records(server.iter_text_lines(read_chunks(args.file)), file_format)
+    result = await server.import_records(args.kind, records)
+    for error in result.errors:
+        print(f"row {error.row}: {error.error}")
+    print(f"Imported {result.imported} {args.kind}, {result.failed} rows failed")
+    return 1 if result.failed else 0
+
+
+async def replay_journal(args):
+    if not args.directory:
+        print("No journal directory: set WRITE_BEHIND_DIR or pass --directory")
+        return 1
+    journal = server.Journal(args.directory, "transactions")
+    written = await server.replay_journal(journal)
+    print(f"Replayed {written} journaled transactions")
+    if journal.sealed:
+        print(f"{len(journal.sealed)} segments wait for a write still in progress; run again shortly")
+        await journal.close()
+        return 1
+    return 0
+
+
+async def apply_pending(args):
+    finished = await server.apply_pending()
+    print(f"Finished {finished['transactions']} transactions and {finished['payments']} payments "
+          "left pending by failed writes")
+    return 0
+
+
+def add_replay_journal_arguments(parser):
+    parser.add_argument("--directory", default=server.WRITE_BEHIND_DIR,
+                        help="Write-behind journal directory, defaults to WRITE_BEHIND_DIR")
+
+
+def add_import_arguments(parser):
+    parser.add_argument("kind", choices=sorted(server.IMPORTERS))
+    parser.add_argument("file", help="CSV file with a header row of field names, or JSONL")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to jsonl for .jsonl files, else csv")
+
+
+COMMANDS = {
+    "rebuild-balances": (rebuild_balances, "Recompute the guest balance ledger from history"),
+    "verify-balances": (verify_balances, "Check the guest balance ledger against history"),
+    "ensure-indexes": (ensure_indexes, "Create missing tables and indexes and list the indexes present"),
+    "backfill-drink-prices": (backfill_drink_prices, "Store prices on drinks created before prices were stored"),
+    "backfill-guest-keys": (backfill_guest_keys, "Store normalized guest keys on existing transactions and payments"),
+    "migrate-money-to-cents": (migrate_money_to_cents, "Store integer cents on existing money fields and rebuild the ledger"),
+    "rebuild-rollups": (rebuild_rollups, "Recompute the hourly and daily sales rollups from transaction history"),
+    "archive-history": (archive_history, "Move settled guests' history and old deletions into the archive"),
+    "import": (import_file, "Bulk import drinks, transactions or payments from a CSV or JSONL file"),
+    "replay-journal": (replay_journal, "Write transactions left in the write-behind journal by stopped workers"),
+    "apply-pending": (apply_pending, "Apply the ledger and rollup updates of transactions and payments whose write failed"),
+}
+
+# Commands taking arguments -> function adding them to the command's parser
+ARGUMENTS = {
+    "archive-history": add_archive_history_arguments,
+    "import": add_import_arguments,
+    "replay-journal": add_replay_journal_arguments,
+}
+
+
+async def run(handler, args):
+    server.connect_storage()
+    try:
+        # A fresh SQLite file has no tables until a worker or command creates them
+        await server.ensure_indexes()
+        return await handler(args)
+    finally:
+        server.close_storage()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BarTab maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        command_parser = subparsers.add_parser(name, help=help_text)
+        if name in ARGUMENTS:
+            ARGUMENTS[name](command_parser)
+
+    args = parser.parse_args()
+    handler, _ = COMMANDS[args.command]
+    return asyncio.run(run(handler, args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
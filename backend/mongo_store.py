@@ -0,0 +1,607 @@
+"""
+MongoDB storage backend (STORAGE_BACKEND=mongo)
+"""
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, CursorType, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+import logging
+import os
+import re
+
+from storage import ARCHIVES, DUPLICATE_ID, DuplicateIdError, HistoryFilter, Store
+
+logger = logging.getLogger("bartab")
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
+MONGO_DB_NAME = os.environ.get('MONGO_DB_NAME', 'bartab')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+EVENTS_CAPPED_BYTES = int(os.environ.get('EVENTS_CAPPED_BYTES', str(16 * 1024 * 1024)))
+
+# Documents that have not been deleted
+LIVE = {"deleted_at": {"$exists": False}}
+# Documents whose side effects are all applied, and those still waiting for some
+APPLIED = {"pending": {"$exists": False}}
+PENDING = {"pending": {"$exists": True}}
+
+# Archived history is read rarely, so it trades CPU for zstd's smaller blocks
+ARCHIVE_OPTIONS = {"storageEngine": {"wiredTiger": {"configString": "block_compressor=zstd"}}}
+ARCHIVE_BATCH_SIZE = 1000
+
+# Indexes backing the id lookups, guest/drink filters and date-sorted lists
+INDEXES = {
+    "drinks": [
+        ([("id", ASCENDING)], {"unique": True}),
+    ],
+    "transactions": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("guest_name", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("guest_key", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("drink_id", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("date", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+    "payments": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("guest_name", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("guest_key", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("date", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+    "guests": [
+        ([("guest_name", ASCENDING)], {"unique": True}),
+        ([("created_at", ASCENDING)], {}),
+    ],
+    "events": [
+        ([("seq", ASCENDING)], {}),
+    ],
+    "sales_rollups": [
+        ([("granularity", ASCENDING), ("start", ASCENDING), ("drink_id", ASCENDING), ("guest_name", ASCENDING)],
+         {"unique": True}),
+    ],
+    "transactions_archive": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("guest_name", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("guest_key", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("date", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+    "payments_archive": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("guest_name", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("guest_key", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)], {}),
+        ([("date", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+}
+
+# History lists are ordered newest first, with id breaking ties between equal dates
+HISTORY_SORT = [("date", DESCENDING), ("id", DESCENDING)]
+
+
+def reply_document_count(command_name: str, reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    return 0
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Report every Mongo command's latency and returned documents to the store's metrics"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        key = (event.connection_id, event.request_id)
+        self.collections[key] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), "")
+        self.metrics.succeeded(
+            event.command_name, collection, event.duration_micros / 1_000_000,
+            reply_document_count(event.command_name, event.reply)
+        )
+
+    def failed(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), "")
+        self.metrics.failed(event.command_name, collection)
+
+
+def guest_ledger_update(guest_key: str, owed_cents: int, paid_cents: int, now: datetime) -> dict:
+    """Ledger update adding to a guest's totals, creating the guest on first sight.
+
+    rev counts the updates, so balance snapshots can be ordered.
+    """
+    return {
+        "$inc": {"owed_cents": owed_cents, "paid_cents": paid_cents, "rev": 1},
+        "$set": {"updated_at": now},
+        "$setOnInsert": {"guest_key": guest_key, "created_at": now}
+    }
+
+
+def history_query(history_filter: HistoryFilter, after: Optional[tuple] = None) -> dict:
+    query = dict(LIVE)
+    if history_filter.guest_key is not None:
+        # A prefix match is an anchored, case-sensitive regex over the already
+        # casefolded key, which Mongo answers with an index range scan
+        if history_filter.guest_prefix:
+            query["guest_key"] = {"$regex": "^" + re.escape(history_filter.guest_key)}
+        else:
+            query["guest_key"] = history_filter.guest_key
+    if history_filter.drink_id:
+        query["drink_id"] = history_filter.drink_id
+    if history_filter.start or history_filter.end:
+        date_query = {}
+        if history_filter.start:
+            date_query["$gte"] = history_filter.start
+        if history_filter.end:
+            date_query["$lte"] = history_filter.end
+        query["date"] = date_query
+
+    if after:
+        date, document_id = after
+        keyset = {"$or": [
+            {"date": {"$lt": date}},
+            {"date": date, "id": {"$lt": document_id}}
+        ]}
+        query = {"$and": [query, keyset]}
+    return query
+
+
+class MongoStore(Store):
+    """Collections in one MongoDB database.
+
+    Each worker process creates its own store after any fork, so workers
+    never share a connection pool.
+    """
+
+    name = "mongo"
+
+    def __init__(self, metrics):
+        super().__init__(metrics)
+        self.client = AsyncIOMotorClient(
+            MONGO_URL,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            event_listeners=[CommandMetricsListener(metrics)],
+        )
+        self.db = self.client[MONGO_DB_NAME]
+        self.drinks = self.db.drinks
+        self.transactions = self.db.transactions
+        self.payments = self.db.payments
+        # Materialized per-guest running totals, kept in step by the write routes
+        self.guests = self.db.guests
+        # Version counters shared by all workers, e.g. {"_id": "drinks", "version": 3}
+        self.meta = self.db.meta
+        # Capped collection every worker tails to fan change events out to SSE clients
+        self.events = self.db.events
+        # Pours and revenue per hour and per day, drink and guest
+        self.rollups = self.db.sales_rollups
+
+    def close(self):
+        self.client.close()
+
+    async def ensure_collection(self, name: str, **options):
+        """Create a collection with options if no worker has yet"""
+        if await self.db.list_collection_names(filter={"name": name}):
+            return
+        try:
+            await self.db.create_collection(name, **options)
+        except (CollectionInvalid, OperationFailure):
+            # Another worker created it first
+            pass
+
+    async def ensure_schema(self) -> dict:
+        """Create any missing indexes and return the indexes present per collection.
+
+        create_index is a no-op for indexes that already exist, so this is safe
+        to run on every startup.
+        """
+        # Capped and compressed collections have to exist before an index
+        # would create them with the defaults
+        await self.ensure_collection("events", capped=True, size=EVENTS_CAPPED_BYTES)
+        for archive in ARCHIVES.values():
+            await self.ensure_collection(archive, **ARCHIVE_OPTIONS)
+
+        for collection_name, indexes in INDEXES.items():
+            for keys, options in indexes:
+                try:
+                    await self.db[collection_name].create_index(keys, **options)
+                except OperationFailure as exc:
+                    logger.error("Could not create index %s on %s: %s", keys, collection_name, exc)
+
+        report = {}
+        for collection_name in INDEXES:
+            index_info = await self.db[collection_name].index_information()
+            report[collection_name] = sorted(index_info)
+        return report
+
+    async def drop_all(self):
+        for collection_name in await self.db.list_collection_names():
+            await self.db.drop_collection(collection_name)
+
+    # Version counters
+    async def get_version(self, name: str) -> int:
+        doc = await self.meta.find_one({"_id": name})
+        return doc["version"] if doc else 0
+
+    async def bump_version(self, name: str, amount: int = 1) -> int:
+        doc = await self.meta.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"version": amount}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["version"]
+
+    async def get_versions(self, names) -> dict:
+        """Read several counters in one round trip"""
+        versions = dict.fromkeys(names, 0)
+        async for doc in self.meta.find({"_id": {"$in": list(names)}}):
+            versions[doc["_id"]] = doc["version"]
+        return versions
+
+    async def bump_versions(self, names):
+        """Increment several counters in one round trip"""
+        await self.meta.bulk_write(
+            [UpdateOne({"_id": name}, {"$inc": {"version": 1}}, upsert=True) for name in names],
+            ordered=False
+        )
+
+    # Drinks
+    async def list_drinks(self) -> List[dict]:
+        return await self.drinks.find(LIVE, {"_id": 0}).to_list(None)
+
+    async def find_drink(self, drink_id: str) -> Optional[dict]:
+        return await self.find("drinks", drink_id)
+
+    async def insert_drink(self, document: dict):
+        await self.drinks.insert_one({**document})
+
+    async def update_drink(self, drink_id: str, fields: dict) -> Optional[dict]:
+        return await self.drinks.find_one_and_update(
+            {"id": drink_id, **LIVE},
+            {"$set": fields},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def delete_drink(self, drink_id: str, now: datetime) -> bool:
+        return await self.delete("drinks", drink_id, now) is not None
+
+    async def drinks_without_cents(self) -> List[dict]:
+        return await self.drinks.find({"price_cents": {"$exists": False}}, {"_id": 0}).to_list(None)
+
+    # Transactions and payments
+    async def insert(self, kind: str, document: dict):
+        try:
+            # insert_one adds _id to the document it is given
+            await self.db[kind].insert_one({**document})
+        except DuplicateKeyError as exc:
+            raise DuplicateIdError(document["id"]) from exc
+
+    async def insert_many(self, kind: str, documents: List[dict]) -> dict:
+        errors = {}
+        try:
+            await self.db[kind].insert_many([{**document} for document in documents], ordered=False)
+        except BulkWriteError as exc:
+            for write_error in exc.details.get("writeErrors", []):
+                # id is the only unique index on the collections inserted into
+                duplicate = write_error.get("code") == 11000
+                errors[write_error["index"]] = DUPLICATE_ID if duplicate else write_error.get("errmsg", "Insert failed")
+        return errors
+
+    async def find(self, kind: str, document_id: str, include_deleted: bool = False) -> Optional[dict]:
+        query = {"id": document_id} if include_deleted else {"id": document_id, **LIVE}
+        return await self.db[kind].find_one(query, {"_id": 0})
+
+    async def delete(self, kind: str, document_id: str, now: datetime) -> Optional[dict]:
+        return await self.db[kind].find_one_and_update(
+            {"id": document_id, **LIVE, **APPLIED},
+            {"$set": {"deleted_at": now}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def claim_pending(self, kind: str, document_ids: List[str], now: datetime, until: datetime) -> tuple:
+        claimed = []
+        for document_id in document_ids:
+            document = await self.db[kind].find_one_and_update(
+                {"id": document_id, **PENDING, "pending_until": {"$lte": now}},
+                {"$set": {"pending_until": until}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.BEFORE
+            )
+            if document:
+                claimed.append({**document, "pending_until": until})
+        leased = {document["id"] for document in claimed}
+        others = [document_id for document_id in document_ids if document_id not in leased]
+        held = await self.db[kind].distinct("id", {"id": {"$in": others}, **PENDING}) if others else []
+        return claimed, held
+
+    async def clear_pending(self, kind: str, document_ids: List[str]):
+        await self.db[kind].update_many(
+            {"id": {"$in": document_ids}}, {"$unset": {"pending": "", "pending_until": ""}}
+        )
+
+    async def release_pending(self, kind: str, document_ids: List[str], now: datetime, step: str):
+        await self.db[kind].update_many(
+            {"id": {"$in": document_ids}, **PENDING}, {"$set": {"pending": step, "pending_until": now}}
+        )
+
+    async def expired_pending(self, kind: str, now: datetime) -> List[str]:
+        documents = self.db[kind].find({**PENDING, "pending_until": {"$lte": now}}, {"_id": 0, "id": 1})
+        return [document["id"] async for document in documents]
+
+    async def history_page(self, kind: str, history_filter: HistoryFilter, limit: Optional[int],
+                           after: Optional[tuple] = None, fields: Optional[tuple] = None) -> List[dict]:
+        projection = {"_id": 0}
+        if fields:
+            projection.update(dict.fromkeys(fields, 1))
+        documents = self.db[kind].find(history_query(history_filter, after), projection).sort(HISTORY_SORT)
+        if limit is not None:
+            documents = documents.limit(limit)
+        return await documents.to_list(None)
+
+    async def iter_history(self, kind: str, history_filter: HistoryFilter, batch_size: int) -> AsyncIterator[dict]:
+        cursor = self.db[kind].find(history_query(history_filter), {"_id": 0}).sort(HISTORY_SORT)
+        async for document in cursor.batch_size(batch_size):
+            yield document
+
+    async def sum_by_guest(self, kind: str, field: str, guest_name: Optional[str] = None) -> dict:
+        """Sum inside Mongo, so only the per-guest totals come back over the wire"""
+        # A pending document's amount is not in the ledger yet
+        match = {**LIVE, **APPLIED}
+        if guest_name:
+            match["guest_name"] = guest_name
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": "$guest_name", "total": {"$sum": f"${field}"}}}
+        ]
+        return {row["_id"]: row["total"] async for row in self.db[kind].aggregate(pipeline)}
+
+    async def backfill_guest_keys(self, kind: str, normalize, batch_size: int = 1000) -> int:
+        collection = self.db[kind]
+        updated = 0
+        batch = []
+        async for document in collection.find({"guest_key": {"$exists": False}}, {"_id": 1, "guest_name": 1}):
+            batch.append(UpdateOne(
+                {"_id": document["_id"]},
+                {"$set": {"guest_key": normalize(document["guest_name"])}}
+            ))
+            if len(batch) >= batch_size:
+                await collection.bulk_write(batch, ordered=False)
+                updated += len(batch)
+                batch = []
+        if batch:
+            await collection.bulk_write(batch, ordered=False)
+            updated += len(batch)
+        return updated
+
+    async def store_cents(self, kind: str, dollars: str, cents: str) -> int:
+        # Stored dollar amounts are already rounded to cents, so the conversion
+        # runs inside Mongo (4.2+ for pipeline updates and $round)
+        result = await self.db[kind].update_many(
+            {cents: {"$exists": False}},
+            [{"$set": {cents: {"$toLong": {"$round": [{"$multiply": [f"${dollars}", 100]}, 0]}}}}]
+        )
+        return result.modified_count
+
+    async def move_to_archive(self, kind: str, query: dict, field: str, totals: dict) -> int:
+        """Copy matching documents into the archive, then delete them, a batch at a time.
+
+        A copy interrupted before its delete is finished by the next run: the
+        archive's unique id index drops the second copy.
+        """
+        archive = self.db[ARCHIVES[kind]]
+        moved = 0
+        while True:
+            batch = await self.db[kind].find(query).limit(ARCHIVE_BATCH_SIZE).to_list(None)
+            if not batch:
+                return moved
+            try:
+                await archive.insert_many([{**document} for document in batch], ordered=False)
+            except BulkWriteError as exc:
+                if any(error.get("code") != 11000 for error in exc.details.get("writeErrors", [])):
+                    raise
+            await self.db[kind].delete_many({"_id": {"$in": [document["_id"] for document in batch]}})
+            for document in batch:
+                if "deleted_at" not in document:
+                    totals[document["guest_name"]] = totals.get(document["guest_name"], 0) + document.get(field, 0)
+            moved += len(batch)
+
+    async def archive(self, kind: str, guest_names: List[str], before: datetime, field: str) -> tuple:
+        totals = {}
+        moved = await self.move_to_archive(kind, {"deleted_at": {"$lt": before}}, field, totals)
+        for offset in range(0, len(guest_names), ARCHIVE_BATCH_SIZE):
+            moved += await self.move_to_archive(kind, {
+                "guest_name": {"$in": guest_names[offset:offset + ARCHIVE_BATCH_SIZE]},
+                **APPLIED,
+                # Documents written while the job runs stay, and so does their ledger entry
+                "$or": [{"created_at": {"$lt": before}}, {"created_at": {"$exists": False}}]
+            }, field, totals)
+        return moved, totals
+
+    # Guest balance ledger
+    async def adjust_guest(self, guest_name: str, guest_key: str, owed_cents: int, paid_cents: int,
+                           now: datetime) -> Optional[dict]:
+        return await self.guests.find_one_and_update(
+            {"guest_name": guest_name},
+            guest_ledger_update(guest_key, owed_cents, paid_cents, now),
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def adjust_guests(self, adjustments: List[tuple], now: datetime) -> tuple:
+        """One bulk write for all the adjustments, then one read of the guests touched"""
+        guest_names = [guest_name for guest_name, *_ in adjustments]
+        result = await self.guests.bulk_write([
+            UpdateOne(
+                {"guest_name": guest_name},
+                guest_ledger_update(guest_key, owed_cents, paid_cents, now),
+                upsert=True
+            )
+            for guest_name, guest_key, owed_cents, paid_cents in adjustments
+        ], ordered=False)
+        created = [guest_names[index] for index in result.upserted_ids]
+
+        guests = await self.guests.find({"guest_name": {"$in": guest_names}}, {"_id": 0}).to_list(None)
+        return created, guests
+
+    async def list_guests(self) -> List[dict]:
+        projection = {"_id": 0, "guest_name": 1, "owed_cents": 1, "paid_cents": 1, "rev": 1}
+        return await self.guests.find({}, projection).to_list(None)
+
+    async def find_guests(self, guest_names: List[str]) -> List[dict]:
+        projection = {"_id": 0, "guest_name": 1, "owed_cents": 1, "paid_cents": 1, "rev": 1}
+        return await self.guests.find({"guest_name": {"$in": guest_names}}, projection).to_list(None)
+
+    async def replace_guests(self, documents: List[dict]):
+        await self.guests.delete_many({})
+        if documents:
+            await self.guests.insert_many(documents)
+
+    async def guests_created_since(self, since: Optional[datetime]) -> List[dict]:
+        query = {"created_at": {"$gte": since}} if since else {}
+        projection = {"_id": 0, "guest_name": 1, "guest_key": 1, "created_at": 1}
+        return await self.guests.find(query, projection).to_list(None)
+
+    async def settled_guests(self, before: datetime) -> List[str]:
+        query = {"$expr": {"$eq": ["$owed_cents", "$paid_cents"]}, "updated_at": {"$lt": before}}
+        return [guest["guest_name"] async for guest in self.guests.find(query, {"_id": 0, "guest_name": 1})]
+
+    async def remove_empty_guests(self, guest_names: List[str]) -> int:
+        # The zero totals are part of the filter, so a guest a concurrent write
+        # just charged keeps its ledger document
+        result = await self.guests.delete_many({"guest_name": {"$in": guest_names}, "owed_cents": 0, "paid_cents": 0})
+        return result.deleted_count
+
+    # Sales rollups
+    async def adjust_rollups(self, deltas: dict):
+        await self.rollups.bulk_write([
+            UpdateOne(
+                {"granularity": granularity, "start": start, "drink_id": drink_id, "guest_name": guest_name},
+                {"$inc": {"pours": pours, "revenue_cents": revenue_cents}},
+                upsert=True
+            )
+            for (granularity, start, drink_id, guest_name), (pours, revenue_cents) in deltas.items()
+        ], ordered=False)
+
+    async def rebuild_rollups(self, granularities: tuple, batch_size: int = 1000) -> int:
+        """Recount the rollups from live transactions, archived ones included.
+
+        A bucket can have transactions in both collections, so the second
+        collection's counts are added with upserts rather than inserted.
+        """
+        await self.rollups.delete_many({})
+        written = 0
+        for granularity in granularities:
+            parts = {"year": {"$year": "$date"}, "month": {"$month": "$date"}, "day": {"$dayOfMonth": "$date"}}
+            if granularity == "hour":
+                parts["hour"] = {"$hour": "$date"}
+            pipeline = [
+                {"$match": {**LIVE, "pending": {"$ne": "rollups"}}},
+                {"$group": {
+                    "_id": {"start": {"$dateFromParts": parts}, "drink_id": "$drink_id", "guest_name": "$guest_name"},
+                    "pours": {"$sum": 1},
+                    "revenue_cents": {"$sum": "$price_cents"}
+                }}
+            ]
+
+            for collection in (self.transactions, self.db[ARCHIVES["transactions"]]):
+                batch = []
+                async for row in collection.aggregate(pipeline, allowDiskUse=True):
+                    batch.append(UpdateOne(
+                        {"granularity": granularity, **row["_id"]},
+                        {"$inc": {"pours": row["pours"], "revenue_cents": row["revenue_cents"]}},
+                        upsert=True
+                    ))
+                    if len(batch) >= batch_size:
+                        written += (await self.rollups.bulk_write(batch, ordered=False)).upserted_count
+                        batch = []
+                if batch:
+                    written += (await self.rollups.bulk_write(batch, ordered=False)).upserted_count
+        return written
+
+    async def sales_report(self, granularity: str, interval: str, group_by: Optional[str],
+                           start: Optional[datetime], end: Optional[datetime],
+                           drink_id: Optional[str], guest_name: Optional[str]) -> List[dict]:
+        match = {"granularity": granularity}
+        if start or end:
+            match["start"] = {}
+            if start:
+                match["start"]["$gte"] = start
+            if end:
+                match["start"]["$lte"] = end
+        if drink_id:
+            match["drink_id"] = drink_id
+        if guest_name:
+            match["guest_name"] = guest_name
+
+        group_id = {}
+        if interval == granularity:
+            group_id["start"] = "$start"
+        elif interval == "day":
+            group_id["start"] = {"$dateFromParts": {
+                "year": {"$year": "$start"}, "month": {"$month": "$start"}, "day": {"$dayOfMonth": "$start"}
+            }}
+        if group_by == "drink":
+            group_id["drink_id"] = "$drink_id"
+        elif group_by == "guest":
+            group_id["guest_name"] = "$guest_name"
+
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": group_id or None, "pours": {"$sum": "$pours"}, "revenue_cents": {"$sum": "$revenue_cents"}}},
+            # Buckets whose transactions were all deleted remain with zero pours
+            {"$match": {"pours": {"$ne": 0}}},
+            {"$sort": {"_id.start": 1, "revenue_cents": -1}}
+        ]
+        return [
+            {**(row["_id"] or {}), "pours": row["pours"], "revenue_cents": row["revenue_cents"]}
+            async for row in self.rollups.aggregate(pipeline)
+        ]
+
+    # Change events
+    async def append_events(self, events: List[dict]):
+        last_seq = await self.bump_version("events", len(events))
+        first_seq = last_seq - len(events) + 1
+        await self.events.insert_many([{**event, "seq": first_seq + offset} for offset, event in enumerate(events)])
+
+    async def latest_event_seq(self) -> int:
+        latest = await self.events.find_one({}, sort=[("$natural", DESCENDING)])
+        return latest["seq"] if latest else 0
+
+    # A seq is taken from the meta counter before its event is inserted, so
+    # workers can store events out of seq order. The capped collection keeps
+    # them in the order they were stored, and readers resume after the event
+    # they saw last in that order rather than after a seq.
+    async def events_from(self, seq: int, cursor_type: int) -> AsyncIterator[dict]:
+        if seq and await self.events.find_one({"seq": seq}, {"_id": 1}):
+            query, found = {}, False
+        else:
+            # Nothing seen yet, or an event since dropped from the collection
+            query, found = {"seq": {"$gt": seq}}, True
+        cursor = self.events.find(query, {"_id": 0}, cursor_type=cursor_type).sort("$natural", ASCENDING)
+        while cursor.alive:
+            async for event in cursor:
+                if found:
+                    yield event
+                else:
+                    found = event["seq"] == seq
+
+    async def events_after(self, seq: int) -> AsyncIterator[dict]:
+        # Whatever is still in the capped collection
+        async for event in self.events_from(seq, CursorType.NON_TAILABLE):
+            yield event
+
+    async def tail_events(self, seq: int) -> AsyncIterator[dict]:
+        # A tailable cursor dies at once on an empty collection; the caller retries
+        async for event in self.events_from(seq, CursorType.TAILABLE_AWAIT):
+            yield event
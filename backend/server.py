@@ -1,16 +1,33 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Path, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List, Optional
-from pymongo import MongoClient
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import AsyncIterator, List, Optional
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
 import uuid
-from datetime import datetime
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+import asyncio
+import base64
+import bisect
+import codecs
+import contextvars
 import csv
 import io
+import json
+import logging
 import os
+import threading
+import time
+import zlib
+
+from journal import Journal, Segment
+from storage import ARCHIVES, DUPLICATE_ID, DuplicateIdError, HistoryFilter, Store, open_store
 
 app = FastAPI(title="BarTab API", version="1.0.0")
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger("bartab")
 
 # CORS configuration
 app.add_middleware(
@@ -19,15 +36,203 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
+)
+
+# Metrics: per-route latency and database work, exported at /metrics.
+# Under gunicorn PROMETHEUS_MULTIPROC_DIR is set and every worker writes its
+# samples there, so /metrics on any worker reports the whole server.
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '1.0'))
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', '0.5'))
+
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 1000, 10000, 100000, 1000000)
+
+REQUEST_LATENCY = Histogram(
+    "bartab_http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+REQUEST_DB_COMMANDS = Histogram(
+    "bartab_http_request_db_commands", "Database commands (round trips) per HTTP request",
+    ["method", "route"], buckets=COUNT_BUCKETS
+)
+REQUEST_DB_DOCUMENTS = Histogram(
+    "bartab_http_request_db_documents", "Documents returned by the database per HTTP request",
+    ["method", "route"], buckets=COUNT_BUCKETS
+)
+# Server-Sent Events streams stay open for as long as the client is connected,
+# so their duration is kept out of the request latency
+STREAM_DURATION = Histogram(
+    "bartab_http_stream_duration_seconds", "How long event streams stayed open", ["route"],
+    buckets=(1, 10, 60, 300, 1800, 3600, 14400, 86400)
+)
+DB_COMMAND_LATENCY = Histogram(
+    "bartab_db_command_duration_seconds", "Database command latency", ["command", "collection"]
+)
+DB_DOCUMENTS = Counter(
+    "bartab_db_documents_returned_total", "Documents returned by database commands", ["command", "collection"]
+)
+DB_COMMAND_FAILURES = Counter(
+    "bartab_db_command_failures_total", "Failed database commands", ["command", "collection"]
 )
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
-client = MongoClient(MONGO_URL)
-db = client.bartab
-drinks_collection = db.drinks
-transactions_collection = db.transactions
-payments_collection = db.payments
+class RequestStats:
+    """Database work done on behalf of one HTTP request.
+
+    Motor runs commands on executor threads with a copy of the request's
+    context, so the store's metrics find this object through current_request_stats.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = 0
+        self.documents = 0
+
+    def add(self, documents: int):
+        with self.lock:
+            self.commands += 1
+            self.documents += documents
+
+current_request_stats = contextvars.ContextVar("current_request_stats", default=None)
+
+class CommandMetrics:
+    """Time every database command, count the documents it returns and log slow ones.
+
+    Stores report each command they run here (the Mongo store through a
+    pymongo CommandListener).
+    """
+
+    def succeeded(self, command: str, collection: str, seconds: float, documents: int):
+        DB_COMMAND_LATENCY.labels(command, collection).observe(seconds)
+        if documents:
+            DB_DOCUMENTS.labels(command, collection).inc(documents)
+        stats = current_request_stats.get()
+        if stats:
+            stats.add(documents)
+        if seconds >= SLOW_QUERY_SECONDS:
+            logger.warning("Slow database command %s on %s: %.3fs, %d documents",
+                           command, collection, seconds, documents)
+
+    def failed(self, command: str, collection: str):
+        DB_COMMAND_FAILURES.labels(command, collection).inc()
+        stats = current_request_stats.get()
+        if stats:
+            stats.add(0)
+
+command_metrics = CommandMetrics()
+
+class MetricsMiddleware:
+    """Record latency and database work per route, logging requests slower than SLOW_REQUEST_SECONDS.
+
+    Event streams only record how long they stayed open.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status = 500
+        streaming = False
+        
+        async def send_with_status(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+        
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request_stats.reset(token)
+            # Label by route template, not the raw path, to keep label values bounded
+            route = scope.get("route")
+            route_path = route.path if route else "unmatched"
+            method = scope["method"]
+            if streaming:
+                STREAM_DURATION.labels(route_path).observe(elapsed)
+            else:
+                REQUEST_LATENCY.labels(method, route_path, str(status)).observe(elapsed)
+                REQUEST_DB_COMMANDS.labels(method, route_path).observe(stats.commands)
+                REQUEST_DB_DOCUMENTS.labels(method, route_path).observe(stats.documents)
+                if elapsed >= SLOW_REQUEST_SECONDS:
+                    logger.warning("Slow request %s %s: %.3fs, status %d, %d database commands, %d documents",
+                                   method, scope["path"], elapsed, status, stats.commands, stats.documents)
+
+app.add_middleware(MetricsMiddleware)
+
+# Storage: MongoDB by default, or an embedded SQLite file (STORAGE_BACKEND, see storage.py).
+# The store is opened per worker process by connect_storage, after any fork,
+# so workers never share a connection pool
+store: Optional[Store] = None
+
+def connect_storage():
+    """Open this process's store"""
+    global store
+    if store is None:
+        store = open_store(command_metrics)
+
+def close_storage():
+    global store
+    if store is not None:
+        store.close()
+        store = None
+
+DRINK_CATALOG_REFRESH_SECONDS = float(os.environ.get('DRINK_CATALOG_REFRESH_SECONDS', '1.0'))
+GUEST_DIRECTORY_REFRESH_SECONDS = float(os.environ.get('GUEST_DIRECTORY_REFRESH_SECONDS', '1.0'))
+SSE_HEARTBEAT_SECONDS = 15
+# Write-behind mode for POST /api/transactions, on when a journal directory is set
+WRITE_BEHIND_DIR = os.environ.get('WRITE_BEHIND_DIR', '')
+WRITE_BEHIND_FLUSH_SECONDS = float(os.environ.get('WRITE_BEHIND_FLUSH_SECONDS', '0.5'))
+WRITE_BEHIND_BATCH_SIZE = 1000
+
+async def ensure_indexes() -> dict:
+    """Create any missing tables and indexes and return the indexes present per collection.
+
+    Safe to run on every startup.
+    """
+    return await store.ensure_schema()
+
+@app.on_event("startup")
+async def open_store_connection():
+    connect_storage()
+
+@app.on_event("startup")
+async def create_indexes():
+    report = await ensure_indexes()
+    for collection_name, index_names in report.items():
+        logger.info("Indexes on %s: %s", collection_name, ", ".join(index_names))
+
+@app.on_event("startup")
+async def start_event_broker():
+    event_broker.start()
+
+@app.on_event("startup")
+async def start_write_behind():
+    if write_behind:
+        await write_behind.start()
+
+@app.on_event("shutdown")
+async def stop_event_broker():
+    await event_broker.stop()
+
+@app.on_event("shutdown")
+async def stop_write_behind():
+    if write_behind:
+        await write_behind.stop()
+
+@app.on_event("shutdown")
+async def close_store_connection():
+    close_storage()
 
 # Pydantic models
 class DrinkBase(BaseModel):
@@ -44,6 +249,9 @@ class DrinkCreate(DrinkBase):
 
 class Drink(DrinkBase):
     id: str
+    calculated_price: float
+    price_cents: int
+    breakdown: dict
     created_at: datetime
 
 class TransactionBase(BaseModel):
@@ -57,8 +265,24 @@ class TransactionCreate(TransactionBase):
 class Transaction(TransactionBase):
     id: str
     calculated_price: float
+    price_cents: int
     created_at: datetime
 
+MAX_BATCH_SIZE = 500
+
+class TransactionBatchRequest(BaseModel):
+    items: List[TransactionCreate] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class TransactionBatchResult(BaseModel):
+    index: int
+    transaction: Optional[Transaction] = None
+    error: Optional[str] = None
+
+class TransactionBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[TransactionBatchResult]
+
 class PaymentBase(BaseModel):
     guest_name: str
     amount: float
@@ -70,6 +294,7 @@ class PaymentCreate(PaymentBase):
 
 class Payment(PaymentBase):
     id: str
+    amount_cents: int
     created_at: datetime
 
 class GuestBalance(BaseModel):
@@ -77,6 +302,35 @@ class GuestBalance(BaseModel):
     total_owed: float
     total_paid: float
     balance: float
+    rev: int = 0  # Ledger revision; a higher rev is a newer balance
+
+class GuestSettleRequest(BaseModel):
+    guest_names: Optional[List[str]] = Field(None, min_length=1, max_length=MAX_BATCH_SIZE)
+    all_with_balance: bool = False
+    notes: str = "Settled up"
+
+class GuestSettleResponse(BaseModel):
+    settled: int
+    amount: float
+    payments: List[Payment]
+    balances: List[GuestBalance]
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+
+class SalesReportRow(BaseModel):
+    start: Optional[datetime] = None
+    drink_id: Optional[str] = None
+    guest_name: Optional[str] = None
+    pours: int
+    revenue_cents: int
+    revenue: float
 
 class PriceCalculationRequest(BaseModel):
     drink_id: str
@@ -85,32 +339,977 @@ class PriceCalculationResponse(BaseModel):
     calculated_price: float
     breakdown: dict
 
+# List responses: documents are validated by the models when they are written,
+# so list routes read only the response model's fields and hand
+# them to orjson as-is instead of building and re-validating a model per row
+class RowShape:
+    """Fields and defaults that shape stored documents like a response model"""
+
+    def __init__(self, model):
+        self.fields = tuple(model.model_fields)
+        self.defaults = {
+            name: field.default
+            for name, field in model.model_fields.items()
+            if not field.is_required()
+        }
+
+    def rows(self, documents: List[dict]) -> List[dict]:
+        # Fill defaults for fields older documents were written without
+        if not self.defaults:
+            return documents
+        return [{**self.defaults, **document} for document in documents]
+
+DRINK_ROWS = RowShape(Drink)
+TRANSACTION_ROWS = RowShape(Transaction)
+PAYMENT_ROWS = RowShape(Payment)
+
+def json_rows(response: Response, rows: list) -> ORJSONResponse:
+    """Serialize pre-shaped rows, keeping headers set on the injected response"""
+    return ORJSONResponse(rows, headers=dict(response.headers))
+
 # Utility functions
-def convert_ml_to_oz(ml: float) -> float:
-    return ml / 29.5735
+ML_PER_OZ = Decimal("29.5735")
+
+# Money is stored and summed as integer cents; dollar floats are only derived
+# from cents for display and for API compatibility
+def to_cents(amount) -> int:
+    """Round a dollar amount to whole cents, halves rounding away from zero"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_cents(cents: int) -> float:
+    return cents / 100
 
-def convert_oz_to_ml(oz: float) -> float:
-    return oz * 29.5735
+def round_decimal(value: Decimal, places: int) -> float:
+    return float(value.quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP))
 
-def calculate_drink_price(drink: dict) -> float:
-    """Calculate price based on the predefined drink settings"""
+def normalize_guest_key(guest_name: str) -> str:
+    """Case- and whitespace-insensitive key used to search guests"""
+    return " ".join(guest_name.split()).casefold()
+
+def calculate_drink_breakdown(drink: dict) -> dict:
+    """Itemize how a drink's price is built up from the predefined drink settings"""
+    
+    # Work in exact decimals so the price only rounds once, to whole cents
+    base_cost, mixer_cost, flat_cost = (
+        Decimal(str(drink[field])) for field in ("base_cost", "mixer_cost", "flat_cost")
+    )
     
     # Convert volumes to same unit (ml) for calculation
-    drink_volume_ml = drink["total_volume"]
+    drink_volume_ml = Decimal(str(drink["total_volume"]))
     if drink["volume_unit"] == "oz":
-        drink_volume_ml = convert_oz_to_ml(drink["total_volume"])
+        drink_volume_ml *= ML_PER_OZ
     
     # Volume served is stored in oz, convert to ml
-    volume_served_ml = convert_oz_to_ml(drink["volume_served"])
+    volume_served_ml = Decimal(str(drink["volume_served"])) * ML_PER_OZ
     
     # Calculate price per ml
-    price_per_ml = drink["base_cost"] / drink_volume_ml
+    price_per_ml = base_cost / drink_volume_ml
     
     # Calculate total price
     alcohol_cost = price_per_ml * volume_served_ml
-    total_price = alcohol_cost + drink["mixer_cost"] + drink["flat_cost"]
+    price_cents = to_cents(alcohol_cost + mixer_cost + flat_cost)
+    
+    return {
+        "base_cost": drink["base_cost"],
+        "total_volume": drink["total_volume"],
+        "volume_unit": drink["volume_unit"],
+        "volume_served": drink["volume_served"],
+        "price_per_ml": round_decimal(price_per_ml, 4),
+        "alcohol_cost": round_decimal(alcohol_cost, 2),
+        "mixer_cost": drink["mixer_cost"],
+        "flat_cost": drink["flat_cost"],
+        "total_price": from_cents(price_cents),
+        "price_cents": price_cents
+    }
+
+def drink_price_fields(drink: dict) -> dict:
+    """Price and breakdown stored on the drink document when it is written"""
+    breakdown = calculate_drink_breakdown(drink)
+    return {
+        "calculated_price": breakdown["total_price"],
+        "price_cents": breakdown["price_cents"],
+        "breakdown": breakdown
+    }
+
+def with_drink_price(drink: dict) -> dict:
+    """Fill in the price of a drink written before prices were stored"""
+    if "price_cents" in drink and "breakdown" in drink:
+        return drink
+    return {**drink, **drink_price_fields(drink)}
+
+# Documents written by the create routes and by bulk import
+def new_drink_document(drink: DrinkCreate, now: datetime) -> dict:
+    document = {"id": str(uuid.uuid4()), **drink.model_dump(), "created_at": now}
+    document.update(drink_price_fields(document))
+    return document
+
+def new_transaction_document(transaction: TransactionCreate, entry: dict, now: datetime,
+                             document_id: Optional[str] = None) -> dict:
+    """Transaction document priced from a drink catalog entry"""
+    return {
+        "id": document_id or str(uuid.uuid4()),
+        "guest_name": transaction.guest_name,
+        "guest_key": normalize_guest_key(transaction.guest_name),
+        "drink_id": transaction.drink_id,
+        "calculated_price": entry["calculated_price"],
+        "price_cents": entry["price_cents"],
+        "date": transaction.date or now,
+        "created_at": now
+    }
+
+def new_payment_document(payment: PaymentCreate, now: datetime, document_id: Optional[str] = None) -> dict:
+    amount_cents = to_cents(payment.amount)
+    return {
+        "id": document_id or str(uuid.uuid4()),
+        "guest_name": payment.guest_name,
+        "guest_key": normalize_guest_key(payment.guest_name),
+        "amount": from_cents(amount_cents),
+        "amount_cents": amount_cents,
+        "date": payment.date or now,
+        "notes": payment.notes,
+        "created_at": now
+    }
+
+# Creates sent with an Idempotency-Key get an id derived from the key, so a
+# retry collides with the unique id index instead of writing a duplicate
+IDEMPOTENCY_NAMESPACE = uuid.UUID("f9947be8-f2c6-4c23-a43a-202b1f6e1fda")
+IDEMPOTENCY_KEY_HEADER = Header(None, max_length=200)
+
+def idempotent_id(kind: str, idempotency_key: Optional[str]) -> Optional[str]:
+    if not idempotency_key:
+        return None
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, f"{kind}:{idempotency_key}"))
+
+# Fields a retry must repeat for the earlier request's document to answer it
+REPLAY_FIELDS = {"transactions": ("guest_name", "drink_id"), "payments": ("guest_name", "amount_cents")}
+
+def check_replayed(kind: str, existing: Optional[dict], document: dict):
+    if not existing or any(existing.get(field) != document[field] for field in REPLAY_FIELDS[kind]):
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+async def find_replayed(kind: str, document: dict) -> dict:
+    """Return the document an earlier request with the same Idempotency-Key created.
+
+    If that request stored it without applying all its side effects, they
+    are applied here before the document is returned.
+    """
+    existing = await store.find(kind, document["id"], include_deleted=True)
+    check_replayed(kind, existing, document)
+    if "deleted_at" in existing:
+        raise HTTPException(status_code=410, detail="Already created with this Idempotency-Key and since deleted")
+    if "pending" in existing:
+        _, held = await finish_pending(kind, [existing["id"]])
+        if held:
+            raise HTTPException(
+                status_code=409, detail="The request with this Idempotency-Key is still being recorded",
+                headers={"Retry-After": "1"}
+            )
+    return existing
+
+def balance_snapshot(guest: dict) -> dict:
+    """Shape a ledger document (or cent totals) as a GuestBalance"""
+    return {
+        "guest_name": guest["guest_name"],
+        "total_owed": from_cents(guest["owed_cents"]),
+        "total_paid": from_cents(guest["paid_cents"]),
+        "balance": from_cents(guest["owed_cents"] - guest["paid_cents"]),
+        "rev": guest.get("rev", 0)
+    }
+
+async def apply_guest_balance_delta(guest_name: str, owed_cents: int = 0, paid_cents: int = 0) -> dict:
+    """Atomically adjust a guest's running totals and return the new balance"""
+    before = await store.adjust_guest(
+        guest_name, normalize_guest_key(guest_name), owed_cents, paid_cents, datetime.now()
+    )
+    if before is None:
+        await guests_added([guest_name])
+        before = {"owed_cents": 0, "paid_cents": 0}
+    return balance_snapshot({
+        "guest_name": guest_name,
+        "owed_cents": before["owed_cents"] + owed_cents,
+        "paid_cents": before["paid_cents"] + paid_cents,
+        "rev": before.get("rev", 0) + 1
+    })
+
+async def apply_guest_balance_deltas(deltas: dict) -> List[dict]:
+    """Apply {guest_name: (owed_cents, paid_cents)} adjustments to the ledger in one bulk write.
+
+    Returns the updated balances of the guests touched.
+    """
+    if not deltas:
+        return []
+    created, guests = await store.adjust_guests([
+        (guest_name, normalize_guest_key(guest_name), owed_cents, paid_cents)
+        for guest_name, (owed_cents, paid_cents) in deltas.items()
+    ], datetime.now())
+    if created:
+        await guests_added(created)
+    return [balance_snapshot(guest) for guest in guests]
+
+# Side effects of storing a transaction or payment, applied in this order
+# after the insert. Until all are applied the document is marked pending, and
+# pending_until leases it to the request applying them; a step that fails
+# records itself in pending and ends the lease, so a retry with the same
+# Idempotency-Key, the journal flush or `manage.py apply-pending` takes the
+# document over and finishes it from that step instead of the amount never
+# reaching the balance
+PENDING_STEPS = {"transactions": ("rollups", "balance"), "payments": ("balance",)}
+PENDING_LEASE_SECONDS = 10.0
+PENDING_BATCH_SIZE = 1000
+
+def pending_documents(kind: str, documents: List[dict], now: datetime) -> List[dict]:
+    """Copies of new documents to insert, leased to the caller until their side effects are applied"""
+    until = now + timedelta(seconds=PENDING_LEASE_SECONDS)
+    return [{**document, "pending": PENDING_STEPS[kind][0], "pending_until": until} for document in documents]
+
+def ledger_adjustments(kind: str, documents: List[dict]) -> List[tuple]:
+    """(guest_name, guest_key, owed_cents, paid_cents) adding documents to their guests' totals"""
+    deltas = {}
+    for document in documents:
+        owed, paid = deltas.get(document["guest_name"], (0, 0))
+        if kind == "transactions":
+            deltas[document["guest_name"]] = (owed + document["price_cents"], paid)
+        else:
+            deltas[document["guest_name"]] = (owed, paid + document["amount_cents"])
+    return [
+        (guest_name, normalize_guest_key(guest_name), owed_cents, paid_cents)
+        for guest_name, (owed_cents, paid_cents) in deltas.items()
+    ]
+
+async def apply_pending_steps(kind: str, documents: List[dict], step: str) -> List[dict]:
+    """Apply the side effects documents wait for, from step on, and clear their marker.
+
+    Returns the updated balances of the guests touched.
+    """
+    if not documents:
+        return []
+    steps = PENDING_STEPS[kind]
+    document_ids = [document["id"] for document in documents]
+    created, guests = [], []
+    for step in steps[steps.index(step):]:
+        try:
+            if step == "rollups":
+                await apply_sales_rollups(documents)
+            else:
+                created, guests = await store.adjust_guests(ledger_adjustments(kind, documents), datetime.now())
+        except Exception:
+            try:
+                await store.release_pending(kind, document_ids, datetime.now(), step)
+            except Exception:
+                logger.exception("Releasing %d pending %s failed; they are retried once the lease expires",
+                                 len(document_ids), kind)
+            raise
+    # Past this point the steps are applied: if clearing the marker fails, the
+    # lease is left to run out rather than handed to a retry at once
+    await store.clear_pending(kind, document_ids)
+    if created:
+        await guests_added(created)
+    return [balance_snapshot(guest) for guest in guests]
+
+async def finish_pending(kind: str, document_ids: List[str]) -> tuple:
+    """Take over and finish the documents among document_ids that an earlier attempt left pending.
+
+    Returns (the documents finished, ids of pending documents still leased to
+    another attempt).
+    """
+    now = datetime.now()
+    claimed, held = await store.claim_pending(
+        kind, document_ids, now, now + timedelta(seconds=PENDING_LEASE_SECONDS)
+    )
+    if not claimed:
+        return [], held
+    balances = []
+    for step in PENDING_STEPS[kind]:
+        waiting = [document for document in claimed if document["pending"] == step]
+        balances += await apply_pending_steps(kind, waiting, step)
+    await bump_versions(kind, "balances")
+    model, event_type = (Transaction, "transaction.created") if kind == "transactions" else (Payment, "payment.created")
+    await publish_events(
+        [(event_type, model(**document).model_dump(mode="json")) for document in claimed] + balance_events(balances)
+    )
+    return claimed, held
+
+async def apply_pending() -> dict:
+    """Finish the transactions and payments whose side effects were left unapplied, returning {kind: count}"""
+    finished = {}
+    for kind in PENDING_STEPS:
+        document_ids = await store.expired_pending(kind, datetime.now())
+        finished[kind] = 0
+        for offset in range(0, len(document_ids), PENDING_BATCH_SIZE):
+            claimed, _ = await finish_pending(kind, document_ids[offset:offset + PENDING_BATCH_SIZE])
+            finished[kind] += len(claimed)
+    return finished
+
+async def insert_transactions(documents: List[dict]) -> tuple:
+    """Insert many transactions with one unordered insert_many and apply their side effects.
+
+    Returns ({index: error message}, updated balances). Documents without an
+    error were written and counted towards their guest's balance.
+    """
+    errors = await store.insert_many("transactions", pending_documents("transactions", documents, datetime.now()))
+    inserted = [document for index, document in enumerate(documents) if index not in errors]
+    return errors, await apply_pending_steps("transactions", inserted, "rollups")
+
+async def insert_payments(documents: List[dict]) -> tuple:
+    """Insert many payments with one unordered insert_many and update the ledger.
+
+    Returns ({index: error message}, updated balances) like insert_transactions.
+    """
+    errors = await store.insert_many("payments", pending_documents("payments", documents, datetime.now()))
+    inserted = [document for index, document in enumerate(documents) if index not in errors]
+    return errors, await apply_pending_steps("payments", inserted, "balance")
+
+async def compute_guest_totals(guest_name: Optional[str] = None) -> dict:
+    """Recompute guest totals from transaction and payment history.
+
+    Both sums run concurrently and only the per-guest totals come back.
+    Pass guest_name to restrict the totals to a single guest.
+    """
+    owed, paid = await asyncio.gather(
+        store.sum_by_guest("transactions", "price_cents", guest_name),
+        store.sum_by_guest("payments", "amount_cents", guest_name)
+    )
+    return {
+        guest: {"owed_cents": owed.get(guest, 0), "paid_cents": paid.get(guest, 0)}
+        for guest in set(owed) | set(paid)
+    }
+
+async def backfill_guest_keys(kind: str) -> int:
+    """Store guest_key on transactions or payments written before guest keys existed"""
+    return await store.backfill_guest_keys(kind, normalize_guest_key)
+
+async def rebuild_guest_balances() -> int:
+    """Replace the balance ledger with totals recomputed from history.
+
+    Writes that land while the rebuild runs may be lost, so run it while the
+    bar is closed (or follow it with a verify).
+    """
+    totals = await compute_guest_totals()
+    # Keep revisions increasing, so clients take the rebuilt balances as newer
+    revs = {guest["guest_name"]: guest.get("rev", 0) for guest in await store.list_guests()}
+    now = datetime.now()
+    await store.replace_guests([
+        {
+            "guest_name": guest,
+            "guest_key": normalize_guest_key(guest),
+            **guest_totals,
+            "created_at": now,
+            "updated_at": now,
+            "rev": revs.get(guest, 0) + 1
+        }
+        for guest, guest_totals in totals.items()
+    ])
+    await bump_versions("guests", "balances")
+    return len(totals)
+
+async def verify_guest_balances() -> List[dict]:
+    """Compare the balance ledger against history and return any mismatches"""
+    expected = await compute_guest_totals()
+    actual = {doc["guest_name"]: doc for doc in await store.list_guests()}
+    mismatches = []
+    for guest in set(expected) | set(actual):
+        want = expected.get(guest, {"owed_cents": 0, "paid_cents": 0})
+        have = actual.get(guest, {"owed_cents": 0, "paid_cents": 0})
+        for field in ("owed_cents", "paid_cents"):
+            if want[field] != have.get(field, 0):
+                mismatches.append({
+                    "guest_name": guest,
+                    "field": field,
+                    "expected": want[field],
+                    "actual": have.get(field, 0)
+                })
+    return mismatches
+
+async def archive_history(days: int) -> dict:
+    """Move settled guests' history and old tombstones into the archive collections.
+
+    A guest is settled once their balance is zero and their ledger has not
+    changed for days. Their transactions and payments are archived, the
+    amounts moved are taken off the ledger (removing guests left with zero
+    totals), and tombstones older than days go too, so the hot collections
+    hold open tabs and recent history only. If the job is interrupted, run
+    rebuild-balances before relying on the ledger again.
+    """
+    before = datetime.now() - timedelta(days=days)
+    guest_names = await store.settled_guests(before)
+
+    moved = {}
+    deltas = {}
+    for kind, field in (("transactions", "price_cents"), ("payments", "amount_cents")):
+        moved[kind], totals = await store.archive(kind, guest_names, before, field)
+        for guest_name, cents in totals.items():
+            owed, paid = deltas.get(guest_name, (0, 0))
+            deltas[guest_name] = (owed - cents, paid) if kind == "transactions" else (owed, paid - cents)
+
+    balances = await apply_guest_balance_deltas(deltas)
+    moved["guests"] = await store.remove_empty_guests(guest_names)
+    await bump_versions("transactions", "payments", "guests", "balances")
+    await publish_events(balance_events(balances))
+    return moved
+
+# Sales rollups
+def to_utc_naive(value: datetime) -> datetime:
+    """Stores keep naive datetimes as UTC; convert aware ones the same way"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    """Start of the hour or day bucket containing a datetime"""
+    value = to_utc_naive(value).replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        value = value.replace(hour=0)
+    return value
+
+ROLLUP_GRANULARITIES = ("hour", "day")
+
+async def apply_sales_rollups(transactions: List[dict], sign: int = 1):
+    """Add (or with sign=-1 remove) transactions to the hourly and daily rollups"""
+    deltas = {}
+    for transaction in transactions:
+        for granularity in ROLLUP_GRANULARITIES:
+            key = (
+                granularity,
+                bucket_start(transaction["date"], granularity),
+                transaction["drink_id"],
+                transaction["guest_name"]
+            )
+            pours, revenue_cents = deltas.get(key, (0, 0))
+            deltas[key] = (pours + sign, revenue_cents + sign * transaction["price_cents"])
+    if deltas:
+        await store.adjust_rollups(deltas)
+
+async def rebuild_sales_rollups() -> int:
+    """Replace the sales rollups with ones recomputed from transaction history.
+
+    Like rebuild_guest_balances, run it while no transactions are being written.
+    """
+    written = await store.rebuild_rollups(ROLLUP_GRANULARITIES)
+    await bump_versions("transactions")
+    return written
+
+async def get_version(name: str) -> int:
+    """Read a shared version counter"""
+    return await store.get_version(name)
+
+async def bump_version(name: str, amount: int = 1) -> int:
+    """Increment a shared version counter, returning the new version"""
+    return await store.bump_version(name, amount)
+
+async def get_versions(names) -> dict:
+    """Read several shared version counters in one round trip"""
+    return await store.get_versions(names)
+
+async def bump_versions(*names):
+    """Increment several shared version counters in one round trip"""
+    await store.bump_versions(names)
+
+class VersionedCache(ABC):
+    """Per-worker in-memory copy of a collection, kept coherent across workers.
+
+    Writes bump the collection's shared version counter, and each worker
+    compares its copy against that version at most once per refresh interval,
+    calling reload() when it moved.
+    """
+
+    version_name = None
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self.checked_at = 0.0
+        self.reloads = 0
+        self.lock = asyncio.Lock()
+
+    @abstractmethod
+    async def reload(self):
+        """Bring the in-memory copy up to date with the store"""
+
+    def is_fresh(self) -> bool:
+        return self.version is not None and time.monotonic() - self.checked_at < self.refresh_interval
+
+    async def refresh(self):
+        if self.is_fresh():
+            return
+        async with self.lock:
+            if self.is_fresh():
+                return
+            # Read the version before the data so a concurrent write forces another reload
+            version = await get_version(self.version_name)
+            if version != self.version:
+                await self.reload()
+                self.version = version
+                self.reloads += 1
+            self.checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Force a reload on the next lookup"""
+        self.version = None
+
+    def stats(self) -> dict:
+        return {"reloads": self.reloads, "version": self.version}
+
+class DrinkCatalog(VersionedCache):
+    """In-memory copy of the drink menu with each drink's price precomputed.
+
+    The menu is small, so a version change reloads it whole.
+    """
+
+    version_name = "drinks"
+
+    def __init__(self, refresh_interval: float):
+        super().__init__(refresh_interval)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_entry(drink: dict) -> dict:
+        drink = with_drink_price(drink)
+        return {
+            "drink": drink,
+            "calculated_price": drink["calculated_price"],
+            "price_cents": drink["price_cents"],
+            "breakdown": drink["breakdown"]
+        }
+
+    async def reload(self):
+        drinks = await store.list_drinks()
+        self.entries = {drink["id"]: self.make_entry(drink) for drink in drinks}
+
+    async def get(self, drink_id: str) -> Optional[dict]:
+        """Return the catalog entry for a drink, or None if it does not exist"""
+        await self.refresh()
+        entry = self.entries.get(drink_id)
+        if entry:
+            self.hits += 1
+            return entry
+
+        # The drink may have been added by another worker since the last refresh
+        self.misses += 1
+        drink = await store.find_drink(drink_id)
+        if not drink:
+            return None
+        entry = self.make_entry(drink)
+        self.entries[drink_id] = entry
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries)
+        }
+
+class GuestDirectory(VersionedCache):
+    """Sorted in-memory index of guest names for prefix autocomplete.
+
+    The first load reads every guest; after that a version change only reads
+    guests created since the newest one already loaded (less a little slack
+    for clock differences between workers).
+    """
+
+    version_name = "guests"
+    LOAD_SLACK = timedelta(minutes=1)
+
+    def __init__(self, refresh_interval: float):
+        super().__init__(refresh_interval)
+        self.names = {}
+        self.keys = []
+        self.loaded_until = None
+
+    def add(self, guest_name: str, guest_key: Optional[str] = None):
+        if guest_name in self.names:
+            return
+        guest_key = guest_key or normalize_guest_key(guest_name)
+        self.names[guest_name] = guest_key
+        bisect.insort(self.keys, (guest_key, guest_name))
+
+    async def reload(self):
+        since = self.loaded_until - self.LOAD_SLACK if self.loaded_until else None
+        for guest in await store.guests_created_since(since):
+            self.add(guest["guest_name"], guest.get("guest_key"))
+            created_at = guest.get("created_at")
+            if created_at and (self.loaded_until is None or created_at > self.loaded_until):
+                self.loaded_until = created_at
+
+    async def suggest(self, prefix: str, limit: int) -> List[str]:
+        """Guest names whose normalized key starts with the normalized prefix"""
+        await self.refresh()
+        key = normalize_guest_key(prefix)
+        suggestions = []
+        position = bisect.bisect_left(self.keys, (key,))
+        while position < len(self.keys) and len(suggestions) < limit:
+            guest_key, guest_name = self.keys[position]
+            if not guest_key.startswith(key):
+                break
+            suggestions.append(guest_name)
+            position += 1
+        return suggestions
+
+    def stats(self) -> dict:
+        return {**super().stats(), "size": len(self.keys)}
+
+drink_catalog = DrinkCatalog(DRINK_CATALOG_REFRESH_SECONDS)
+guest_directory = GuestDirectory(GUEST_DIRECTORY_REFRESH_SECONDS)
+
+async def drinks_changed():
+    """Record a drink write so every worker's catalog picks it up"""
+    await bump_version("drinks")
+    drink_catalog.invalidate()
+
+async def guests_added(guest_names: List[str]):
+    """Record new guests so every worker's directory picks them up"""
+    for guest_name in guest_names:
+        guest_directory.add(guest_name)
+    await bump_version("guests")
+
+async def migrate_money_to_cents() -> dict:
+    """Store integer cents on documents written before money was kept in cents.
+
+    Existing dollar amounts are already rounded to cents, so the conversion
+    runs inside the database; the ledger is then rebuilt from the cent totals.
+    Returns how many documents were updated per collection.
+    """
+    counts = {"drinks": await backfill_drink_prices()}
+    for kind, dollars, cents in (
+        ("transactions", "calculated_price", "price_cents"),
+        ("payments", "amount", "amount_cents"),
+    ):
+        counts[kind] = await store.store_cents(kind, dollars, cents)
+    if counts["transactions"] or counts["payments"]:
+        await bump_versions("transactions", "payments")
+    counts["guests"] = await rebuild_guest_balances()
+    return counts
+
+async def backfill_drink_prices() -> int:
+    """Store the price and breakdown on drinks written before prices were stored in cents"""
+    updated = 0
+    for drink in await store.drinks_without_cents():
+        await store.update_drink(drink["id"], drink_price_fields(drink))
+        updated += 1
+    if updated:
+        await drinks_changed()
+    return updated
+
+async def publish_events(events: List[tuple]):
+    """Append (type, data) events to the store's shared event log.
+
+    The store numbers each event with a seq, which SSE clients echo back as
+    Last-Event-ID to resume after a reconnect.
+    """
+    if not events:
+        return
+    now = datetime.now()
+    await store.append_events([
+        {"type": event_type, "data": data, "created_at": now} for event_type, data in events
+    ])
+
+def balance_events(balances: List[dict]) -> List[tuple]:
+    return [("balance.updated", balance) for balance in balances]
+
+class EventBroker:
+    """Fans change events out to this worker's SSE subscribers.
+
+    Every worker tails the store's event log, so an event published by any
+    worker reaches every connected client.
+    """
+
+    QUEUE_SIZE = 1000
+
+    def __init__(self):
+        self.subscribers = set()
+        self.task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def dispatch(self, event: dict):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Close a stalled stream; the client reconnects and resumes from Last-Event-ID
+                self.subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def tail(self):
+        last_seq = await store.latest_event_seq()
+        while True:
+            try:
+                async for event in store.tail_events(last_seq):
+                    last_seq = event["seq"]
+                    self.dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Tailing the event log failed, retrying")
+            await asyncio.sleep(1)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.tail())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+event_broker = EventBroker()
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+# Write-behind transactions: with WRITE_BEHIND_DIR set, POST /api/transactions
+# returns once the priced transaction is fsynced to this worker's journal, and
+# a background task writes the journal to the store in batches
+def journal_record(document: dict) -> dict:
+    return {**document, "date": document["date"].isoformat(), "created_at": document["created_at"].isoformat()}
+
+def journal_document(record: dict) -> dict:
+    return {
+        **record,
+        "date": datetime.fromisoformat(record["date"]),
+        "created_at": datetime.fromisoformat(record["created_at"])
+    }
+
+async def flush_journal_segment(segment: Segment) -> tuple:
+    """Write a journal segment's transactions to the store, then delete the segment.
+
+    A transaction whose id is already stored was inserted by an earlier
+    attempt; if that attempt left its side effects pending they are applied
+    now, and otherwise it is skipped, so a segment can be replayed safely.
+    While another attempt still holds the lease on one of them the segment
+    is kept for a later flush. A segment with a transaction the store
+    rejected for any other reason is renamed to *.failed for an operator to
+    fix and replay. Returns (transactions written, whether the segment left
+    the journal).
+    """
+    documents = [journal_document(record) for record in segment.records]
+    written = 0
+    held = []
+    failed = {}
+    for offset in range(0, len(documents), WRITE_BEHIND_BATCH_SIZE):
+        batch = documents[offset:offset + WRITE_BEHIND_BATCH_SIZE]
+        errors, balances = await insert_transactions(batch)
+        if len(errors) < len(batch):
+            written += len(batch) - len(errors)
+            await bump_versions("transactions", "balances")
+            await publish_events([
+                ("transaction.created", Transaction(**document).model_dump(mode="json"))
+                for index, document in enumerate(batch) if index not in errors
+            ] + balance_events(balances))
+        duplicates = [batch[index]["id"] for index, error in errors.items() if error == DUPLICATE_ID]
+        failed.update((batch[index]["id"], error) for index, error in errors.items() if error != DUPLICATE_ID)
+        if duplicates:
+            finished, batch_held = await finish_pending("transactions", duplicates)
+            written += len(finished)
+            held += batch_held
+    if held:
+        return written, False
+    if failed:
+        path = await segment.set_aside()
+        logger.error("%d journaled transactions could not be stored, kept in %s: %s", len(failed), path, failed)
+        return written, True
+    await segment.remove()
+    return written, True
+
+async def replay_journal(journal: Journal) -> int:
+    """Flush the segments of workers that exited before flushing them.
+
+    A segment that cannot be finished yet stays claimed in journal.sealed
+    for the next flush.
+    """
+    written = 0
+    for segment in journal.claim_orphans():
+        segment_written, removed = await flush_journal_segment(segment)
+        written += segment_written
+        if not removed:
+            journal.sealed.append(segment)
+    if written:
+        logger.info("Replayed %d journaled transactions", written)
+    return written
+
+class TransactionWriteBehind:
+    """Journals created transactions and flushes them to the store in the background"""
+
+    def __init__(self, directory: str):
+        self.journal = Journal(directory, "transactions")
+        self.wakeup = None
+        self.task = None
+        self.stopping = False
+        self.flushed = 0
+        # Records of this worker's journal not yet flushed, by id
+        self.unflushed = {}
+
+    async def start(self):
+        await replay_journal(self.journal)
+        for segment in self.journal.sealed:
+            self.unflushed.update((record["id"], record) for record in segment.records)
+        self.journal.open()
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.task = asyncio.create_task(self.run())
+
+    async def find_replayed(self, document: dict) -> Optional[dict]:
+        """The transaction an earlier request with the same Idempotency-Key created, if there was one.
+
+        It is either still in this worker's journal or stored. The journal is
+        looked at again after reading the store, since a flush may have
+        stored it, or a concurrent retry journaled it, in the meantime;
+        nothing awaits between that look and the caller's submit.
+        """
+        record = self.unflushed.get(document["id"])
+        if record is None and await store.find("transactions", document["id"], include_deleted=True):
+            return await find_replayed("transactions", document)
+        record = record or self.unflushed.get(document["id"])
+        if record is None:
+            return None
+        check_replayed("transactions", record, document)
+        return journal_document(record)
+
+    async def submit(self, document: dict):
+        """Return once the transaction is durable in the journal"""
+        record = journal_record(document)
+        self.unflushed[document["id"]] = record
+        await self.journal.append(record)
+        if len(self.journal.segment.records) >= WRITE_BEHIND_BATCH_SIZE:
+            self.wakeup.set()
+
+    async def flush(self):
+        self.journal.seal()
+        while self.journal.sealed:
+            written, removed = await flush_journal_segment(self.journal.sealed[0])
+            self.flushed += written
+            if not removed:
+                # Retried on the next pass, once the lease holding it back expires
+                return
+            for record in self.journal.sealed.pop(0).records:
+                self.unflushed.pop(record["id"], None)
+
+    async def run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), WRITE_BEHIND_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # The segments stay sealed and are retried on the next pass
+                logger.exception("Flushing the transaction journal failed, retrying")
+
+    async def stop(self):
+        # Let a flush in progress finish rather than cancel it between the
+        # insert and the ledger update
+        self.stopping = True
+        self.wakeup.set()
+        if self.task is not None:
+            await self.task
+            self.task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final journal flush failed; the next worker to start replays it")
+        if self.journal.sealed:
+            logger.warning("%d journal segments left for the next worker to replay", len(self.journal.sealed))
+        await self.journal.close()
+
+    def stats(self) -> dict:
+        return {"pending": self.journal.pending(), "flushed": self.flushed}
+
+write_behind = TransactionWriteBehind(WRITE_BEHIND_DIR) if WRITE_BEHIND_DIR else None
+
+# Conditional GETs: list responses carry an ETag built from the version
+# counters of the collections they read, which the write routes bump
+async def collection_etag(*names) -> str:
+    versions = await get_versions(names)
+    return '"' + "-".join(f"{name}.{versions[name]}" for name in names) + '"'
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Tag the response and return a 304 if the client already holds this version"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+# History lists are ordered newest first, with id breaking ties between equal dates
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(document: dict) -> str:
+    """Build an opaque cursor pointing just past the given document"""
+    position = {"date": document["date"].isoformat(), "id": document["id"]}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Turn a cursor back into the (date, id) position to continue after"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        date = datetime.fromisoformat(position["date"])
+        document_id = position["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return date, document_id
+
+async def fetch_history_page(kind: str, history_filter: HistoryFilter, response: Response,
+                             limit: Optional[int], cursor: Optional[str],
+                             fields: Optional[tuple] = None) -> List[dict]:
+    """Fetch one page of a date-ordered history list.
+
+    Without a limit the whole matching history is returned. With a limit, an
+    X-Next-Cursor header is set when more documents follow the page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    if limit is None:
+        return await store.history_page(kind, history_filter, None, after, fields)
     
-    return round(total_price, 2)
+    # Read one extra document to learn whether another page exists
+    page = await store.history_page(kind, history_filter, limit + 1, after, fields)
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(page[-1])
+    return page
+
+# Guest searches match on the normalized name: exactly, or as a prefix
+GUEST_MATCH_QUERY = Query("prefix", pattern="^(exact|prefix)$")
+
+def build_history_filter(guest_name: Optional[str], guest_match: str = "prefix",
+                         drink_id: Optional[str] = None, start_date: Optional[str] = None,
+                         end_date: Optional[str] = None) -> HistoryFilter:
+    """Build the filter shared by the history lists and CSV export.
+
+    Guests are matched on guest_key, which the stores index, so a prefix
+    match is an index range scan.
+    """
+    history_filter = HistoryFilter(drink_id=drink_id)
+    
+    if guest_name:
+        history_filter.guest_key = normalize_guest_key(guest_name)
+        history_filter.guest_prefix = guest_match == "prefix"
+    
+    if start_date:
+        history_filter.start = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+    if end_date:
+        history_filter.end = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+    return history_filter
 
 # API Routes
 
@@ -121,40 +1320,30 @@ async def root():
 # Drinks Management
 @app.post("/api/drinks", response_model=Drink)
 async def create_drink(drink: DrinkCreate):
-    drink_id = str(uuid.uuid4())
-    drink_data = {
-        "id": drink_id,
-        "name": drink.name,
-        "base_cost": drink.base_cost,
-        "total_volume": drink.total_volume,
-        "volume_unit": drink.volume_unit,
-        "volume_served": drink.volume_served,
-        "mixer_cost": drink.mixer_cost,
-        "flat_cost": drink.flat_cost,
-        "created_at": datetime.now()
-    }
+    drink_data = new_drink_document(drink, datetime.now())
     
-    drinks_collection.insert_one(drink_data)
+    await store.insert_drink(drink_data)
+    await drinks_changed()
     return Drink(**drink_data)
 
 @app.get("/api/drinks", response_model=List[Drink])
-async def get_drinks():
-    drinks = list(drinks_collection.find({}, {"_id": 0}))
-    return [Drink(**drink) for drink in drinks]
+async def get_drinks(request: Request, response: Response):
+    cached = not_modified(request, response, await collection_etag("drinks"))
+    if cached:
+        return cached
+    
+    drinks = await store.list_drinks()
+    return json_rows(response, DRINK_ROWS.rows([with_drink_price(drink) for drink in drinks]))
 
 @app.get("/api/drinks/{drink_id}", response_model=Drink)
 async def get_drink(drink_id: str):
-    drink = drinks_collection.find_one({"id": drink_id}, {"_id": 0})
+    drink = await store.find_drink(drink_id)
     if not drink:
         raise HTTPException(status_code=404, detail="Drink not found")
-    return Drink(**drink)
+    return Drink(**with_drink_price(drink))
 
 @app.put("/api/drinks/{drink_id}", response_model=Drink)
 async def update_drink(drink_id: str, drink: DrinkCreate):
-    existing_drink = drinks_collection.find_one({"id": drink_id})
-    if not existing_drink:
-        raise HTTPException(status_code=404, detail="Drink not found")
-    
     updated_data = {
         "name": drink.name,
         "base_cost": drink.base_cost,
@@ -164,131 +1353,187 @@ async def update_drink(drink_id: str, drink: DrinkCreate):
         "mixer_cost": drink.mixer_cost,
         "flat_cost": drink.flat_cost
     }
+    updated_data.update(drink_price_fields(updated_data))
     
-    drinks_collection.update_one({"id": drink_id}, {"$set": updated_data})
-    
-    updated_drink = drinks_collection.find_one({"id": drink_id}, {"_id": 0})
+    updated_drink = await store.update_drink(drink_id, updated_data)
+    if not updated_drink:
+        raise HTTPException(status_code=404, detail="Drink not found")
+    await drinks_changed()
     return Drink(**updated_drink)
 
 @app.delete("/api/drinks/{drink_id}")
 async def delete_drink(drink_id: str):
-    result = drinks_collection.delete_one({"id": drink_id})
-    if result.deleted_count == 0:
+    if not await store.delete_drink(drink_id, datetime.now()):
         raise HTTPException(status_code=404, detail="Drink not found")
+    await drinks_changed()
     return {"message": "Drink deleted successfully"}
 
 # Price Calculation
 @app.post("/api/calculate-price", response_model=PriceCalculationResponse)
 async def calculate_price(request: PriceCalculationRequest):
-    drink = drinks_collection.find_one({"id": request.drink_id}, {"_id": 0})
-    if not drink:
+    # Kept for older clients; drinks now carry their price and breakdown
+    entry = await drink_catalog.get(request.drink_id)
+    if not entry:
         raise HTTPException(status_code=404, detail="Drink not found")
     
-    calculated_price = calculate_drink_price(drink)
+    return PriceCalculationResponse(calculated_price=entry["calculated_price"], breakdown=entry["breakdown"])
+
+# Metrics
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+# Cache Statistics
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    stats = {"drinks": drink_catalog.stats(), "guests": guest_directory.stats()}
+    if write_behind:
+        stats["write_behind"] = write_behind.stats()
+    return stats
+
+# Transactions Management
+@app.post("/api/transactions", response_model=Transaction)
+async def create_transaction(transaction: TransactionCreate, idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER):
+    # Price the drink from the in-memory catalog
+    entry = await drink_catalog.get(transaction.drink_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Drink not found")
     
-    # Create breakdown for transparency
-    drink_volume_ml = drink["total_volume"]
-    if drink["volume_unit"] == "oz":
-        drink_volume_ml = convert_oz_to_ml(drink["total_volume"])
+    transaction_data = new_transaction_document(
+        transaction, entry, datetime.now(), idempotent_id("transaction", idempotency_key)
+    )
     
-    volume_served_ml = convert_oz_to_ml(drink["volume_served"])
-    price_per_ml = drink["base_cost"] / drink_volume_ml
-    alcohol_cost = price_per_ml * volume_served_ml
+    if write_behind:
+        # Stored, counted and announced when the journal is flushed
+        if idempotency_key:
+            replayed = await write_behind.find_replayed(transaction_data)
+            if replayed:
+                return Transaction(**replayed)
+        await write_behind.submit(transaction_data)
+        return Transaction(**transaction_data)
     
-    breakdown = {
-        "base_cost": drink["base_cost"],
-        "total_volume": drink["total_volume"],
-        "volume_unit": drink["volume_unit"],
-        "volume_served": drink["volume_served"],
-        "price_per_ml": round(price_per_ml, 4),
-        "alcohol_cost": round(alcohol_cost, 2),
-        "mixer_cost": drink["mixer_cost"],
-        "flat_cost": drink["flat_cost"],
-        "total_price": calculated_price
-    }
+    try:
+        await store.insert("transactions", pending_documents("transactions", [transaction_data], datetime.now())[0])
+    except DuplicateIdError:
+        # A retry of a create that already went through: answer with what it wrote
+        return Transaction(**await find_replayed("transactions", transaction_data))
+    balances = await apply_pending_steps("transactions", [transaction_data], "rollups")
+    await bump_versions("transactions", "balances")
     
-    return PriceCalculationResponse(calculated_price=calculated_price, breakdown=breakdown)
+    created = Transaction(**transaction_data)
+    await publish_events([("transaction.created", created.model_dump(mode="json"))] + balance_events(balances))
+    return created
 
-# Transactions Management
-@app.post("/api/transactions", response_model=Transaction)
-async def create_transaction(transaction: TransactionCreate):
-    # Get drink for price calculation
-    drink = drinks_collection.find_one({"id": transaction.drink_id}, {"_id": 0})
-    if not drink:
-        raise HTTPException(status_code=404, detail="Drink not found")
+@app.post("/api/transactions/batch", response_model=TransactionBatchResponse)
+async def create_transactions_batch(batch: TransactionBatchRequest):
+    # Price each distinct drink once for the whole round
+    entries = {}
+    for drink_id in {item.drink_id for item in batch.items}:
+        entries[drink_id] = await drink_catalog.get(drink_id)
     
-    # Calculate price using predefined drink settings
-    calculated_price = calculate_drink_price(drink)
+    results = []
+    documents = []
+    document_results = []
+    now = datetime.now()
+    for index, item in enumerate(batch.items):
+        entry = entries[item.drink_id]
+        if not entry:
+            results.append(TransactionBatchResult(index=index, error="Drink not found"))
+            continue
+        
+        document = new_transaction_document(item, entry, now)
+        result = TransactionBatchResult(index=index)
+        documents.append(document)
+        document_results.append(result)
+        results.append(result)
     
-    transaction_id = str(uuid.uuid4())
-    transaction_data = {
-        "id": transaction_id,
-        "guest_name": transaction.guest_name,
-        "drink_id": transaction.drink_id,
-        "calculated_price": calculated_price,
-        "date": transaction.date or datetime.now(),
-        "created_at": datetime.now()
-    }
+    errors, balances = await insert_transactions(documents) if documents else ({}, [])
+    if len(errors) < len(documents):
+        await bump_versions("transactions", "balances")
+    events = []
+    for position, (document, result) in enumerate(zip(documents, document_results)):
+        if position in errors:
+            result.error = errors[position]
+        else:
+            result.transaction = Transaction(**document)
+            events.append(("transaction.created", result.transaction.model_dump(mode="json")))
+    await publish_events(events + balance_events(balances))
     
-    transactions_collection.insert_one(transaction_data)
-    return Transaction(**transaction_data)
+    created = sum(1 for result in results if result.transaction)
+    return TransactionBatchResponse(created=created, failed=len(results) - created, results=results)
 
 @app.get("/api/transactions", response_model=List[Transaction])
 async def get_transactions(
+    request: Request,
+    response: Response,
     guest_name: Optional[str] = None,
+    guest_match: str = GUEST_MATCH_QUERY,
     drink_id: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
 ):
-    query = {}
+    cached = not_modified(request, response, await collection_etag("transactions"))
+    if cached:
+        return cached
     
-    if guest_name:
-        query["guest_name"] = {"$regex": guest_name, "$options": "i"}
-    
-    if drink_id:
-        query["drink_id"] = drink_id
-    
-    if start_date or end_date:
-        date_query = {}
-        if start_date:
-            date_query["$gte"] = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-        if end_date:
-            date_query["$lte"] = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-        query["date"] = date_query
-    
-    transactions = list(transactions_collection.find(query, {"_id": 0}).sort("date", -1))
-    return [Transaction(**transaction) for transaction in transactions]
+    history_filter = build_history_filter(guest_name, guest_match, drink_id, start_date, end_date)
+    transactions = await fetch_history_page(
+        "transactions", history_filter, response, limit, cursor, TRANSACTION_ROWS.fields
+    )
+    return json_rows(response, TRANSACTION_ROWS.rows(transactions))
 
 @app.get("/api/transactions/{transaction_id}", response_model=Transaction)
 async def get_transaction(transaction_id: str):
-    transaction = transactions_collection.find_one({"id": transaction_id}, {"_id": 0})
+    transaction = await store.find("transactions", transaction_id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     return Transaction(**transaction)
 
 @app.delete("/api/transactions/{transaction_id}")
 async def delete_transaction(transaction_id: str):
-    result = transactions_collection.delete_one({"id": transaction_id})
-    if result.deleted_count == 0:
+    deleted = await store.delete("transactions", transaction_id, datetime.now())
+    if not deleted:
+        if await store.find("transactions", transaction_id):
+            raise HTTPException(status_code=409, detail="Transaction is still being recorded")
         raise HTTPException(status_code=404, detail="Transaction not found")
+    balance = await apply_guest_balance_delta(deleted["guest_name"], owed_cents=-deleted["price_cents"])
+    await apply_sales_rollups([deleted], sign=-1)
+    await bump_versions("transactions", "balances")
+    await publish_events([
+        ("transaction.deleted", {"id": transaction_id, "guest_name": deleted["guest_name"]}),
+        ("balance.updated", balance)
+    ])
     return {"message": "Transaction deleted successfully"}
 
 # CSV Export
-@app.get("/api/transactions/export/csv")
-async def export_transactions_csv():
-    transactions = list(transactions_collection.find({}, {"_id": 0}).sort("date", -1))
-    
-    # Create CSV content
+CSV_HEADER = ["Date", "Guest Name", "Drink ID", "Calculated Price", "Transaction ID"]
+CSV_CHUNK_ROWS = 500
+
+async def stream_transactions_csv(history_filter: HistoryFilter, compress: bool, archived: bool = False):
+    """Yield the CSV export in chunks of rows as the store produces them"""
     output = io.StringIO()
     writer = csv.writer(output)
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
     
-    # Write header
-    writer.writerow([
-        "Date", "Guest Name", "Drink ID", "Calculated Price", "Transaction ID"
-    ])
+    def drain() -> bytes:
+        data = output.getvalue().encode()
+        output.seek(0)
+        output.truncate(0)
+        return compressor.compress(data) if compressor else data
     
-    # Write data
-    for transaction in transactions:
+    # Send the header straight away so the download starts before the first batch
+    writer.writerow(CSV_HEADER)
+    yield drain()
+    
+    rows = 0
+    kind = ARCHIVES["transactions"] if archived else "transactions"
+    async for transaction in store.iter_history(kind, history_filter, CSV_CHUNK_ROWS):
         writer.writerow([
             transaction["date"].strftime("%Y-%m-%d %H:%M:%S"),
             transaction["guest_name"],
@@ -296,114 +1541,435 @@ async def export_transactions_csv():
             transaction["calculated_price"],
             transaction["id"]
         ])
+        rows += 1
+        if rows % CSV_CHUNK_ROWS == 0:
+            chunk = drain()
+            if chunk:
+                yield chunk
     
-    output.seek(0)
+    chunk = drain()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+@app.get("/api/transactions/export/csv")
+async def export_transactions_csv(
+    guest_name: Optional[str] = None,
+    guest_match: str = GUEST_MATCH_QUERY,
+    drink_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    gzip: bool = False,
+    archived: bool = False
+):
+    history_filter = build_history_filter(guest_name, guest_match, drink_id, start_date, end_date)
+    filename = "bartab_transactions_archive" if archived else "bartab_transactions"
+    filename += ".csv.gz" if gzip else ".csv"
     
     return StreamingResponse(
-        io.BytesIO(output.getvalue().encode()),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=bartab_transactions.csv"}
+        stream_transactions_csv(history_filter, compress=gzip, archived=archived),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 # Payments Management
 @app.post("/api/payments", response_model=Payment)
-async def create_payment(payment: PaymentCreate):
-    payment_id = str(uuid.uuid4())
-    payment_data = {
-        "id": payment_id,
-        "guest_name": payment.guest_name,
-        "amount": payment.amount,
-        "date": payment.date or datetime.now(),
-        "notes": payment.notes,
-        "created_at": datetime.now()
-    }
+async def create_payment(payment: PaymentCreate, idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER):
+    payment_data = new_payment_document(payment, datetime.now(), idempotent_id("payment", idempotency_key))
+    
+    try:
+        await store.insert("payments", pending_documents("payments", [payment_data], datetime.now())[0])
+    except DuplicateIdError:
+        # A retry of a create that already went through: answer with what it wrote
+        return Payment(**await find_replayed("payments", payment_data))
+    balances = await apply_pending_steps("payments", [payment_data], "balance")
+    await bump_versions("payments", "balances")
     
-    payments_collection.insert_one(payment_data)
-    return Payment(**payment_data)
+    created = Payment(**payment_data)
+    await publish_events([("payment.created", created.model_dump(mode="json"))] + balance_events(balances))
+    return created
 
 @app.get("/api/payments", response_model=List[Payment])
-async def get_payments(guest_name: Optional[str] = None):
-    query = {}
-    if guest_name:
-        query["guest_name"] = {"$regex": guest_name, "$options": "i"}
+async def get_payments(
+    request: Request,
+    response: Response,
+    guest_name: Optional[str] = None,
+    guest_match: str = GUEST_MATCH_QUERY,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    cached = not_modified(request, response, await collection_etag("payments"))
+    if cached:
+        return cached
     
-    payments = list(payments_collection.find(query, {"_id": 0}).sort("date", -1))
-    return [Payment(**payment) for payment in payments]
+    history_filter = build_history_filter(guest_name, guest_match)
+    payments = await fetch_history_page(
+        "payments", history_filter, response, limit, cursor, PAYMENT_ROWS.fields
+    )
+    return json_rows(response, PAYMENT_ROWS.rows(payments))
 
 @app.get("/api/payments/{payment_id}", response_model=Payment)
 async def get_payment(payment_id: str):
-    payment = payments_collection.find_one({"id": payment_id}, {"_id": 0})
+    payment = await store.find("payments", payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     return Payment(**payment)
 
 @app.delete("/api/payments/{payment_id}")
 async def delete_payment(payment_id: str):
-    result = payments_collection.delete_one({"id": payment_id})
-    if result.deleted_count == 0:
+    deleted = await store.delete("payments", payment_id, datetime.now())
+    if not deleted:
+        if await store.find("payments", payment_id):
+            raise HTTPException(status_code=409, detail="Payment is still being recorded")
         raise HTTPException(status_code=404, detail="Payment not found")
+    balance = await apply_guest_balance_delta(deleted["guest_name"], paid_cents=-deleted["amount_cents"])
+    await bump_versions("payments", "balances")
+    await publish_events([
+        ("payment.deleted", {"id": payment_id, "guest_name": deleted["guest_name"]}),
+        ("balance.updated", balance)
+    ])
     return {"message": "Payment deleted successfully"}
 
+# Bulk Import
+IMPORT_BATCH_SIZE = 1000
+MAX_IMPORT_ERRORS = 1000
+
+async def iter_text_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into UTF-8 lines, holding at most one chunk in memory"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+# Lines a quoted CSV field may span before the record is reported as unterminated
+MAX_CSV_RECORD_LINES = 1000
+
+def parse_csv_record(lines: List[str]) -> Optional[list]:
+    """The values of the CSV record in lines, or None while a quoted field is still open.
+
+    The csv module decides where the record ends: given one line more than
+    it has, it reads that extra line only if a quoted field runs past the
+    last real one.
+    """
+    reader = csv.reader(lines + [""])
+    values = next(reader, [])
+    if reader.line_num > len(lines):
+        return None
+    return values
+
+async def iter_import_records(lines: AsyncIterator[str], file_format: str) -> AsyncIterator[tuple]:
+    """Yield (row number, record, error) for each JSONL line or CSV row after the header"""
+    header = None
+    record_lines = []
+    row = 0
+    async for line in lines:
+        if file_format == "jsonl":
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield row, None, "Invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield row, None, "Expected a JSON object"
+                continue
+            yield row, record, None
+            continue
+        
+        # A quoted CSV field may span lines
+        record_lines.append(line.rstrip("\r") + "\n")
+        values = parse_csv_record(record_lines)
+        if values is None:
+            if len(record_lines) < MAX_CSV_RECORD_LINES:
+                continue
+            row += 1
+            record_lines = []
+            yield row, None, "Unterminated quoted field"
+            continue
+        record_lines = []
+        
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if not any(values):
+            continue
+        row += 1
+        # Empty cells fall back to the model defaults
+        yield row, {name: value for name, value in zip(header, values) if value != ""}, None
+    
+    if record_lines:
+        yield row + 1, None, "Unterminated quoted field"
+
+async def import_drink_batch(items: List[tuple], now: datetime) -> dict:
+    documents = [new_drink_document(drink, now) for _, drink in items]
+    errors = await store.insert_many("drinks", documents)
+    if len(errors) < len(documents):
+        await drinks_changed()
+    return errors
+
+async def import_transaction_batch(items: List[tuple], now: datetime) -> dict:
+    errors = {}
+    documents = []
+    positions = []
+    for index, (_, item) in enumerate(items):
+        entry = await drink_catalog.get(item.drink_id)
+        if not entry:
+            errors[index] = "Drink not found"
+            continue
+        documents.append(new_transaction_document(item, entry, now))
+        positions.append(index)
+    
+    insert_errors, balances = await insert_transactions(documents) if documents else ({}, [])
+    errors.update({positions[position]: error for position, error in insert_errors.items()})
+    if len(insert_errors) < len(documents):
+        await bump_versions("transactions", "balances")
+        await publish_events(balance_events(balances))
+    return errors
+
+async def import_payment_batch(items: List[tuple], now: datetime) -> dict:
+    documents = [new_payment_document(payment, now) for _, payment in items]
+    errors, balances = await insert_payments(documents)
+    if len(errors) < len(documents):
+        await bump_versions("payments", "balances")
+        await publish_events(balance_events(balances))
+    return errors
+
+# Import kind -> (create model validating each record, batch writer returning {index: error})
+IMPORTERS = {
+    "drinks": (DrinkCreate, import_drink_batch),
+    "transactions": (TransactionCreate, import_transaction_batch),
+    "payments": (PaymentCreate, import_payment_batch),
+}
+
+async def import_records(kind: str, records: AsyncIterator[tuple]) -> ImportResult:
+    """Validate records with the create model and insert them in unordered batches.
+
+    Only one batch is held in memory. Rows that fail validation or insertion
+    are reported by row number (the first MAX_IMPORT_ERRORS of them); the
+    other rows are imported.
+    """
+    model, import_batch = IMPORTERS[kind]
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+    row = 0
+    
+    def record_error(row_number: int, error: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append(ImportRowError(row=row_number, error=error))
+    
+    async def flush():
+        nonlocal imported
+        batch_errors = await import_batch(batch, datetime.now())
+        imported += len(batch) - len(batch_errors)
+        for index, error in sorted(batch_errors.items()):
+            record_error(batch[index][0], error)
+        batch.clear()
+    
+    try:
+        async for row, record, error in records:
+            if error:
+                record_error(row, error)
+                continue
+            try:
+                batch.append((row, model.model_validate(record)))
+            except ValidationError as exc:
+                record_error(row, "; ".join(
+                    f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}"
+                    for detail in exc.errors()
+                ))
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+    except UnicodeDecodeError:
+        record_error(row + 1, "File is not valid UTF-8; import stopped")
+    if batch:
+        await flush()
+    
+    # Insert errors surface when their batch flushes, after later rows' validation errors
+    errors.sort(key=lambda error: error.row)
+    return ImportResult(imported=imported, failed=failed, errors=errors)
+
+@app.post("/api/import/{kind}", response_model=ImportResult)
+async def import_data(
+    request: Request,
+    kind: str = Path(pattern="^(drinks|transactions|payments)$"),
+    file_format: str = Query("csv", alias="format", pattern="^(csv|jsonl)$")
+):
+    """Stream a CSV or JSONL request body into drinks, transactions or payments.
+
+    CSV files start with a header row naming the create model's fields.
+    """
+    records = iter_import_records(iter_text_lines(request.stream()), file_format)
+    return await import_records(kind, records)
+
+# Sales Reports
+@app.get("/api/reports", response_model=List[SalesReportRow])
+async def get_sales_report(
+    request: Request,
+    response: Response,
+    interval: str = Query("day", pattern="^(hour|day|total)$"),
+    group_by: Optional[str] = Query(None, pattern="^(drink|guest)$"),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    drink_id: Optional[str] = None,
+    guest_name: Optional[str] = None
+):
+    """Pours and revenue per interval, optionally split by drink or guest.
+
+    Answered from the sales rollups, so the cost depends on the number of
+    buckets in the range rather than the number of transactions. Ranges
+    resolve to whole buckets: every hour (or day) touching the range counts.
+    """
+    cached = not_modified(request, response, await collection_etag("transactions"))
+    if cached:
+        return cached
+    
+    start = to_utc_naive(datetime.fromisoformat(start_date.replace('Z', '+00:00'))) if start_date else None
+    end = to_utc_naive(datetime.fromisoformat(end_date.replace('Z', '+00:00'))) if end_date else None
+    
+    # Daily rollups suffice unless hours are asked for or the range splits a day
+    granularity = "day"
+    if interval == "hour" or any(bound and bound != bucket_start(bound, "day") for bound in (start, end)):
+        granularity = "hour"
+    
+    rows = await store.sales_report(
+        granularity, interval, group_by,
+        bucket_start(start, granularity) if start else None, end,
+        drink_id, guest_name
+    )
+    return [SalesReportRow(**row, revenue=from_cents(row["revenue_cents"])) for row in rows]
+
+# Live Updates
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """Server-Sent Events feed of transaction, payment and balance changes"""
+    queue = event_broker.subscribe()
+    last_event_id = request.headers.get("last-event-id", "")
+    
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            # Replay whatever a reconnecting client missed that the event log
+            # still holds; the same events may be queued for it as well
+            resume_seq = int(last_event_id) if last_event_id.isdigit() else None
+            replayed = set()
+            if resume_seq is not None:
+                async for event in store.events_after(resume_seq):
+                    replayed.add(event["seq"])
+                    yield format_sse(event)
+            
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                # Sent by the replay, or had before the reconnect
+                if event["seq"] in replayed or (resume_seq is not None and event["seq"] <= resume_seq):
+                    continue
+                yield format_sse(event)
+        finally:
+            event_broker.unsubscribe(queue)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Guest Balance Management
 @app.get("/api/guests/balances", response_model=List[GuestBalance])
-async def get_guest_balances():
-    # Get all transactions grouped by guest
-    transactions_by_guest = {}
-    transactions = list(transactions_collection.find({}, {"_id": 0}))
-    for transaction in transactions:
-        guest = transaction["guest_name"]
-        if guest not in transactions_by_guest:
-            transactions_by_guest[guest] = 0
-        transactions_by_guest[guest] += transaction["calculated_price"]
-    
-    # Get all payments grouped by guest
-    payments_by_guest = {}
-    payments = list(payments_collection.find({}, {"_id": 0}))
-    for payment in payments:
-        guest = payment["guest_name"]
-        if guest not in payments_by_guest:
-            payments_by_guest[guest] = 0
-        payments_by_guest[guest] += payment["amount"]
-    
-    # Calculate balances
-    all_guests = set(list(transactions_by_guest.keys()) + list(payments_by_guest.keys()))
-    balances = []
+async def get_guest_balances(request: Request, response: Response):
+    cached = not_modified(request, response, await collection_etag("balances"))
+    if cached:
+        return cached
     
-    for guest in all_guests:
-        total_owed = transactions_by_guest.get(guest, 0.0)
-        total_paid = payments_by_guest.get(guest, 0.0)
-        balance = total_owed - total_paid
+    # Read the running totals maintained by the write routes
+    balances = []
+    for guest in await store.list_guests():
+        balance = balance_snapshot(guest)
+        # Guests whose every transaction and payment was deleted drop off the list
+        if balance["total_owed"] == 0 and balance["total_paid"] == 0:
+            continue
         
-        balances.append(GuestBalance(
-            guest_name=guest,
-            total_owed=round(total_owed, 2),
-            total_paid=round(total_paid, 2),
-            balance=round(balance, 2)
-        ))
+        balances.append(balance)
     
     # Sort by balance descending (highest debt first)
-    balances.sort(key=lambda x: x.balance, reverse=True)
-    return balances
+    balances.sort(key=lambda x: x["balance"], reverse=True)
+    return json_rows(response, balances)
 
-@app.get("/api/guests/{guest_name}/balance", response_model=GuestBalance)
-async def get_guest_balance(guest_name: str):
-    # Get guest transactions
-    transactions = list(transactions_collection.find({"guest_name": guest_name}, {"_id": 0}))
-    total_owed = sum(t["calculated_price"] for t in transactions)
+@app.post("/api/guests/settle", response_model=GuestSettleResponse)
+async def settle_guests(request: GuestSettleRequest, idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER):
+    if not request.guest_names and not request.all_with_balance:
+        raise HTTPException(status_code=422, detail="Give guest_names or set all_with_balance")
     
-    # Get guest payments
-    payments = list(payments_collection.find({"guest_name": guest_name}, {"_id": 0}))
-    total_paid = sum(p["amount"] for p in payments)
+    # Each payment is the guest's balance in the ledger at the time of the
+    # request, so a tab that is already paid up is skipped
+    if request.all_with_balance:
+        guests = await store.list_guests()
+    else:
+        guests = await store.find_guests(list(dict.fromkeys(request.guest_names)))
+    now = datetime.now()
+    documents = []
+    for guest in guests:
+        balance_cents = guest["owed_cents"] - guest["paid_cents"]
+        if balance_cents <= 0:
+            continue
+        
+        payment = PaymentCreate(guest_name=guest["guest_name"], amount=from_cents(balance_cents), notes=request.notes)
+        # A retry running alongside the first attempt writes the same ids, so no tab is paid twice
+        key = f"settle:{idempotency_key}:{guest['guest_name']}" if idempotency_key else None
+        documents.append(new_payment_document(payment, now, idempotent_id("payment", key)))
     
-    balance = total_owed - total_paid
+    errors, balances = await insert_payments(documents) if documents else ({}, [])
+    payments = [Payment(**document) for index, document in enumerate(documents) if index not in errors]
+    if payments:
+        await bump_versions("payments", "balances")
+    await publish_events(
+        [("payment.created", payment.model_dump(mode="json")) for payment in payments] + balance_events(balances)
+    )
     
-    return GuestBalance(
-        guest_name=guest_name,
-        total_owed=round(total_owed, 2),
-        total_paid=round(total_paid, 2),
-        balance=round(balance, 2)
+    return GuestSettleResponse(
+        settled=len(payments),
+        amount=from_cents(sum(payment.amount_cents for payment in payments)),
+        payments=payments,
+        balances=balances
     )
 
+@app.get("/api/guests/suggest", response_model=List[str])
+async def suggest_guests(prefix: str = "", limit: int = Query(10, ge=1, le=50)):
+    return await guest_directory.suggest(prefix, limit)
+
+@app.get("/api/guests/{guest_name}/balance", response_model=GuestBalance)
+async def get_guest_balance(guest_name: str):
+    # Read from the ledger, so rev orders this snapshot against balance.updated events
+    guests = await store.find_guests([guest_name])
+    guest = guests[0] if guests else {"guest_name": guest_name, "owed_cents": 0, "paid_cents": 0}
+    return GuestBalance(**balance_snapshot(guest))
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # Development entry point; production runs under gunicorn (see gunicorn.conf.py)
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=8001,
+        workers=int(os.environ.get('WEB_CONCURRENCY', '1')),
+        reload=os.environ.get('UVICORN_RELOAD', '') == '1'
+    )
\ No newline at end of file
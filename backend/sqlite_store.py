@@ -0,0 +1,755 @@
+"""
+Embedded SQLite storage backend (STORAGE_BACKEND=sqlite)
+
+Everything lives in one database file (SQLITE_PATH) in WAL mode, so readers
+never block the writer and every gunicorn worker can open it at once;
+multi-statement writes take the write lock up front with BEGIN IMMEDIATE.
+Each worker runs its connection on one dedicated thread, keeping the event
+loop free while SQLite works.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+from storage import ARCHIVES, DUPLICATE_ID, DuplicateIdError, HistoryFilter, Store
+
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'bartab.db')
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.environ.get('SQLITE_BUSY_TIMEOUT_SECONDS', '5.0'))
+
+# How often each worker polls the events table for events other workers appended
+EVENTS_POLL_SECONDS = 0.25
+# Events kept for SSE clients resuming after a reconnect, like the capped Mongo collection
+EVENTS_KEPT = 10000
+EVENTS_PAGE_SIZE = 1000
+# Guest names bound in one IN (...) list, well under SQLite's bound-parameter limit
+GUEST_NAMES_PER_STATEMENT = 500
+
+# Columns per table; documents are stored column by column, missing fields as NULL
+TABLES = {
+    "drinks": ("id", "name", "base_cost", "total_volume", "volume_unit", "volume_served",
+               "mixer_cost", "flat_cost", "calculated_price", "price_cents", "breakdown", "created_at",
+               "deleted_at"),
+    "transactions": ("id", "guest_name", "guest_key", "drink_id", "calculated_price", "price_cents",
+                     "date", "created_at", "deleted_at", "pending", "pending_until"),
+    "payments": ("id", "guest_name", "guest_key", "amount", "amount_cents", "date", "notes", "created_at",
+                 "deleted_at", "pending", "pending_until"),
+    "guests": ("guest_name", "guest_key", "owed_cents", "paid_cents", "created_at", "updated_at", "rev"),
+    "meta": ("name", "version"),
+    "events": ("seq", "type", "data", "created_at"),
+    "sales_rollups": ("granularity", "start", "drink_id", "guest_name", "pours", "revenue_cents"),
+}
+TABLES.update({archive: TABLES[kind] for kind, archive in ARCHIVES.items()})
+
+# Datetimes are stored as naive UTC ISO strings with microseconds, so they sort as text
+DATETIME_COLUMNS = {"date", "created_at", "updated_at", "start", "deleted_at", "pending_until"}
+JSON_COLUMNS = {"breakdown", "data"}
+
+# Indexes mirror the Mongo ones: id lookups, guest/drink filters and date-sorted lists
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drinks (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    base_cost REAL,
+    total_volume REAL,
+    volume_unit TEXT,
+    volume_served REAL,
+    mixer_cost REAL,
+    flat_cost REAL,
+    calculated_price REAL,
+    price_cents INTEGER,
+    breakdown TEXT,
+    created_at TEXT,
+    deleted_at TEXT
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    guest_name TEXT NOT NULL,
+    guest_key TEXT,
+    drink_id TEXT NOT NULL,
+    calculated_price REAL,
+    price_cents INTEGER,
+    date TEXT NOT NULL,
+    created_at TEXT,
+    deleted_at TEXT,
+    pending TEXT,
+    pending_until TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_guest_name_date ON transactions (guest_name, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS transactions_guest_key_date ON transactions (guest_key, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS transactions_drink_id_date ON transactions (drink_id, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date DESC, id DESC);
+CREATE TABLE IF NOT EXISTS payments (
+    id TEXT PRIMARY KEY,
+    guest_name TEXT NOT NULL,
+    guest_key TEXT,
+    amount REAL,
+    amount_cents INTEGER,
+    date TEXT NOT NULL,
+    notes TEXT,
+    created_at TEXT,
+    deleted_at TEXT,
+    pending TEXT,
+    pending_until TEXT
+);
+CREATE INDEX IF NOT EXISTS payments_guest_name_date ON payments (guest_name, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS payments_guest_key_date ON payments (guest_key, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS payments_date ON payments (date DESC, id DESC);
+CREATE TABLE IF NOT EXISTS guests (
+    guest_name TEXT PRIMARY KEY,
+    guest_key TEXT,
+    owed_cents INTEGER NOT NULL DEFAULT 0,
+    paid_cents INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT,
+    rev INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS guests_created_at ON guests (created_at);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS sales_rollups (
+    granularity TEXT NOT NULL,
+    start TEXT NOT NULL,
+    drink_id TEXT NOT NULL,
+    guest_name TEXT NOT NULL,
+    pours INTEGER NOT NULL,
+    revenue_cents INTEGER NOT NULL,
+    PRIMARY KEY (granularity, start, drink_id, guest_name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS transactions_archive (
+    id TEXT PRIMARY KEY,
+    guest_name TEXT NOT NULL,
+    guest_key TEXT,
+    drink_id TEXT NOT NULL,
+    calculated_price REAL,
+    price_cents INTEGER,
+    date TEXT NOT NULL,
+    created_at TEXT,
+    deleted_at TEXT,
+    pending TEXT,
+    pending_until TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_archive_guest_name_date ON transactions_archive (guest_name, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS transactions_archive_guest_key_date ON transactions_archive (guest_key, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS transactions_archive_date ON transactions_archive (date DESC, id DESC);
+CREATE TABLE IF NOT EXISTS payments_archive (
+    id TEXT PRIMARY KEY,
+    guest_name TEXT NOT NULL,
+    guest_key TEXT,
+    amount REAL,
+    amount_cents INTEGER,
+    date TEXT NOT NULL,
+    notes TEXT,
+    created_at TEXT,
+    deleted_at TEXT,
+    pending TEXT,
+    pending_until TEXT
+);
+CREATE INDEX IF NOT EXISTS payments_archive_guest_name_date ON payments_archive (guest_name, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS payments_archive_guest_key_date ON payments_archive (guest_key, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS payments_archive_date ON payments_archive (date DESC, id DESC);
+"""
+
+UPSERT_GUEST = """
+INSERT INTO guests (guest_name, guest_key, owed_cents, paid_cents, created_at, updated_at, rev)
+VALUES (?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT (guest_name) DO UPDATE SET
+    owed_cents = owed_cents + excluded.owed_cents,
+    paid_cents = paid_cents + excluded.paid_cents,
+    updated_at = excluded.updated_at,
+    rev = COALESCE(rev, 0) + 1
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO sales_rollups (granularity, start, drink_id, guest_name, pours, revenue_cents)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (granularity, start, drink_id, guest_name) DO UPDATE SET
+    pours = pours + excluded.pours,
+    revenue_cents = revenue_cents + excluded.revenue_cents
+"""
+
+UPSERT_VERSION = """
+INSERT INTO meta (name, version) VALUES (?, ?)
+ON CONFLICT (name) DO UPDATE SET version = version + excluded.version
+"""
+
+# Start of the hour and day bucket containing a stored date
+BUCKET_STARTS = {
+    "hour": "substr({column}, 1, 13) || ':00:00.000000'",
+    "day": "substr({column}, 1, 10) || 'T00:00:00.000000'",
+}
+
+
+def encode_datetime(value: datetime) -> str:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="microseconds")
+
+
+def encode_value(column: str, value):
+    if value is None:
+        return None
+    if column in DATETIME_COLUMNS:
+        return encode_datetime(value)
+    if column in JSON_COLUMNS:
+        return json.dumps(value)
+    return value
+
+
+def encode_row(table: str, document: dict) -> tuple:
+    return tuple(encode_value(column, document.get(column)) for column in TABLES[table])
+
+
+def decode_row(row: sqlite3.Row) -> dict:
+    """Shape a row like the Mongo document, leaving NULL columns out"""
+    document = {}
+    for column in row.keys():
+        value = row[column]
+        if value is None:
+            continue
+        if column in DATETIME_COLUMNS:
+            value = datetime.fromisoformat(value)
+        elif column in JSON_COLUMNS:
+            value = json.loads(value)
+        document[column] = value
+    return document
+
+
+def insert_sql(table: str) -> str:
+    columns = TABLES[table]
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def history_where(history_filter: HistoryFilter, after: Optional[tuple]) -> tuple:
+    """WHERE clause and parameters for a history filter and keyset position"""
+    clauses = ["deleted_at IS NULL"]
+    params = []
+    if history_filter.guest_key is not None:
+        if history_filter.guest_prefix:
+            # A range over the key, which the guest_key index serves
+            clauses.append("guest_key >= ? AND guest_key < ?")
+            params += [history_filter.guest_key, history_filter.guest_key + "\U0010ffff"]
+        else:
+            clauses.append("guest_key = ?")
+            params.append(history_filter.guest_key)
+    if history_filter.drink_id:
+        clauses.append("drink_id = ?")
+        params.append(history_filter.drink_id)
+    if history_filter.start:
+        clauses.append("date >= ?")
+        params.append(encode_datetime(history_filter.start))
+    if history_filter.end:
+        clauses.append("date <= ?")
+        params.append(encode_datetime(history_filter.end))
+    if after:
+        date, document_id = encode_datetime(after[0]), after[1]
+        clauses.append("(date < ? OR (date = ? AND id < ?))")
+        params += [date, date, document_id]
+    return " WHERE " + " AND ".join(clauses), params
+
+
+def add_missing_columns(connection: sqlite3.Connection):
+    """Add columns introduced after a database file was created"""
+    for table, columns in TABLES.items():
+        existing = {row["name"] for row in connection.execute(f"PRAGMA table_info({table})")}
+        for column in columns:
+            if column not in existing:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+
+def write(connection: sqlite3.Connection, function, *args):
+    """Run function(connection, *args) in one transaction holding the write lock"""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        result = function(connection, *args)
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+    return result
+
+
+# Functions run on the SQLite thread return plain data, never a cursor: a
+# cursor collected on the event loop thread resets a cached statement the
+# SQLite thread may be running
+def fetch(connection: sqlite3.Connection, sql: str, params=()) -> list:
+    return connection.execute(sql, params).fetchall()
+
+
+def execute(connection: sqlite3.Connection, sql: str, params=()) -> int:
+    """Run one statement, returning the number of rows it changed"""
+    return connection.execute(sql, params).rowcount
+
+
+def execute_many(connection: sqlite3.Connection, sql: str, rows) -> int:
+    return connection.executemany(sql, rows).rowcount
+
+
+class SQLiteStore(Store):
+    """Tables in one SQLite database file"""
+
+    name = "sqlite"
+
+    def __init__(self, metrics):
+        super().__init__(metrics)
+        # The connection is only ever used from this single-thread executor
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.connection = sqlite3.connect(
+            SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False
+        )
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Durable across application crashes; WAL makes NORMAL safe against corruption
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.connection.close()
+
+    async def run(self, command: str, table: str, function, *args):
+        """Run function(connection, *args) on the SQLite thread and record it in the metrics"""
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, function, self.connection, *args
+            )
+        except Exception:
+            self.metrics.failed(command, table)
+            raise
+        documents = len(result) if isinstance(result, list) else 0
+        self.metrics.succeeded(command, table, time.perf_counter() - started, documents)
+        return result
+
+    async def select(self, table: str, sql: str, params=()) -> List[dict]:
+        rows = await self.run("select", table, fetch, sql, params)
+        return [decode_row(row) for row in rows]
+
+    async def ensure_schema(self) -> dict:
+        await self.run("create", "", lambda connection: connection.executescript(SCHEMA).close())
+        await self.run("alter", "", write, add_missing_columns)
+        report = {}
+        for table in TABLES:
+            rows = await self.run(
+                "select", "sqlite_master", fetch,
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? ORDER BY name", (table,)
+            )
+            report[table] = [row["name"] for row in rows]
+        return report
+
+    async def drop_all(self):
+        def drop(connection):
+            for table in TABLES:
+                connection.execute(f"DROP TABLE IF EXISTS {table}")
+        await self.run("drop", "", drop)
+
+    # Version counters
+    async def get_version(self, name: str) -> int:
+        rows = await self.run("select", "meta", fetch, "SELECT version FROM meta WHERE name = ?", (name,))
+        return rows[0]["version"] if rows else 0
+
+    async def bump_version(self, name: str, amount: int = 1) -> int:
+        def bump(connection):
+            connection.execute(UPSERT_VERSION, (name, amount))
+            return connection.execute("SELECT version FROM meta WHERE name = ?", (name,)).fetchone()["version"]
+        return await self.run("update", "meta", write, bump)
+
+    async def get_versions(self, names) -> dict:
+        names = list(names)
+        rows = await self.run(
+            "select", "meta", fetch,
+            f"SELECT name, version FROM meta WHERE name IN ({', '.join('?' * len(names))})", names
+        )
+        versions = dict.fromkeys(names, 0)
+        versions.update({row["name"]: row["version"] for row in rows})
+        return versions
+
+    async def bump_versions(self, names):
+        await self.run("update", "meta", write, execute_many, UPSERT_VERSION, [(name, 1) for name in names])
+
+    # Drinks
+    async def list_drinks(self) -> List[dict]:
+        return await self.select("drinks", "SELECT * FROM drinks WHERE deleted_at IS NULL")
+
+    async def find_drink(self, drink_id: str) -> Optional[dict]:
+        return await self.find("drinks", drink_id)
+
+    async def insert_drink(self, document: dict):
+        await self.insert("drinks", document)
+
+    async def update_drink(self, drink_id: str, fields: dict) -> Optional[dict]:
+        columns = [column for column in fields if column in TABLES["drinks"]]
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        params = [encode_value(column, fields[column]) for column in columns] + [drink_id]
+
+        def update(connection):
+            if connection.execute(
+                f"UPDATE drinks SET {assignments} WHERE id = ? AND deleted_at IS NULL", params
+            ).rowcount == 0:
+                return []
+            return fetch(connection, "SELECT * FROM drinks WHERE id = ?", (drink_id,))
+        rows = await self.run("update", "drinks", write, update)
+        return decode_row(rows[0]) if rows else None
+
+    async def delete_drink(self, drink_id: str, now: datetime) -> bool:
+        return await self.delete("drinks", drink_id, now) is not None
+
+    async def drinks_without_cents(self) -> List[dict]:
+        return await self.select("drinks", "SELECT * FROM drinks WHERE price_cents IS NULL")
+
+    # Transactions and payments
+    async def insert(self, kind: str, document: dict):
+        try:
+            await self.run("insert", kind, execute, insert_sql(kind), encode_row(kind, document))
+        except sqlite3.IntegrityError as exc:
+            raise DuplicateIdError(document["id"]) from exc
+
+    async def insert_many(self, kind: str, documents: List[dict]) -> dict:
+        sql = insert_sql(kind)
+        rows = [encode_row(kind, document) for document in documents]
+
+        def insert_rows(connection):
+            # Row by row inside one transaction, so a failing row does not stop the others
+            errors = {}
+            for index, row in enumerate(rows):
+                try:
+                    connection.execute(sql, row)
+                except sqlite3.IntegrityError as exc:
+                    duplicate = exc.sqlite_errorname == "SQLITE_CONSTRAINT_PRIMARYKEY"
+                    errors[index] = DUPLICATE_ID if duplicate else str(exc)
+            return errors
+        return await self.run("insert", kind, write, insert_rows)
+
+    async def find(self, kind: str, document_id: str, include_deleted: bool = False) -> Optional[dict]:
+        live = "" if include_deleted else " AND deleted_at IS NULL"
+        documents = await self.select(kind, f"SELECT * FROM {kind} WHERE id = ?{live}", (document_id,))
+        return documents[0] if documents else None
+
+    async def delete(self, kind: str, document_id: str, now: datetime) -> Optional[dict]:
+        def delete_row(connection):
+            where = "id = ? AND deleted_at IS NULL" + (" AND pending IS NULL" if "pending" in TABLES[kind] else "")
+            rows = fetch(connection, f"SELECT * FROM {kind} WHERE {where}", (document_id,))
+            connection.execute(f"UPDATE {kind} SET deleted_at = ? WHERE {where}", (encode_datetime(now), document_id))
+            return rows
+        rows = await self.run("update", kind, write, delete_row)
+        return decode_row(rows[0]) if rows else None
+
+    async def claim_pending(self, kind: str, document_ids: List[str], now: datetime, until: datetime) -> tuple:
+        now, until = encode_datetime(now), encode_datetime(until)
+
+        def claim(connection):
+            claimed = []
+            held = []
+            for document_id in document_ids:
+                sql = f"SELECT * FROM {kind} WHERE id = ? AND pending IS NOT NULL"
+                for row in fetch(connection, sql, (document_id,)):
+                    if row["pending_until"] <= now:
+                        claimed.append(row)
+                    else:
+                        held.append(row["id"])
+            connection.executemany(
+                f"UPDATE {kind} SET pending_until = ? WHERE id = ?", [(until, row["id"]) for row in claimed]
+            )
+            return claimed, held
+        claimed, held = await self.run("update", kind, write, claim)
+        return [{**decode_row(row), "pending_until": datetime.fromisoformat(until)} for row in claimed], held
+
+    async def clear_pending(self, kind: str, document_ids: List[str]):
+        await self.run(
+            "update", kind, write, execute_many,
+            f"UPDATE {kind} SET pending = NULL, pending_until = NULL WHERE id = ?",
+            [(document_id,) for document_id in document_ids]
+        )
+
+    async def release_pending(self, kind: str, document_ids: List[str], now: datetime, step: str):
+        params = [(step, encode_datetime(now), document_id) for document_id in document_ids]
+        await self.run(
+            "update", kind, write, execute_many,
+            f"UPDATE {kind} SET pending = ?, pending_until = ? WHERE id = ? AND pending IS NOT NULL", params
+        )
+
+    async def expired_pending(self, kind: str, now: datetime) -> List[str]:
+        rows = await self.run(
+            "select", kind, fetch,
+            f"SELECT id FROM {kind} WHERE pending IS NOT NULL AND pending_until <= ?", (encode_datetime(now),)
+        )
+        return [row["id"] for row in rows]
+
+    async def history_page(self, kind: str, history_filter: HistoryFilter, limit: Optional[int],
+                           after: Optional[tuple] = None, fields: Optional[tuple] = None) -> List[dict]:
+        columns = ", ".join(field for field in fields if field in TABLES[kind]) if fields else "*"
+        where, params = history_where(history_filter, after)
+        sql = f"SELECT {columns} FROM {kind}{where} ORDER BY date DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return await self.select(kind, sql, params)
+
+    async def iter_history(self, kind: str, history_filter: HistoryFilter, batch_size: int) -> AsyncIterator[dict]:
+        # Page by keyset so no statement stays open between batches
+        after = None
+        while True:
+            page = await self.history_page(kind, history_filter, batch_size, after)
+            for document in page:
+                yield document
+            if len(page) < batch_size:
+                return
+            after = (page[-1]["date"], page[-1]["id"])
+
+    async def sum_by_guest(self, kind: str, field: str, guest_name: Optional[str] = None) -> dict:
+        if field not in TABLES[kind]:
+            raise ValueError(f"{kind} has no field {field}")
+        # A pending document's amount is not in the ledger yet
+        sql = f"SELECT guest_name, SUM({field}) AS total FROM {kind} WHERE deleted_at IS NULL AND pending IS NULL"
+        params = ()
+        if guest_name:
+            sql += " AND guest_name = ?"
+            params = (guest_name,)
+        rows = await self.run("select", kind, fetch, sql + " GROUP BY guest_name", params)
+        return {row["guest_name"]: row["total"] or 0 for row in rows}
+
+    async def backfill_guest_keys(self, kind: str, normalize, batch_size: int = 1000) -> int:
+        def backfill(connection):
+            rows = fetch(connection, f"SELECT id, guest_name FROM {kind} WHERE guest_key IS NULL")
+            connection.executemany(
+                f"UPDATE {kind} SET guest_key = ? WHERE id = ?",
+                [(normalize(row["guest_name"]), row["id"]) for row in rows]
+            )
+            return len(rows)
+        return await self.run("update", kind, write, backfill)
+
+    async def store_cents(self, kind: str, dollars: str, cents: str) -> int:
+        return await self.run(
+            "update", kind, write, execute,
+            f"UPDATE {kind} SET {cents} = CAST(ROUND({dollars} * 100) AS INTEGER) "
+            f"WHERE {cents} IS NULL AND {dollars} IS NOT NULL"
+        )
+
+    async def archive(self, kind: str, guest_names: List[str], before: datetime, field: str) -> tuple:
+        archive = ARCHIVES[kind]
+        columns = ", ".join(TABLES[kind])
+        before = encode_datetime(before)
+
+        def move(connection, where: str, params: list) -> int:
+            # The archive's primary key makes a repeated copy a no-op
+            connection.execute(
+                f"INSERT OR IGNORE INTO {archive} ({columns}) SELECT {columns} FROM {kind} WHERE {where}", params
+            )
+            return connection.execute(f"DELETE FROM {kind} WHERE {where}", params).rowcount
+
+        def move_tombstones(connection):
+            return move(connection, "deleted_at < ?", [before])
+
+        def move_guests(connection, names):
+            # Documents written while the job runs stay, and so does their ledger entry
+            where = (f"guest_name IN ({', '.join('?' * len(names))}) AND pending IS NULL "
+                     "AND (created_at < ? OR created_at IS NULL)")
+            params = list(names) + [before]
+            rows = fetch(
+                connection,
+                f"SELECT guest_name, SUM({field}) AS total FROM {kind} WHERE {where} AND deleted_at IS NULL "
+                "GROUP BY guest_name",
+                params
+            )
+            return move(connection, where, params), rows
+
+        moved = await self.run("delete", kind, write, move_tombstones)
+        totals = {}
+        # One write transaction per batch of guests, so other workers' writes get a turn
+        for offset in range(0, len(guest_names), GUEST_NAMES_PER_STATEMENT):
+            count, rows = await self.run(
+                "delete", kind, write, move_guests, guest_names[offset:offset + GUEST_NAMES_PER_STATEMENT]
+            )
+            moved += count
+            totals.update({row["guest_name"]: row["total"] or 0 for row in rows})
+        return moved, totals
+
+    # Guest balance ledger
+    @staticmethod
+    def upsert_guest(connection, guest_name, guest_key, owed_cents, paid_cents, now) -> Optional[sqlite3.Row]:
+        """Add to a guest's totals, returning the row before the update"""
+        before = connection.execute(
+            "SELECT * FROM guests WHERE guest_name = ?", (guest_name,)
+        ).fetchone()
+        now = encode_datetime(now)
+        connection.execute(UPSERT_GUEST, (guest_name, guest_key, owed_cents, paid_cents, now, now))
+        return before
+
+    async def adjust_guest(self, guest_name: str, guest_key: str, owed_cents: int, paid_cents: int,
+                           now: datetime) -> Optional[dict]:
+        def adjust(connection):
+            before = self.upsert_guest(connection, guest_name, guest_key, owed_cents, paid_cents, now)
+            return [before] if before else []
+        rows = await self.run("update", "guests", write, adjust)
+        return decode_row(rows[0]) if rows else None
+
+    async def adjust_guests(self, adjustments: List[tuple], now: datetime) -> tuple:
+        def adjust(connection):
+            created = []
+            rows = []
+            for guest_name, guest_key, owed_cents, paid_cents in adjustments:
+                if self.upsert_guest(connection, guest_name, guest_key, owed_cents, paid_cents, now) is None:
+                    created.append(guest_name)
+                rows += fetch(connection, "SELECT * FROM guests WHERE guest_name = ?", (guest_name,))
+            return created, rows
+        created, rows = await self.run("update", "guests", write, adjust)
+        return created, [decode_row(row) for row in rows]
+
+    async def list_guests(self) -> List[dict]:
+        return await self.select("guests", "SELECT guest_name, owed_cents, paid_cents, rev FROM guests")
+
+    async def find_guests(self, guest_names: List[str]) -> List[dict]:
+        def find(connection):
+            rows = []
+            for offset in range(0, len(guest_names), GUEST_NAMES_PER_STATEMENT):
+                names = guest_names[offset:offset + GUEST_NAMES_PER_STATEMENT]
+                rows += fetch(
+                    connection,
+                    "SELECT guest_name, owed_cents, paid_cents, rev FROM guests "
+                    f"WHERE guest_name IN ({', '.join('?' * len(names))})",
+                    names
+                )
+            return rows
+        return [decode_row(row) for row in await self.run("select", "guests", find)]
+
+    async def replace_guests(self, documents: List[dict]):
+        rows = [encode_row("guests", document) for document in documents]
+
+        def replace(connection):
+            connection.execute("DELETE FROM guests")
+            connection.executemany(insert_sql("guests"), rows)
+        await self.run("insert", "guests", write, replace)
+
+    async def guests_created_since(self, since: Optional[datetime]) -> List[dict]:
+        sql = "SELECT guest_name, guest_key, created_at FROM guests"
+        params = ()
+        if since:
+            sql += " WHERE created_at >= ?"
+            params = (encode_datetime(since),)
+        return await self.select("guests", sql, params)
+
+    async def settled_guests(self, before: datetime) -> List[str]:
+        rows = await self.run(
+            "select", "guests", fetch,
+            "SELECT guest_name FROM guests WHERE owed_cents = paid_cents AND updated_at < ?",
+            (encode_datetime(before),)
+        )
+        return [row["guest_name"] for row in rows]
+
+    async def remove_empty_guests(self, guest_names: List[str]) -> int:
+        def remove(connection):
+            removed = 0
+            for offset in range(0, len(guest_names), GUEST_NAMES_PER_STATEMENT):
+                names = guest_names[offset:offset + GUEST_NAMES_PER_STATEMENT]
+                removed += connection.execute(
+                    f"DELETE FROM guests WHERE guest_name IN ({', '.join('?' * len(names))}) "
+                    "AND owed_cents = 0 AND paid_cents = 0",
+                    names
+                ).rowcount
+            return removed
+        return await self.run("delete", "guests", write, remove)
+
+    # Sales rollups
+    async def adjust_rollups(self, deltas: dict):
+        rows = [
+            (granularity, encode_datetime(start), drink_id, guest_name, pours, revenue_cents)
+            for (granularity, start, drink_id, guest_name), (pours, revenue_cents) in deltas.items()
+        ]
+        await self.run("update", "sales_rollups", write, execute_many, UPSERT_ROLLUP, rows)
+
+    async def rebuild_rollups(self, granularities: tuple) -> int:
+        def rebuild(connection):
+            connection.execute("DELETE FROM sales_rollups")
+            written = 0
+            for granularity in granularities:
+                written += connection.execute(
+                    "INSERT INTO sales_rollups (granularity, start, drink_id, guest_name, pours, revenue_cents) "
+                    f"SELECT ?, {BUCKET_STARTS[granularity].format(column='date')}, drink_id, guest_name, "
+                    "COUNT(*), SUM(price_cents) FROM ("
+                    "SELECT date, drink_id, guest_name, price_cents FROM transactions "
+                    "WHERE deleted_at IS NULL AND (pending IS NULL OR pending <> 'rollups') "
+                    f"UNION ALL SELECT date, drink_id, guest_name, price_cents FROM {ARCHIVES['transactions']} "
+                    "WHERE deleted_at IS NULL) GROUP BY 2, 3, 4",
+                    (granularity,)
+                ).rowcount
+            return written
+        return await self.run("insert", "sales_rollups", write, rebuild)
+
+    async def sales_report(self, granularity: str, interval: str, group_by: Optional[str],
+                           start: Optional[datetime], end: Optional[datetime],
+                           drink_id: Optional[str], guest_name: Optional[str]) -> List[dict]:
+        clauses = ["granularity = ?"]
+        params = [granularity]
+        for clause, value in (("start >= ?", start), ("start <= ?", end)):
+            if value:
+                clauses.append(clause)
+                params.append(encode_datetime(value))
+        for column, value in (("drink_id", drink_id), ("guest_name", guest_name)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+
+        group = []
+        if interval == granularity:
+            group.append("start")
+        elif interval == "day":
+            group.append(f"{BUCKET_STARTS['day'].format(column='start')} AS start")
+        if group_by == "drink":
+            group.append("drink_id")
+        elif group_by == "guest":
+            group.append("guest_name")
+
+        columns = group + ["SUM(pours) AS pours", "SUM(revenue_cents) AS revenue_cents"]
+        sql = f"SELECT {', '.join(columns)} FROM sales_rollups WHERE {' AND '.join(clauses)}"
+        if group:
+            sql += f" GROUP BY {', '.join(str(position) for position in range(1, len(group) + 1))}"
+        # Buckets whose transactions were all deleted remain with zero pours
+        order = "start, revenue_cents DESC" if interval != "total" else "revenue_cents DESC"
+        return await self.select(
+            "sales_rollups", f"SELECT * FROM ({sql}) WHERE pours != 0 ORDER BY {order}", params
+        )
+
+    # Change events
+    async def append_events(self, events: List[dict]):
+        # A NULL seq takes the next integer key under the write lock, so events
+        # become visible to readers in seq order, without gaps
+        rows = [encode_row("events", {**event, "seq": None}) for event in events]
+
+        def append(connection):
+            connection.executemany(insert_sql("events"), rows)
+            connection.execute("DELETE FROM events WHERE seq <= (SELECT MAX(seq) FROM events) - ?", (EVENTS_KEPT,))
+        await self.run("insert", "events", write, append)
+
+    async def latest_event_seq(self) -> int:
+        rows = await self.run("select", "events", fetch, "SELECT MAX(seq) AS seq FROM events")
+        return rows[0]["seq"] or 0
+
+    async def events_after(self, seq: int) -> AsyncIterator[dict]:
+        while True:
+            events = await self.select(
+                "events", "SELECT * FROM events WHERE seq > ? ORDER BY seq LIMIT ?", (seq, EVENTS_PAGE_SIZE)
+            )
+            for event in events:
+                seq = event["seq"]
+                yield event
+            if len(events) < EVENTS_PAGE_SIZE:
+                return
+
+    async def tail_events(self, seq: int) -> AsyncIterator[dict]:
+        while True:
+            async for event in self.events_after(seq):
+                seq = event["seq"]
+                yield event
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
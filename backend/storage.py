@@ -0,0 +1,278 @@
+"""
+Storage backends for the BarTab API
+
+server.py keeps the business rules (pricing, the balance ledger, rollups,
+events) and reaches the database only through a Store. Two stores exist:
+
+    mongo   MongoStore in mongo_store.py, the default
+    sqlite  SQLiteStore in sqlite_store.py, an embedded database file for
+            single-bar installs that do not want to run mongod
+
+STORAGE_BACKEND picks one. Stores hand back documents as plain dicts shaped
+like the Mongo documents (without _id); datetimes are naive UTC.
+
+Deleting a drink, transaction or payment only sets deleted_at on it; every
+read skips such tombstones. The archive job moves them, and the history of
+settled guests, into the ARCHIVES collections, which keep the same shape and
+can be read through the same history methods.
+
+A new transaction or payment is inserted with pending naming the first of
+its side effects (rollups, the balance ledger) still to apply, and
+pending_until leasing it to the request applying them. The marker moves on
+as each one is applied and is removed after the last. History sums and
+rollup rebuilds leave out what a document has not applied yet, and pending
+documents are neither deleted nor archived.
+"""
+
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+
+# Where archived transactions and payments go
+ARCHIVES = {"transactions": "transactions_archive", "payments": "payments_archive"}
+
+
+class DuplicateIdError(Exception):
+    """A document with the same id already exists"""
+
+
+# The insert_many error message for a document whose id is already stored
+DUPLICATE_ID = "Duplicate id"
+
+
+class HistoryFilter:
+    """Filters shared by the history lists and the CSV export.
+
+    guest_key matches the normalized guest name exactly, or as a prefix when
+    guest_prefix is set; start and end bound the date inclusively.
+    """
+
+    def __init__(self, guest_key: Optional[str] = None, guest_prefix: bool = False,
+                 drink_id: Optional[str] = None, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None):
+        self.guest_key = guest_key
+        self.guest_prefix = guest_prefix
+        self.drink_id = drink_id
+        self.start = start
+        self.end = end
+
+
+class Store(ABC):
+    """Database operations used by server.py, manage.py and benchmark.py.
+
+    metrics receives succeeded(command, collection, seconds, documents) and
+    failed(command, collection) for every command a store runs.
+    """
+
+    name = None
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @abstractmethod
+    def close(self):
+        ...
+
+    @abstractmethod
+    async def ensure_schema(self) -> dict:
+        """Create missing collections and indexes, returning {collection: [index names]}"""
+
+    @abstractmethod
+    async def drop_all(self):
+        ...
+
+    # Version counters
+    @abstractmethod
+    async def get_version(self, name: str) -> int:
+        ...
+
+    @abstractmethod
+    async def bump_version(self, name: str, amount: int = 1) -> int:
+        """Increment a counter, returning the new version"""
+
+    @abstractmethod
+    async def get_versions(self, names) -> dict:
+        ...
+
+    @abstractmethod
+    async def bump_versions(self, names):
+        ...
+
+    # Drinks
+    @abstractmethod
+    async def list_drinks(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def find_drink(self, drink_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def insert_drink(self, document: dict):
+        ...
+
+    @abstractmethod
+    async def update_drink(self, drink_id: str, fields: dict) -> Optional[dict]:
+        """Set fields on a drink, returning the updated drink or None if it does not exist"""
+
+    @abstractmethod
+    async def delete_drink(self, drink_id: str, now: datetime) -> bool:
+        """Tombstone a drink, returning False if there was no live drink to delete"""
+
+    @abstractmethod
+    async def drinks_without_cents(self) -> List[dict]:
+        ...
+
+    # Transactions and payments
+    @abstractmethod
+    async def insert(self, kind: str, document: dict):
+        """Insert one document, raising DuplicateIdError if its id is taken"""
+
+    @abstractmethod
+    async def insert_many(self, kind: str, documents: List[dict]) -> dict:
+        """Insert unordered into any collection, returning {index: error message} for failures.
+
+        The message is DUPLICATE_ID for a document whose id is already stored.
+        """
+
+    @abstractmethod
+    async def find(self, kind: str, document_id: str, include_deleted: bool = False) -> Optional[dict]:
+        """A document by id; tombstones only when include_deleted is set"""
+
+    @abstractmethod
+    async def delete(self, kind: str, document_id: str, now: datetime) -> Optional[dict]:
+        """Tombstone a document, returning it or None if there was no live, applied document"""
+
+    @abstractmethod
+    async def claim_pending(self, kind: str, document_ids: List[str], now: datetime, until: datetime) -> tuple:
+        """Lease to until the pending documents among document_ids whose lease expired by now.
+
+        Returns (the documents leased, ids of the pending documents leased to someone else).
+        """
+
+    @abstractmethod
+    async def clear_pending(self, kind: str, document_ids: List[str]):
+        """Clear the documents' marker and lease once all their side effects are applied"""
+
+    @abstractmethod
+    async def release_pending(self, kind: str, document_ids: List[str], now: datetime, step: str):
+        """Record the step the documents failed at and end their lease at now.
+
+        Another attempt can then take them over and finish them from that step.
+        """
+
+    @abstractmethod
+    async def expired_pending(self, kind: str, now: datetime) -> List[str]:
+        """Ids of the pending documents whose lease expired by now"""
+
+    @abstractmethod
+    async def history_page(self, kind: str, history_filter: HistoryFilter, limit: Optional[int],
+                           after: Optional[tuple] = None, fields: Optional[tuple] = None) -> List[dict]:
+        """Documents newest first, starting after the (date, id) position when given"""
+
+    @abstractmethod
+    def iter_history(self, kind: str, history_filter: HistoryFilter, batch_size: int) -> AsyncIterator[dict]:
+        ...
+
+    @abstractmethod
+    async def sum_by_guest(self, kind: str, field: str, guest_name: Optional[str] = None) -> dict:
+        """Sum an integer cents field per guest, returning {guest_name: total}"""
+
+    @abstractmethod
+    async def backfill_guest_keys(self, kind: str, normalize, batch_size: int = 1000) -> int:
+        ...
+
+    @abstractmethod
+    async def store_cents(self, kind: str, dollars: str, cents: str) -> int:
+        """Derive a cents field from a dollar field where it is missing"""
+
+    @abstractmethod
+    async def archive(self, kind: str, guest_names: List[str], before: datetime, field: str) -> tuple:
+        """Move history into ARCHIVES[kind]: the guests' documents created before
+        before, and tombstones deleted before it.
+
+        Returns (documents moved, {guest_name: sum of field over the live documents moved}).
+        """
+
+    # Guest balance ledger
+    @abstractmethod
+    async def adjust_guest(self, guest_name: str, guest_key: str, owed_cents: int, paid_cents: int,
+                           now: datetime) -> Optional[dict]:
+        """Add to one guest's totals, returning the totals before, or None if the guest was created"""
+
+    @abstractmethod
+    async def adjust_guests(self, adjustments: List[tuple], now: datetime) -> tuple:
+        """Apply (guest_name, guest_key, owed_cents, paid_cents) adjustments.
+
+        Returns (names of guests created, ledger documents of the guests touched).
+        """
+
+    @abstractmethod
+    async def list_guests(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def find_guests(self, guest_names: List[str]) -> List[dict]:
+        """Ledger documents of the named guests that exist"""
+
+    @abstractmethod
+    async def replace_guests(self, documents: List[dict]):
+        ...
+
+    @abstractmethod
+    async def guests_created_since(self, since: Optional[datetime]) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def settled_guests(self, before: datetime) -> List[str]:
+        """Names of guests with a zero balance whose ledger has not changed since before"""
+
+    @abstractmethod
+    async def remove_empty_guests(self, guest_names: List[str]) -> int:
+        """Delete the guests' ledger documents whose totals are both zero"""
+
+    # Sales rollups
+    @abstractmethod
+    async def adjust_rollups(self, deltas: dict):
+        """Add {(granularity, start, drink_id, guest_name): (pours, revenue_cents)} to the rollups"""
+
+    @abstractmethod
+    async def rebuild_rollups(self, granularities: tuple) -> int:
+        ...
+
+    @abstractmethod
+    async def sales_report(self, granularity: str, interval: str, group_by: Optional[str],
+                           start: Optional[datetime], end: Optional[datetime],
+                           drink_id: Optional[str], guest_name: Optional[str]) -> List[dict]:
+        """Rows of pours and revenue_cents, keyed by start, drink_id or guest_name as grouped"""
+
+    # Change events
+    @abstractmethod
+    async def append_events(self, events: List[dict]):
+        """Store events of type, data and created_at, numbering them with an increasing seq"""
+
+    @abstractmethod
+    async def latest_event_seq(self) -> int:
+        """The seq of the event stored last, or 0"""
+
+    @abstractmethod
+    def events_after(self, seq: int) -> AsyncIterator[dict]:
+        """Stored events after the one numbered seq, in the order they were stored"""
+
+    @abstractmethod
+    def tail_events(self, seq: int) -> AsyncIterator[dict]:
+        """Events after the one numbered seq as they are stored; may end, and the caller resumes"""
+
+
+def open_store(metrics) -> Store:
+    """Create the store STORAGE_BACKEND selects"""
+    if STORAGE_BACKEND == "mongo":
+        from mongo_store import MongoStore
+        return MongoStore(metrics)
+    if STORAGE_BACKEND == "sqlite":
+        from sqlite_store import SQLiteStore
+        return SQLiteStore(metrics)
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; use mongo or sqlite")
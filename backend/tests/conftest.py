@@ -0,0 +1,71 @@
+"""
+Test setup: the API runs in-process, once on the SQLite store and once on
+MongoDB, with a fresh database per test, and is called through httpx's ASGI
+transport. The MongoDB runs are skipped when no mongod answers at MONGO_URL.
+"""
+
+import functools
+import os
+import sys
+import uuid
+
+import httpx
+import pytest
+
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ.pop("WRITE_BEHIND_DIR", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mongo_store  # noqa: E402
+import server  # noqa: E402
+import sqlite_store  # noqa: E402
+import storage  # noqa: E402
+
+
+@functools.lru_cache(maxsize=None)
+def mongo_reachable() -> bool:
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    client = MongoClient(mongo_store.MONGO_URL, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(params=["sqlite", "mongo"])
+def backend(request):
+    """The store the client's server runs on; parametrize it to run a test on one store only"""
+    return request.param
+
+
+@pytest.fixture
+async def client(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", backend)
+    if backend == "mongo":
+        if not mongo_reachable():
+            pytest.skip(f"no mongod at {mongo_store.MONGO_URL}")
+        monkeypatch.setattr(mongo_store, "MONGO_DB_NAME", f"bartab_test_{uuid.uuid4().hex[:12]}")
+    else:
+        monkeypatch.setattr(sqlite_store, "SQLITE_PATH", str(tmp_path / "bartab.db"))
+    # Fresh caches, since this worker's would outlive the previous test's database
+    monkeypatch.setattr(server, "drink_catalog", server.DrinkCatalog(server.DRINK_CATALOG_REFRESH_SECONDS))
+    monkeypatch.setattr(server, "guest_directory", server.GuestDirectory(server.GUEST_DIRECTORY_REFRESH_SECONDS))
+    await server.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+    finally:
+        if backend == "mongo":
+            await server.store.drop_all()
+        await server.app.router.shutdown()
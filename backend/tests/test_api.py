@@ -0,0 +1,293 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import server
+from journal import Journal, Segment
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_drink(client, **fields):
+    drink = {"name": "Whiskey", "base_cost": 30, "total_volume": 750, **fields}
+    response = await client.post("/api/drinks", json=drink)
+    assert response.status_code == 200
+    return response.json()
+
+
+async def ledger(client) -> dict:
+    response = await client.get("/api/guests/balances")
+    return {balance["guest_name"]: balance for balance in response.json()}
+
+
+def journal_line(drink: dict, guest_name: str, document_id: str) -> str:
+    document = server.new_transaction_document(
+        server.TransactionCreate(guest_name=guest_name, drink_id=drink["id"]), drink, datetime.now(), document_id
+    )
+    return json.dumps(server.journal_record(document)) + "\n"
+
+
+# Pricing
+async def test_drink_price_rounds_half_cents_up(client):
+    drink = await create_drink(client, base_cost=0.125, total_volume=1, volume_unit="oz", volume_served=1)
+    assert drink["price_cents"] == 13
+    assert drink["calculated_price"] == 0.13
+
+    transaction = (await client.post("/api/transactions", json={"guest_name": "Ann", "drink_id": drink["id"]})).json()
+    assert transaction["price_cents"] == 13
+
+
+async def test_balances_add_up_in_whole_cents(client):
+    drink = await create_drink(client, base_cost=0.1, total_volume=1, volume_unit="oz", volume_served=1)
+    for _ in range(3):
+        await client.post("/api/transactions", json={"guest_name": "Ann", "drink_id": drink["id"]})
+        await client.post("/api/payments", json={"guest_name": "Ann", "amount": 0.1})
+
+    balance = (await ledger(client))["Ann"]
+    assert balance["total_owed"] == 0.3
+    assert balance["total_paid"] == 0.3
+    assert balance["balance"] == 0
+
+
+async def test_guest_balance_carries_the_ledger_revision(client):
+    drink = await create_drink(client)
+    for _ in range(2):
+        await client.post("/api/transactions", json={"guest_name": "Ann", "drink_id": drink["id"]})
+
+    balance = (await client.get("/api/guests/Ann/balance")).json()
+    assert balance["rev"] == (await ledger(client))["Ann"]["rev"] == 2
+    assert balance["total_owed"] == round(2 * drink["calculated_price"], 2)
+    assert (await client.get("/api/guests/Nobody/balance")).json()["rev"] == 0
+
+
+# History pages
+async def test_transaction_pages_follow_the_cursor(client):
+    drink = await create_drink(client)
+    date = "2026-03-01T20:00:00"
+    created = []
+    for _ in range(5):
+        response = await client.post("/api/transactions", json={"guest_name": "Ann", "drink_id": drink["id"], "date": date})
+        created.append(response.json()["id"])
+
+    pages = []
+    params = {"limit": 2}
+    while True:
+        response = await client.get("/api/transactions", params=params)
+        pages.append([transaction["id"] for transaction in response.json()])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+        # A newer transaction written between pages does not shift the later ones
+        await client.post("/api/transactions", json={"guest_name": "Bob", "drink_id": drink["id"]})
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    # Equal dates are ordered by id, newest first
+    assert [document_id for page in pages for document_id in page] == sorted(created, reverse=True)
+
+
+async def test_invalid_cursor_is_rejected(client):
+    response = await client.get("/api/transactions", params={"limit": 2, "cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+# Bulk import
+async def test_import_reports_row_errors_in_row_order(client):
+    drink = await create_drink(client)
+    body = "\n".join([
+        "guest_name,drink_id",
+        f"Ann,{drink['id']}",
+        "Bob,no-such-drink",
+        "Cy,",
+        f"Dee,{drink['id']}",
+    ])
+    response = await client.post("/api/import/transactions", params={"format": "csv"}, content=body)
+
+    result = response.json()
+    assert result["imported"] == 2
+    assert result["failed"] == 2
+    # Row 2 fails when its batch is inserted, after row 3 failed validation
+    assert [error["row"] for error in result["errors"]] == [2, 3]
+    assert result["errors"][0]["error"] == "Drink not found"
+    assert set(await ledger(client)) == {"Ann", "Dee"}
+
+
+async def test_import_reads_quotes_the_way_csv_does(client):
+    body = "\n".join([
+        "name,base_cost,total_volume",
+        'Tall 16" glass,20,750',
+        '"Port,\nten year",40,750',
+        "Ale,3,12",
+    ])
+    response = await client.post("/api/import/drinks", params={"format": "csv"}, content=body)
+
+    assert response.json()["imported"] == 3
+    drinks = (await client.get("/api/drinks")).json()
+    assert {drink["name"] for drink in drinks} == {'Tall 16" glass', "Port,\nten year", "Ale"}
+
+
+async def test_import_reports_an_unterminated_quoted_field(client):
+    body = "name,base_cost,total_volume\nAle,3,12\n\"Port,40,750\nStout,4,12"
+    response = await client.post("/api/import/drinks", params={"format": "csv"}, content=body)
+
+    result = response.json()
+    assert result["imported"] == 1
+    assert result["errors"] == [{"row": 2, "error": "Unterminated quoted field"}]
+
+
+# Idempotent creates
+async def test_retried_create_returns_the_first_transaction(client):
+    drink = await create_drink(client)
+    headers = {"Idempotency-Key": "round-1"}
+    order = {"guest_name": "Ann", "drink_id": drink["id"]}
+
+    first = await client.post("/api/transactions", json=order, headers=headers)
+    retry = await client.post("/api/transactions", json=order, headers=headers)
+    assert retry.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+    assert (await ledger(client))["Ann"]["total_owed"] == drink["calculated_price"]
+
+    other = await client.post("/api/transactions", json={**order, "guest_name": "Bob"}, headers=headers)
+    assert other.status_code == 422
+
+    await client.delete(f"/api/transactions/{first.json()['id']}")
+    after_delete = await client.post("/api/transactions", json=order, headers=headers)
+    assert after_delete.status_code == 410
+
+
+async def test_retry_applies_a_payment_whose_ledger_update_failed(client, monkeypatch):
+    headers = {"Idempotency-Key": "pay-1"}
+    payment = {"guest_name": "Ann", "amount": 12.5}
+
+    async def ledger_down(*args, **kwargs):
+        raise RuntimeError("ledger unavailable")
+    adjust_guests = server.store.adjust_guests
+    monkeypatch.setattr(server.store, "adjust_guests", ledger_down)
+    with pytest.raises(RuntimeError):
+        await client.post("/api/payments", json=payment, headers=headers)
+    monkeypatch.setattr(server.store, "adjust_guests", adjust_guests)
+
+    retry = await client.post("/api/payments", json=payment, headers=headers)
+    assert retry.status_code == 200
+    assert (await ledger(client))["Ann"]["total_paid"] == 12.5
+
+    await client.post("/api/payments", json=payment, headers=headers)
+    assert (await ledger(client))["Ann"]["total_paid"] == 12.5
+    assert await server.verify_guest_balances() == []
+
+
+# Settling tabs
+async def test_settle_pays_each_named_guest_once(client):
+    drink = await create_drink(client)
+    for guest_name in ("Ann", "Ann", "Bob"):
+        await client.post("/api/transactions", json={"guest_name": guest_name, "drink_id": drink["id"]})
+    await client.post("/api/payments", json={"guest_name": "Ann", "amount": 1})
+
+    request = {"guest_names": ["Ann", "Nobody"]}
+    settled = (await client.post("/api/guests/settle", json=request, headers={"Idempotency-Key": "s1"})).json()
+    assert settled["settled"] == 1
+    assert settled["amount"] == round(2 * drink["calculated_price"] - 1, 2)
+    assert [balance["balance"] for balance in settled["balances"]] == [0]
+
+    retry = (await client.post("/api/guests/settle", json=request, headers={"Idempotency-Key": "s1"})).json()
+    assert retry["settled"] == 0
+
+    balances = await ledger(client)
+    assert balances["Ann"]["balance"] == 0
+    assert balances["Bob"]["balance"] == drink["calculated_price"]
+
+
+async def test_settle_needs_guests(client):
+    response = await client.post("/api/guests/settle", json={})
+    assert response.status_code == 422
+
+
+# Write-behind journal
+async def test_replay_writes_orphaned_journal_segments_once(client, tmp_path):
+    drink = await create_drink(client)
+    lines = journal_line(drink, "Ann", "orphan-1") + journal_line(drink, "Ann", "orphan-2")
+    # The torn last line was never acknowledged, so it is dropped
+    (tmp_path / "transactions-1-dead-0.jsonl").write_text(lines + '{"id": "orph')
+
+    assert await server.replay_journal(Journal(str(tmp_path), "transactions")) == 2
+    assert not (tmp_path / "transactions-1-dead-0.jsonl").exists()
+
+    (tmp_path / "transactions-1-dead-1.jsonl").write_text(lines)
+    assert await server.replay_journal(Journal(str(tmp_path), "transactions")) == 0
+    assert (await ledger(client))["Ann"]["total_owed"] == round(2 * drink["calculated_price"], 2)
+
+
+async def test_journal_flush_retries_side_effects_after_a_failure(client, tmp_path, monkeypatch):
+    drink = await create_drink(client)
+    path = tmp_path / "transactions-1-dead-0.jsonl"
+    path.write_text(journal_line(drink, "Ann", "journaled-1"))
+    segment = Segment.claim(str(path))
+
+    async def ledger_down(*args, **kwargs):
+        raise RuntimeError("ledger unavailable")
+    adjust_guests = server.store.adjust_guests
+    monkeypatch.setattr(server.store, "adjust_guests", ledger_down)
+    with pytest.raises(RuntimeError):
+        await server.flush_journal_segment(segment)
+    monkeypatch.setattr(server.store, "adjust_guests", adjust_guests)
+    assert path.exists()
+
+    assert await server.flush_journal_segment(segment) == (1, True)
+    assert not path.exists()
+    assert (await ledger(client))["Ann"]["total_owed"] == drink["calculated_price"]
+    assert await server.verify_guest_balances() == []
+
+
+async def test_write_behind_retry_returns_the_journaled_transaction(client, tmp_path, monkeypatch):
+    drink = await create_drink(client)
+    write_behind = server.TransactionWriteBehind(str(tmp_path))
+    monkeypatch.setattr(server, "write_behind", write_behind)
+    await write_behind.start()
+    headers = {"Idempotency-Key": "round-1"}
+    order = {"guest_name": "Ann", "drink_id": drink["id"]}
+    try:
+        first = (await client.post("/api/transactions", json=order, headers=headers)).json()
+        journaled = await client.post("/api/transactions", json=order, headers=headers)
+        assert journaled.json() == first
+        other = await client.post("/api/transactions", json={**order, "guest_name": "Bob"}, headers=headers)
+        assert other.status_code == 422
+
+        await write_behind.flush()
+        stored = (await client.post("/api/transactions", json=order, headers=headers)).json()
+        # MongoDB keeps dates to the millisecond
+        assert {**stored, "date": stored["date"][:23], "created_at": stored["created_at"][:23]} == \
+            {**first, "date": first["date"][:23], "created_at": first["created_at"][:23]}
+        other = await client.post("/api/transactions", json={**order, "guest_name": "Bob"}, headers=headers)
+        assert other.status_code == 422
+    finally:
+        await write_behind.stop()
+        monkeypatch.setattr(server, "write_behind", None)
+
+    assert set(await ledger(client)) == {"Ann"}
+    assert (await ledger(client))["Ann"]["total_owed"] == drink["calculated_price"]
+
+
+async def test_journal_segment_with_a_rejected_transaction_is_set_aside(client, tmp_path, monkeypatch):
+    drink = await create_drink(client)
+    path = tmp_path / "transactions-1-dead-0.jsonl"
+    path.write_text(journal_line(drink, "Ann", "journaled-1") + journal_line(drink, "Bob", "journaled-2"))
+    segment = Segment.claim(str(path))
+
+    insert_many = server.store.insert_many
+    async def reject_first(kind, documents):
+        errors = await insert_many(kind, documents[1:])
+        return {0: "disk full", **{index + 1: error for index, error in errors.items()}}
+    monkeypatch.setattr(server.store, "insert_many", reject_first)
+    assert await server.flush_journal_segment(segment) == (1, True)
+    monkeypatch.setattr(server.store, "insert_many", insert_many)
+
+    assert not path.exists()
+    failed = tmp_path / "transactions-1-dead-0.jsonl.failed"
+    assert failed.exists()
+    assert set(await ledger(client)) == {"Bob"}
+
+    # Renamed back once the cause is fixed, it replays without counting Bob twice
+    failed.rename(path)
+    assert await server.replay_journal(Journal(str(tmp_path), "transactions")) == 1
+    assert set(await ledger(client)) == {"Ann", "Bob"}
+    assert await server.verify_guest_balances() == []
@@ -0,0 +1,54 @@
+import csv
+import io
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def pour(client, drink: dict, guest_name: str) -> dict:
+    response = await client.post("/api/transactions", json={"guest_name": guest_name, "drink_id": drink["id"]})
+    return response.json()
+
+
+@pytest.fixture
+async def drink(client):
+    response = await client.post("/api/drinks", json={"name": "Ale", "base_cost": 20, "total_volume": 600})
+    return response.json()
+
+
+async def test_a_deleted_transaction_leaves_a_tombstone(client, drink):
+    kept, deleted = await pour(client, drink, "Ann"), await pour(client, drink, "Ann")
+
+    assert (await client.delete(f"/api/transactions/{deleted['id']}")).status_code == 200
+    assert (await client.get(f"/api/transactions/{deleted['id']}")).status_code == 404
+    assert [transaction["id"] for transaction in (await client.get("/api/transactions")).json()] == [kept["id"]]
+    assert (await client.delete(f"/api/transactions/{deleted['id']}")).status_code == 404
+
+    tombstone = await server.store.find("transactions", deleted["id"], include_deleted=True)
+    assert tombstone["deleted_at"] is not None
+    assert (await client.get("/api/guests/Ann/balance")).json()["total_owed"] == drink["calculated_price"]
+    assert await server.verify_guest_balances() == []
+
+
+async def test_archiving_moves_settled_tabs_and_tombstones_out_of_the_history(client, drink):
+    settled = await pour(client, drink, "Ann")
+    await client.post("/api/payments", json={"guest_name": "Ann", "amount": drink["calculated_price"]})
+    open_tab = await pour(client, drink, "Bob")
+    deleted = await pour(client, drink, "Bob")
+    await client.delete(f"/api/transactions/{deleted['id']}")
+
+    moved = await server.archive_history(days=0)
+
+    assert (moved["transactions"], moved["payments"], moved["guests"]) == (2, 1, 1)
+    assert [transaction["id"] for transaction in (await client.get("/api/transactions")).json()] == [open_tab["id"]]
+    assert (await client.get("/api/payments")).json() == []
+    assert [balance["guest_name"] for balance in (await client.get("/api/guests/balances")).json()] == ["Bob"]
+    assert await server.store.find("transactions", deleted["id"], include_deleted=True) is None
+    assert await server.verify_guest_balances() == []
+
+    response = await client.get("/api/transactions/export/csv", params={"archived": True})
+    archived = list(csv.reader(io.StringIO(response.text)))[1:]
+    assert [row[4] for row in archived if row[4] != deleted["id"]] == [settled["id"]]
@@ -0,0 +1,35 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_a_round_is_priced_and_counted_per_guest(client):
+    ale = (await client.post("/api/drinks", json={"name": "Ale", "base_cost": 20, "total_volume": 600})).json()
+    wine = (await client.post("/api/drinks", json={"name": "Wine", "base_cost": 30, "total_volume": 750})).json()
+    items = [
+        {"guest_name": "Ann", "drink_id": ale["id"]},
+        {"guest_name": "Bob", "drink_id": "no-such-drink"},
+        {"guest_name": "Ann", "drink_id": wine["id"]},
+        {"guest_name": "Cy", "drink_id": ale["id"]},
+    ]
+    response = await client.post("/api/transactions/batch", json={"items": items})
+
+    result = response.json()
+    assert (result["created"], result["failed"]) == (3, 1)
+    assert [item["index"] for item in result["results"]] == [0, 1, 2, 3]
+    assert result["results"][1]["error"] == "Drink not found"
+    assert result["results"][2]["transaction"]["price_cents"] == wine["price_cents"]
+
+    balances = {balance["guest_name"]: balance for balance in (await client.get("/api/guests/balances")).json()}
+    assert set(balances) == {"Ann", "Cy"}
+    assert balances["Ann"]["total_owed"] == round(ale["calculated_price"] + wine["calculated_price"], 2)
+    assert len((await client.get("/api/transactions")).json()) == 3
+    assert await server.verify_guest_balances() == []
+
+
+async def test_a_round_needs_between_one_and_the_most_items(client):
+    assert (await client.post("/api/transactions/batch", json={"items": []})).status_code == 422
+    items = [{"guest_name": "Ann", "drink_id": "x"}] * (server.MAX_BATCH_SIZE + 1)
+    assert (await client.post("/api/transactions/batch", json={"items": items})).status_code == 422
@@ -0,0 +1,44 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def conditional_get(client, url: str, etag: str):
+    return await client.get(url, headers={"If-None-Match": etag})
+
+
+async def test_an_unchanged_list_answers_304_until_it_is_written(client):
+    drink = {"name": "Ale", "base_cost": 20, "total_volume": 600}
+    created = (await client.post("/api/drinks", json=drink)).json()
+    first = await client.get("/api/drinks")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    cached = await conditional_get(client, "/api/drinks", etag)
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    await client.put(f"/api/drinks/{created['id']}", json={**drink, "base_cost": 25})
+    changed = await conditional_get(client, "/api/drinks", etag)
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()[0]["base_cost"] == 25
+
+
+async def test_each_list_changes_with_its_own_collection(client):
+    etags = {url: (await client.get(url)).headers["ETag"]
+             for url in ("/api/transactions", "/api/payments", "/api/guests/balances")}
+    await client.post("/api/payments", json={"guest_name": "Ann", "amount": 5})
+
+    statuses = {url: (await conditional_get(client, url, etag)).status_code for url, etag in etags.items()}
+    assert statuses == {"/api/transactions": 304, "/api/payments": 200, "/api/guests/balances": 200}
+
+
+async def test_if_none_match_accepts_weak_tags_lists_and_star(client):
+    etag = (await client.get("/api/payments")).headers["ETag"]
+
+    assert (await conditional_get(client, "/api/payments", f"W/{etag}")).status_code == 304
+    assert (await conditional_get(client, "/api/payments", f'"other", {etag}')).status_code == 304
+    assert (await conditional_get(client, "/api/payments", "*")).status_code == 304
+    assert (await conditional_get(client, "/api/payments", '"other"')).status_code == 200
@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+from starlette.requests import Request
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def open_stream(last_event_id: str = ""):
+    """The body of GET /api/events; httpx's ASGI transport would wait for it to end"""
+    headers = [(b"last-event-id", last_event_id.encode())] if last_event_id else []
+    request = Request({"type": "http", "method": "GET", "path": "/api/events", "headers": headers, "query_string": b""})
+    body = (await server.stream_events(request)).body_iterator
+    assert await body.__anext__() == "retry: 3000\n\n"
+    return body
+
+
+async def next_event(body) -> tuple:
+    """(seq, type, data) of the next event the stream sends"""
+    while True:
+        message = await asyncio.wait_for(body.__anext__(), 5)
+        if not message.startswith(":"):
+            break
+    fields = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    return int(fields["id"]), fields["event"], json.loads(fields["data"])
+
+
+async def test_a_reconnecting_client_gets_what_it_missed_once(client):
+    await server.publish_events([("test", {"n": n}) for n in range(1, 4)])
+    # Published before the reconnect, but not yet tailed by this worker's broker
+    body = await open_stream("1")
+    try:
+        assert [await next_event(body) for _ in range(2)] == [(2, "test", {"n": 2}), (3, "test", {"n": 3})]
+        await server.publish_events([("test", {"n": 4})])
+        assert await next_event(body) == (4, "test", {"n": 4})
+    finally:
+        await body.aclose()
+
+
+async def test_a_new_client_gets_changes_as_they_happen(client):
+    await server.publish_events([("test", {"n": 1})])
+    body = await open_stream()
+    try:
+        drink = (await client.post("/api/drinks", json={"name": "Ale", "base_cost": 20, "total_volume": 600})).json()
+        await client.post("/api/transactions", json={"guest_name": "Ann", "drink_id": drink["id"]})
+        seq, event_type, data = await next_event(body)
+        while event_type == "test":
+            seq, event_type, data = await next_event(body)
+        assert (event_type, data["guest_name"]) == ("transaction.created", "Ann")
+        seq, event_type, data = await next_event(body)
+        assert (event_type, data["guest_name"], data["rev"]) == ("balance.updated", "Ann", 1)
+    finally:
+        await body.aclose()
+
+
+async def test_tailing_does_not_skip_an_event_stored_late(client, monkeypatch):
+    append_events = server.store.append_events
+    second_stored = asyncio.Event()
+
+    async def store_first_publish_last(events):
+        if events[0]["data"]["n"] == 1:
+            await second_stored.wait()
+            # Long enough for the tailer to read the second event first
+            await asyncio.sleep(0.5)
+        await append_events(events)
+        if events[0]["data"]["n"] == 2:
+            second_stored.set()
+    monkeypatch.setattr(server.store, "append_events", store_first_publish_last)
+
+    tailed = []
+
+    async def tail():
+        # Like EventBroker, resume whenever the store's tail ends
+        while True:
+            async for event in server.store.tail_events(tailed[-1]["seq"] if tailed else 0):
+                tailed.append(event)
+                if len(tailed) == 2:
+                    return
+            await asyncio.sleep(0.05)
+    tailer = asyncio.create_task(tail())
+    await asyncio.gather(server.publish_events([("test", {"n": 1})]), server.publish_events([("test", {"n": 2})]))
+    await asyncio.wait_for(tailer, 5)
+
+    assert [event["data"]["n"] for event in tailed] == [2, 1]
+    assert [event["seq"] for event in tailed] == [1, 2]
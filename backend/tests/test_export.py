@@ -0,0 +1,57 @@
+import csv
+import gzip
+import io
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def export(client, **params) -> list:
+    response = await client.get("/api/transactions/export/csv", params=params)
+    assert response.status_code == 200
+    body = gzip.decompress(response.content) if params.get("gzip") else response.content
+    return list(csv.reader(io.StringIO(body.decode())))
+
+
+@pytest.fixture
+async def history(client):
+    drinks = []
+    for name in ("Ale", "Cider"):
+        response = await client.post("/api/drinks", json={"name": name, "base_cost": 20, "total_volume": 600})
+        drinks.append(response.json())
+    for guest_name, drink, date in [
+        ("Ann", drinks[0], "2026-03-01T20:00:00"),
+        ("Annie", drinks[1], "2026-03-02T20:00:00"),
+        ("Bob", drinks[0], "2026-03-03T20:00:00"),
+    ]:
+        await client.post("/api/transactions", json={"guest_name": guest_name, "drink_id": drink["id"], "date": date})
+    return drinks
+
+
+async def test_export_writes_every_transaction_under_the_header(client, history, monkeypatch):
+    # Several chunks for three rows
+    monkeypatch.setattr(server, "CSV_CHUNK_ROWS", 2)
+    rows = await export(client)
+
+    assert rows[0] == server.CSV_HEADER
+    assert [row[1] for row in rows[1:]] == ["Bob", "Annie", "Ann"]
+    assert rows[1][0] == "2026-03-03 20:00:00"
+
+
+async def test_export_filters_like_the_history_list(client, history):
+    assert [row[1] for row in (await export(client, guest_name="ann"))[1:]] == ["Annie", "Ann"]
+    assert [row[1] for row in (await export(client, guest_name="ann", guest_match="exact"))[1:]] == ["Ann"]
+    assert [row[1] for row in (await export(client, drink_id=history[0]["id"]))[1:]] == ["Bob", "Ann"]
+    rows = await export(client, start_date="2026-03-02T00:00:00", end_date="2026-03-02T23:59:59")
+    assert [row[1] for row in rows[1:]] == ["Annie"]
+
+
+async def test_gzip_export_holds_the_same_rows(client, history):
+    assert await export(client, gzip=True) == await export(client)
+
+    response = await client.get("/api/transactions/export/csv", params={"gzip": True})
+    assert response.headers["content-type"] == "application/gzip"
+    assert "bartab_transactions.csv.gz" in response.headers["content-disposition"]
@@ -0,0 +1,16 @@
+import argparse
+
+import pytest
+
+import manage
+import sqlite_store
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_commands_run_on_a_new_database(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sqlite_store, "SQLITE_PATH", str(tmp_path / "new.db"))
+
+    assert await manage.run(manage.verify_balances, argparse.Namespace()) == 0
+    assert await manage.run(manage.apply_pending, argparse.Namespace()) == 0
+    assert "matches" in capsys.readouterr().out
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+async def test_event_streams_are_kept_out_of_request_latency():
+    async def stream(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8")]})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def ignore(message):
+        pass
+    scope = {"type": "http", "method": "GET", "path": "/test/stream", "route": SimpleNamespace(path="/test/stream")}
+    await server.MetricsMiddleware(stream)(scope, None, ignore)
+
+    assert sample("bartab_http_stream_duration_seconds_count", route="/test/stream") == 1
+    assert sample("bartab_http_request_duration_seconds_count",
+                  method="GET", route="/test/stream", status="200") == 0
+
+
+async def test_requests_are_timed_per_route_with_their_database_work(client):
+    route = {"method": "GET", "route": "/api/transactions/{transaction_id}"}
+    requests = sample("bartab_http_request_duration_seconds_count", **route, status="404")
+    commands = sample("bartab_http_request_db_commands_sum", **route)
+
+    for transaction_id in ("missing-1", "missing-2"):
+        assert (await client.get(f"/api/transactions/{transaction_id}")).status_code == 404
+
+    assert sample("bartab_http_request_duration_seconds_count", **route, status="404") == requests + 2
+    assert sample("bartab_http_request_db_commands_sum", **route) >= commands + 2
+
+
+async def test_slow_requests_are_logged(client, monkeypatch, caplog):
+    monkeypatch.setattr(server, "SLOW_REQUEST_SECONDS", 0)
+    await client.get("/api/transactions/missing")
+    assert any(record.getMessage().startswith("Slow request GET /api/transactions/missing")
+               for record in caplog.records)
+
+
+async def test_metrics_are_served_for_prometheus(client):
+    await client.get("/api/payments")
+    response = await client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'bartab_http_request_duration_seconds_count{method="GET",route="/api/payments",status="200"}' in response.text
+    assert "bartab_db_command_duration_seconds" in response.text
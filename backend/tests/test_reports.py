@@ -0,0 +1,68 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def report(client, **params) -> list:
+    response = await client.get("/api/reports", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+async def sales(client):
+    drinks = {}
+    for name, base_cost in (("Ale", 20), ("Wine", 30)):
+        response = await client.post("/api/drinks", json={"name": name, "base_cost": base_cost, "total_volume": 600})
+        drinks[name] = response.json()
+    transactions = []
+    for guest_name, name, date in [
+        ("Ann", "Ale", "2026-03-01T20:15:00"),
+        ("Ann", "Ale", "2026-03-01T21:30:00"),
+        ("Bob", "Wine", "2026-03-02T10:00:00"),
+    ]:
+        response = await client.post("/api/transactions", json={
+            "guest_name": guest_name, "drink_id": drinks[name]["id"], "date": date
+        })
+        transactions.append(response.json())
+    return drinks, transactions
+
+
+async def test_pours_and_revenue_add_up_per_interval(client, sales):
+    drinks, _ = sales
+    ale, wine = drinks["Ale"]["price_cents"], drinks["Wine"]["price_cents"]
+
+    days = await report(client, interval="day")
+    assert [(row["start"], row["pours"], row["revenue_cents"]) for row in days] == [
+        ("2026-03-01T00:00:00", 2, 2 * ale), ("2026-03-02T00:00:00", 1, wine)
+    ]
+    assert days[0]["revenue"] == server.from_cents(2 * ale)
+
+    hours = await report(client, interval="hour")
+    assert [row["start"][11:13] for row in hours] == ["20", "21", "10"]
+
+    by_drink = {row["drink_id"]: row["pours"] for row in await report(client, interval="total", group_by="drink")}
+    assert by_drink == {drinks["Ale"]["id"]: 2, drinks["Wine"]["id"]: 1}
+    by_guest = {row["guest_name"]: row["revenue_cents"] for row in await report(client, interval="total", group_by="guest")}
+    assert by_guest == {"Ann": 2 * ale, "Bob": wine}
+
+
+async def test_filters_and_ranges_narrow_the_report(client, sales):
+    drinks, _ = sales
+    assert [row["pours"] for row in await report(client, interval="total", guest_name="Bob")] == [1]
+    assert [row["pours"] for row in await report(client, interval="total", drink_id=drinks["Ale"]["id"])] == [2]
+    # A range that splits a day is answered from the hourly buckets it touches
+    evening = await report(client, interval="total", start_date="2026-03-01T21:00:00", end_date="2026-03-02T00:00:00")
+    assert [row["pours"] for row in evening] == [1]
+
+
+async def test_deleted_transactions_leave_the_report_and_a_rebuild_agrees(client, sales):
+    _, transactions = sales
+    await client.delete(f"/api/transactions/{transactions[0]['id']}")
+    assert [row["pours"] for row in await report(client, interval="day")] == [1, 1]
+
+    before = await report(client, interval="hour", group_by="guest")
+    assert await server.rebuild_sales_rollups() > 0
+    assert await report(client, interval="hour", group_by="guest") == before
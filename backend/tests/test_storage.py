@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+# Enough overlapping writes to share cached statements between requests
+ROUNDS = 40
+
+
+async def test_concurrent_writes_keep_the_ledger_in_step(client):
+    drink = (await client.post("/api/drinks", json={"name": "Beer", "base_cost": 24, "total_volume": 720})).json()
+    guests = [f"Guest {number}" for number in range(10)]
+
+    requests = []
+    for _ in range(ROUNDS):
+        for guest_name in guests:
+            requests.append(client.post("/api/transactions", json={"guest_name": guest_name, "drink_id": drink["id"]}))
+            requests.append(client.post("/api/payments", json={"guest_name": guest_name, "amount": 1}))
+        requests.append(client.post("/api/transactions/batch", json={
+            "items": [{"guest_name": guest_name, "drink_id": drink["id"]} for guest_name in guests]
+        }))
+    responses = await asyncio.gather(*requests)
+
+    assert [response.status_code for response in responses] == [200] * len(requests)
+    transactions = (await client.get("/api/transactions")).json()
+    assert len(transactions) == 2 * ROUNDS * len(guests)
+    assert await server.verify_guest_balances() == []
+
+
+@pytest.mark.parametrize("backend", ["sqlite"])
+async def test_a_transaction_is_stored_in_six_writes(client, monkeypatch):
+    drink = (await client.post("/api/drinks", json={"name": "Beer", "base_cost": 24, "total_volume": 720})).json()
+    await client.post("/api/transactions", json={"guest_name": "Ann", "drink_id": drink["id"]})
+
+    writes = []
+    run = server.store.run
+    async def record_writes(command, table, *args):
+        if command != "select":
+            writes.append((command, table))
+        return await run(command, table, *args)
+    monkeypatch.setattr(server.store, "run", record_writes)
+    await client.post("/api/transactions", json={"guest_name": "Ann", "drink_id": drink["id"]})
+
+    # The insert, both side effects, clearing the pending marker, the
+    # version counters and the events
+    assert writes == [
+        ("insert", "transactions"), ("update", "sales_rollups"), ("update", "guests"),
+        ("update", "transactions"), ("update", "meta"), ("insert", "events"),
+    ]
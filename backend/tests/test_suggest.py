@@ -0,0 +1,36 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def suggest(client, prefix: str, **params) -> list:
+    response = await client.get("/api/guests/suggest", params={"prefix": prefix, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def add_guests(client, *guest_names):
+    for guest_name in guest_names:
+        await client.post("/api/payments", json={"guest_name": guest_name, "amount": 1})
+
+
+async def test_suggestions_match_the_start_of_the_name_ignoring_case_and_spaces(client):
+    await add_guests(client, "Anna Lee", "annabel", "Bob", "Joanna")
+
+    assert await suggest(client, "ann") == ["Anna Lee", "annabel"]
+    assert await suggest(client, "  ANNA   l") == ["Anna Lee"]
+    assert await suggest(client, "x") == []
+    assert await suggest(client, "ann", limit=1) == ["Anna Lee"]
+    assert (await client.get("/api/guests/suggest", params={"limit": 51})).status_code == 422
+
+
+async def test_another_workers_directory_loads_the_stored_guests(client):
+    await add_guests(client, "Ann", "Bob")
+    # A worker that has not seen these guests created
+    directory = server.GuestDirectory(refresh_interval=0)
+    assert await directory.suggest("", 10) == ["Ann", "Bob"]
+
+    await add_guests(client, "Cy")
+    assert await directory.suggest("c", 10) == ["Cy"]
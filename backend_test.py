@@ -7,12 +7,13 @@ Tests all CRUD operations, price calculations, and CSV export functionality
 import requests
 import sys
 import json
+import os
 from datetime import datetime
 import uuid
 
 class BarTabAPITester:
-    def __init__(self, base_url="https://6d7c6d03-426d-4711-841d-17d4b386c1ca.preview.emergentagent.com"):
-        self.base_url = base_url
+    def __init__(self, base_url=None):
+        self.base_url = base_url or os.environ.get("BARTAB_API_URL", "http://localhost:8001")
         self.tests_run = 0
         self.tests_passed = 0
         self.created_drinks = []
@@ -364,7 +365,7 @@ def main():
     print("=" * 80)
     
     # Initialize tester
-    tester = BarTabAPITester()
+    tester = BarTabAPITester(sys.argv[1] if len(sys.argv) > 1 else None)
     
     try:
         # Test 1: Root endpoint
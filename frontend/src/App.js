@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { cachedGet } from './api';
 import './App.css';
 import ServeForm from './ServeForm';
 import TransactionHistory from './TransactionHistory';
@@ -11,7 +12,6 @@ const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001
 function App() {
   const [currentView, setCurrentView] = useState('dashboard');
   const [drinks, setDrinks] = useState([]);
-  const [transactions, setTransactions] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
@@ -19,27 +19,17 @@ function App() {
   // Load initial data
   useEffect(() => {
     loadDrinks();
-    loadTransactions();
   }, []);
 
   const loadDrinks = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/drinks`);
+      const response = await cachedGet('/api/drinks');
       setDrinks(response.data);
     } catch (err) {
       setError('Failed to load drinks');
     }
   };
 
-  const loadTransactions = async () => {
-    try {
-      const response = await axios.get(`${API_BASE_URL}/api/transactions`);
-      setTransactions(response.data);
-    } catch (err) {
-      setError('Failed to load transactions');
-    }
-  };
-
   const showMessage = (message, type = 'success') => {
     if (type === 'success') {
       setSuccess(message);
@@ -148,7 +138,7 @@ function App() {
           {currentView === 'dashboard' && (
             <Dashboard 
               drinks={drinks} 
-              transactions={transactions} 
+              showMessage={showMessage}
               onExportCSV={() => window.open(`${API_BASE_URL}/api/transactions/export/csv`)}
             />
           )}
@@ -163,7 +153,6 @@ function App() {
           {currentView === 'serve' && (
             <ServeForm 
               drinks={drinks} 
-              onTransactionAdded={loadTransactions}
               showMessage={showMessage}
             />
           )}
@@ -179,9 +168,7 @@ function App() {
           )}
           {currentView === 'history' && (
             <TransactionHistory 
-              transactions={transactions} 
               drinks={drinks}
-              onTransactionDeleted={loadTransactions}
               showMessage={showMessage}
             />
           )}
@@ -192,10 +179,34 @@ function App() {
 }
 
 // Dashboard Component
-function Dashboard({ drinks, transactions, onExportCSV }) {
-  const totalRevenue = transactions.reduce((sum, t) => sum + t.calculated_price, 0);
-  const totalTransactions = transactions.length;
-  const uniqueGuests = new Set(transactions.map(t => t.guest_name)).size;
+// Totals come from the sales report and the balance ledger, and only the five
+// newest transactions are fetched, so the page never downloads the history
+function Dashboard({ drinks, showMessage, onExportCSV }) {
+  const [recentTransactions, setRecentTransactions] = useState([]);
+  const [totals, setTotals] = useState({ pours: 0, revenue: 0 });
+  const [guestCount, setGuestCount] = useState(0);
+
+  useEffect(() => {
+    const loadDashboard = async () => {
+      try {
+        const [recent, report, balances] = await Promise.all([
+          cachedGet('/api/transactions', { params: { limit: 5 } }),
+          cachedGet('/api/reports', { params: { interval: 'total' } }),
+          cachedGet('/api/guests/balances')
+        ]);
+        setRecentTransactions(recent.data);
+        setTotals(report.data[0] || { pours: 0, revenue: 0 });
+        setGuestCount(balances.data.length);
+      } catch (err) {
+        showMessage('Failed to load dashboard', 'error');
+      }
+    };
+    loadDashboard();
+  }, []);
+
+  const totalRevenue = totals.revenue;
+  const totalTransactions = totals.pours;
+  const uniqueGuests = guestCount;
 
   return (
     <div>
@@ -245,7 +256,7 @@ function Dashboard({ drinks, transactions, onExportCSV }) {
               </tr>
             </thead>
             <tbody className="divide-y divide-gray-200">
-              {transactions.slice(0, 5).map((transaction) => {
+              {recentTransactions.map((transaction) => {
                 const drink = drinks.find(d => d.id === transaction.drink_id);
                 return (
                   <tr key={transaction.id} className="hover:bg-pastel-blue hover:bg-opacity-50">
@@ -494,7 +505,7 @@ function DrinkManager({ drinks, onDrinkAdded, onDrinkDeleted, showMessage }) {
               <p><strong>Serving Size:</strong> {drink.volume_served} oz</p>
               <p><strong>Mixer Cost:</strong> ${drink.mixer_cost.toFixed(2)}</p>
               <p><strong>Flat Cost:</strong> ${drink.flat_cost.toFixed(2)}</p>
-              <p><strong>Price per Serving:</strong> ${((drink.base_cost / (drink.volume_unit === 'oz' ? drink.total_volume * 29.5735 : drink.total_volume)) * (drink.volume_served * 29.5735) + drink.mixer_cost + drink.flat_cost).toFixed(2)}</p>
+              <p><strong>Price per Serving:</strong> ${drink.calculated_price.toFixed(2)}</p>
             </div>
             <div className="flex gap-2">
               <button
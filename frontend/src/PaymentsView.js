@@ -1,5 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { cachedGet, postWithRetry } from './api';
+import { useServerEvents, applyBalanceUpdate } from './events';
 
 const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
@@ -7,6 +9,8 @@ function PaymentsView({ showMessage }) {
   const [payments, setPayments] = useState([]);
   const [guestBalances, setGuestBalances] = useState([]);
   const [showForm, setShowForm] = useState(false);
+  const [settleSelection, setSettleSelection] = useState([]);
+  const [settling, setSettling] = useState(false);
   const [formData, setFormData] = useState({
     guest_name: '',
     amount: '',
@@ -16,7 +20,7 @@ function PaymentsView({ showMessage }) {
 
   const loadPayments = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/payments`);
+      const response = await cachedGet('/api/payments');
       setPayments(response.data);
     } catch (err) {
       showMessage('Failed to load payments', 'error');
@@ -25,7 +29,7 @@ function PaymentsView({ showMessage }) {
 
   const loadGuestBalances = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/guests/balances`);
+      const response = await cachedGet('/api/guests/balances');
       setGuestBalances(response.data);
     } catch (err) {
       showMessage('Failed to load guest balances', 'error');
@@ -37,10 +41,24 @@ function PaymentsView({ showMessage }) {
     loadGuestBalances();
   }, []);
 
+  const addPayments = (created) => setPayments(current => {
+    const added = created.filter(payment => !current.some(p => p.id === payment.id));
+    return added.length
+      ? [...added, ...current].sort((a, b) => new Date(b.date) - new Date(a.date))
+      : current;
+  });
+
+  // Apply payment and balance changes from the change feed instead of reloading both lists
+  useServerEvents({
+    'payment.created': (payment) => addPayments([payment]),
+    'payment.deleted': ({ id }) => setPayments(current => current.filter(p => p.id !== id)),
+    'balance.updated': (update) => setGuestBalances(balances => applyBalanceUpdate(balances, update))
+  });
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API_BASE_URL}/api/payments`, {
+      await postWithRetry('/api/payments', {
         ...formData,
         amount: parseFloat(formData.amount),
         date: new Date(formData.date).toISOString()
@@ -53,21 +71,46 @@ function PaymentsView({ showMessage }) {
         notes: ''
       });
       setShowForm(false);
-      loadPayments();
-      loadGuestBalances();
     } catch (err) {
       showMessage('Failed to record payment', 'error');
     }
   };
 
+  // Settle the selected tabs (or every open tab) with one request; the server
+  // pays each guest's current balance, and a retry never pays a tab twice
+  const handleSettle = async (guestNames) => {
+    const everyone = !guestNames;
+    if (everyone && !window.confirm('Settle every outstanding tab?')) {
+      return;
+    }
+    setSettling(true);
+    try {
+      const response = await postWithRetry('/api/guests/settle',
+        everyone ? { all_with_balance: true } : { guest_names: guestNames });
+      const { settled, amount, payments: created, balances } = response.data;
+      addPayments(created);
+      setGuestBalances(current => balances.reduce(applyBalanceUpdate, current));
+      setSettleSelection([]);
+      showMessage(`Settled ${settled} tab${settled === 1 ? '' : 's'} for $${amount.toFixed(2)}`);
+    } catch (err) {
+      showMessage('Failed to settle tabs', 'error');
+    } finally {
+      setSettling(false);
+    }
+  };
+
+  const toggleSettleSelection = (guestName) => {
+    setSettleSelection(current => current.includes(guestName)
+      ? current.filter(name => name !== guestName)
+      : [...current, guestName]);
+  };
+
   const handleDelete = async (paymentId) => {
     if (window.confirm('Are you sure you want to delete this payment?')) {
       try {
         const response = await axios.delete(`${API_BASE_URL}/api/payments/${paymentId}`);
         console.log('Delete payment response:', response);
         showMessage('Payment deleted successfully!');
-        loadPayments();
-        loadGuestBalances();
       } catch (err) {
         console.error('Error deleting payment:', err);
         showMessage('Failed to delete payment', 'error');
@@ -77,6 +120,8 @@ function PaymentsView({ showMessage }) {
 
   const totalPayments = payments.reduce((sum, payment) => sum + payment.amount, 0);
   const guestsWithDebt = guestBalances.filter(guest => guest.balance > 0);
+  const totalOutstanding = guestsWithDebt.reduce((sum, guest) => sum + guest.balance, 0);
+  const selectedForSettle = settleSelection.filter(name => guestsWithDebt.some(guest => guest.guest_name === name));
 
   return (
     <div>
@@ -199,6 +244,47 @@ function PaymentsView({ showMessage }) {
         </div>
       )}
 
+      {/* Settle Up */}
+      {guestsWithDebt.length > 0 && (
+        <div className="bg-pastel-blue bg-opacity-30 p-6 rounded-lg mb-6">
+          <div className="flex justify-between items-center mb-4">
+            <h3 className="text-lg font-semibold text-blue-700">🧾 Settle Up</h3>
+            <div className="flex gap-2">
+              <button
+                onClick={() => handleSettle(selectedForSettle)}
+                disabled={settling || selectedForSettle.length === 0}
+                className="pastel-button bg-green-500 text-white px-4 py-2 rounded-lg font-medium hover:bg-green-600 disabled:opacity-50"
+              >
+                Settle Selected ({selectedForSettle.length})
+              </button>
+              <button
+                onClick={() => handleSettle(null)}
+                disabled={settling}
+                className="pastel-button bg-pastel-green text-green-700 px-4 py-2 rounded-lg font-medium hover:bg-green-100 disabled:opacity-50"
+              >
+                Settle All (${totalOutstanding.toFixed(2)})
+              </button>
+            </div>
+          </div>
+          <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-2">
+            {guestsWithDebt.map((guest) => (
+              <label key={guest.guest_name} className="flex items-center justify-between bg-white p-3 rounded-lg cursor-pointer">
+                <span className="flex items-center">
+                  <input
+                    type="checkbox"
+                    checked={selectedForSettle.includes(guest.guest_name)}
+                    onChange={() => toggleSettleSelection(guest.guest_name)}
+                    className="mr-2"
+                  />
+                  <span className="font-medium text-gray-800">{guest.guest_name}</span>
+                </span>
+                <span className="text-sm text-red-600">${guest.balance.toFixed(2)}</span>
+              </label>
+            ))}
+          </div>
+        </div>
+      )}
+
       {/* Payments History */}
       <div className="bg-white rounded-lg shadow-md overflow-hidden">
         <div className="px-6 py-4 bg-pastel-mint border-b">
@@ -1,37 +1,41 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { postWithRetry } from './api';
 
 const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
-function ServeForm({ drinks, onTransactionAdded, showMessage }) {
+function ServeForm({ drinks, showMessage }) {
   const [formData, setFormData] = useState({
     guest_name: '',
     drink_id: '',
     date: new Date().toISOString().split('T')[0]
   });
-  const [priceCalculation, setPriceCalculation] = useState(null);
-  const [calculating, setCalculating] = useState(false);
+  const [roundItems, setRoundItems] = useState([]);
+  const [guestSuggestions, setGuestSuggestions] = useState([]);
 
-  const calculatePrice = async () => {
-    if (!formData.drink_id) return;
-    
-    setCalculating(true);
-    try {
-      const response = await axios.post(`${API_BASE_URL}/api/calculate-price`, {
-        drink_id: formData.drink_id
-      });
-      setPriceCalculation(response.data);
-    } catch (err) {
-      showMessage('Failed to calculate price', 'error');
-    } finally {
-      setCalculating(false);
+  // Autocomplete guest names from the guest directory as the name is typed
+  useEffect(() => {
+    if (!formData.guest_name) {
+      setGuestSuggestions([]);
+      return;
     }
-  };
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API_BASE_URL}/api/guests/suggest`, {
+          params: { prefix: formData.guest_name }
+        });
+        setGuestSuggestions(response.data);
+      } catch (err) {
+        setGuestSuggestions([]);
+      }
+    }, 150);
+    return () => clearTimeout(timer);
+  }, [formData.guest_name]);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API_BASE_URL}/api/transactions`, {
+      await postWithRetry('/api/transactions', {
         ...formData,
         date: new Date(formData.date).toISOString()
       });
@@ -41,23 +45,53 @@ function ServeForm({ drinks, onTransactionAdded, showMessage }) {
         drink_id: '',
         date: new Date().toISOString().split('T')[0]
       });
-      setPriceCalculation(null);
-      onTransactionAdded();
     } catch (err) {
       showMessage('Failed to record transaction', 'error');
     }
   };
 
-  // Auto-calculate price when drink changes
-  React.useEffect(() => {
-    if (formData.drink_id) {
-      calculatePrice();
-    } else {
-      setPriceCalculation(null);
+  // Queue the current guest and drink as part of a round
+  const addToRound = () => {
+    if (!formData.guest_name || !formData.drink_id) {
+      showMessage('Enter a guest name and select a drink first', 'error');
+      return;
     }
-  }, [formData.drink_id]);
+    setRoundItems([...roundItems, {
+      guest_name: formData.guest_name,
+      drink_id: formData.drink_id,
+      date: new Date(formData.date).toISOString()
+    }]);
+    setFormData({ ...formData, guest_name: '' });
+  };
+
+  const removeFromRound = (index) => {
+    setRoundItems(roundItems.filter((_, i) => i !== index));
+  };
+
+  // Record the whole round in a single request
+  const submitRound = async () => {
+    try {
+      const response = await axios.post(`${API_BASE_URL}/api/transactions/batch`, {
+        items: roundItems
+      });
+      const { created, failed, results } = response.data;
+      if (failed > 0) {
+        showMessage(`Recorded ${created} drinks, ${failed} failed`, 'error');
+        setRoundItems(roundItems.filter((_, i) => results[i].error));
+      } else {
+        showMessage(`Round of ${created} drinks recorded successfully!`);
+        setRoundItems([]);
+      }
+    } catch (err) {
+      showMessage('Failed to record round', 'error');
+    }
+  };
 
   const selectedDrink = drinks.find(d => d.id === formData.drink_id);
+  // Prices are computed when a drink is saved, so no extra request is needed here
+  const priceCalculation = selectedDrink
+    ? { calculated_price: selectedDrink.calculated_price, breakdown: selectedDrink.breakdown }
+    : null;
 
   return (
     <div>
@@ -77,7 +111,14 @@ function ServeForm({ drinks, onTransactionAdded, showMessage }) {
                 className="pastel-input w-full px-3 py-2 rounded-lg"
                 required
                 placeholder="Enter guest name"
+                list="guest-suggestions"
+                autoComplete="off"
               />
+              <datalist id="guest-suggestions">
+                {guestSuggestions.map((name) => (
+                  <option key={name} value={name} />
+                ))}
+              </datalist>
             </div>
             <div>
               <label className="block text-sm font-medium text-gray-700 mb-2">Date</label>
@@ -106,7 +147,7 @@ function ServeForm({ drinks, onTransactionAdded, showMessage }) {
               <option value="">Select a drink...</option>
               {drinks.map((drink) => (
                 <option key={drink.id} value={drink.id}>
-                  {drink.name} - ${((drink.base_cost / (drink.volume_unit === 'oz' ? drink.total_volume * 29.5735 : drink.total_volume)) * (drink.volume_served * 29.5735) + drink.mixer_cost + drink.flat_cost).toFixed(2)}
+                  {drink.name} - ${drink.calculated_price.toFixed(2)}
                 </option>
               ))}
             </select>
@@ -158,14 +199,54 @@ function ServeForm({ drinks, onTransactionAdded, showMessage }) {
           </div>
         )}
 
+        {/* Round */}
+        {roundItems.length > 0 && (
+          <div className="bg-pastel-yellow bg-opacity-30 p-6 rounded-lg">
+            <h3 className="text-lg font-semibold text-yellow-700 mb-4">🍻 Current Round</h3>
+            <div className="bg-white rounded-lg divide-y divide-gray-200">
+              {roundItems.map((item, index) => {
+                const drink = drinks.find(d => d.id === item.drink_id);
+                return (
+                  <div key={index} className="flex justify-between items-center px-4 py-2 text-sm text-gray-700">
+                    <span>{item.guest_name} - {drink ? `${drink.name} ($${drink.calculated_price.toFixed(2)})` : 'Unknown'}</span>
+                    <button
+                      type="button"
+                      onClick={() => removeFromRound(index)}
+                      className="text-red-600 hover:text-red-800 font-medium"
+                    >
+                      Remove
+                    </button>
+                  </div>
+                );
+              })}
+            </div>
+          </div>
+        )}
+
         {/* Submit Button */}
-        <div className="text-center">
+        <div className="text-center flex flex-wrap justify-center gap-4">
+          <button
+            type="button"
+            onClick={addToRound}
+            className="pastel-button bg-pastel-yellow text-yellow-700 px-8 py-3 rounded-lg font-medium hover:bg-yellow-100"
+          >
+            ➕ Add to Round
+          </button>
+          {roundItems.length > 0 && (
+            <button
+              type="button"
+              onClick={submitRound}
+              className="pastel-button bg-yellow-500 text-white px-8 py-3 rounded-lg font-medium hover:bg-yellow-600"
+            >
+              Record Round ({roundItems.length} drinks)
+            </button>
+          )}
           <button
             type="submit"
-            disabled={calculating || !priceCalculation}
+            disabled={!priceCalculation}
             className="pastel-button bg-green-500 text-white px-8 py-3 rounded-lg font-medium hover:bg-green-600 disabled:bg-gray-400 disabled:cursor-not-allowed"
           >
-            {calculating ? 'Calculating...' : `Record Transaction ${priceCalculation ? `- $${priceCalculation.calculated_price}` : ''}`}
+            {`Record Transaction ${priceCalculation ? `- $${priceCalculation.calculated_price}` : ''}`}
           </button>
         </div>
       </form>
@@ -1,7 +1,6 @@
 import React, { useState, useEffect } from 'react';
-import axios from 'axios';
-
-const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+import { cachedGet } from './api';
+import { useServerEvents, applyBalanceUpdate } from './events';
 
 function TabsView({ showMessage }) {
   const [guestBalances, setGuestBalances] = useState([]);
@@ -10,7 +9,7 @@ function TabsView({ showMessage }) {
   const loadGuestBalances = async () => {
     setLoading(true);
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/guests/balances`);
+      const response = await cachedGet('/api/guests/balances');
       setGuestBalances(response.data);
     } catch (err) {
       showMessage('Failed to load guest balances', 'error');
@@ -23,6 +22,11 @@ function TabsView({ showMessage }) {
     loadGuestBalances();
   }, []);
 
+  // Keep balances current from the change feed instead of polling
+  useServerEvents({
+    'balance.updated': (update) => setGuestBalances(balances => applyBalanceUpdate(balances, update))
+  });
+
   const totalOutstanding = guestBalances.reduce((sum, guest) => sum + Math.max(0, guest.balance), 0);
   const guestsWithDebt = guestBalances.filter(guest => guest.balance > 0).length;
 
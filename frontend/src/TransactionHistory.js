@@ -1,28 +1,67 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 import axios from 'axios';
+import { cachedGet } from './api';
 
 const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+const PAGE_SIZE = 50;
 
-function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMessage }) {
+function TransactionHistory({ drinks, showMessage }) {
   const [filters, setFilters] = useState({
     guest_name: '',
     drink_id: '',
     start_date: '',
     end_date: ''
   });
+  const [transactions, setTransactions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
+  const sentinelRef = useRef(null);
 
-  const filteredTransactions = transactions.filter(transaction => {
-    const matchesGuest = !filters.guest_name || 
-      transaction.guest_name.toLowerCase().includes(filters.guest_name.toLowerCase());
-    
-    const matchesDrink = !filters.drink_id || transaction.drink_id === filters.drink_id;
-    
-    const transactionDate = new Date(transaction.date).toISOString().split('T')[0];
-    const matchesStartDate = !filters.start_date || transactionDate >= filters.start_date;
-    const matchesEndDate = !filters.end_date || transactionDate <= filters.end_date;
-    
-    return matchesGuest && matchesDrink && matchesStartDate && matchesEndDate;
-  });
+  const buildParams = (cursor) => {
+    const params = { limit: PAGE_SIZE };
+    if (filters.guest_name) params.guest_name = filters.guest_name;
+    if (filters.drink_id) params.drink_id = filters.drink_id;
+    if (filters.start_date) params.start_date = filters.start_date;
+    // The end date filter covers the whole selected day
+    if (filters.end_date) params.end_date = `${filters.end_date}T23:59:59.999`;
+    if (cursor) params.cursor = cursor;
+    return params;
+  };
+
+  const loadPage = async (cursor = null) => {
+    setLoading(true);
+    try {
+      const response = await cachedGet('/api/transactions', {
+        params: buildParams(cursor)
+      });
+      setTransactions(previous => cursor ? [...previous, ...response.data] : response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (err) {
+      showMessage('Failed to load transactions', 'error');
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  // Reload from the first page whenever the filters change
+  useEffect(() => {
+    const timer = setTimeout(() => loadPage(), 300);
+    return () => clearTimeout(timer);
+  }, [filters]);
+
+  // Fetch the next page when the bottom of the list scrolls into view
+  const handleIntersection = useCallback((entries) => {
+    if (entries[0].isIntersecting && nextCursor && !loading) {
+      loadPage(nextCursor);
+    }
+  }, [nextCursor, loading, filters]);
+
+  useEffect(() => {
+    if (!sentinelRef.current) return;
+    const observer = new IntersectionObserver(handleIntersection, { rootMargin: '200px' });
+    observer.observe(sentinelRef.current);
+    return () => observer.disconnect();
+  }, [handleIntersection]);
 
   const handleDelete = async (transactionId) => {
     if (window.confirm('Are you sure you want to delete this transaction?')) {
@@ -30,7 +69,7 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
         const response = await axios.delete(`${API_BASE_URL}/api/transactions/${transactionId}`);
         console.log('Delete transaction response:', response);
         showMessage('Transaction deleted successfully!');
-        onTransactionDeleted();
+        setTransactions(previous => previous.filter(t => t.id !== transactionId));
       } catch (err) {
         console.error('Error deleting transaction:', err);
         showMessage('Failed to delete transaction', 'error');
@@ -38,6 +77,12 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
     }
   };
 
+  const exportFiltered = () => {
+    const { limit, ...params } = buildParams(null);
+    const query = new URLSearchParams(params).toString();
+    window.open(`${API_BASE_URL}/api/transactions/export/csv${query ? `?${query}` : ''}`);
+  };
+
   const clearFilters = () => {
     setFilters({
       guest_name: '',
@@ -47,7 +92,7 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
     });
   };
 
-  const totalRevenue = filteredTransactions.reduce((sum, t) => sum + t.calculated_price, 0);
+  const totalRevenue = transactions.reduce((sum, t) => sum + t.calculated_price, 0);
 
   return (
     <div>
@@ -64,7 +109,7 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
               value={filters.guest_name}
               onChange={(e) => setFilters({...filters, guest_name: e.target.value})}
               className="pastel-input w-full px-3 py-2 rounded-lg"
-              placeholder="Search by guest name..."
+              placeholder="Guest name starts with..."
             />
           </div>
           <div>
@@ -108,9 +153,15 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
           >
             Clear Filters
           </button>
+          <button
+            onClick={exportFiltered}
+            className="pastel-button bg-pastel-mint text-green-700 px-4 py-2 rounded-lg font-medium hover:bg-green-100"
+          >
+            📥 Export Filtered CSV
+          </button>
           <div className="flex-1 text-right">
             <span className="text-sm text-gray-600">
-              Showing {filteredTransactions.length} of {transactions.length} transactions
+              Showing {transactions.length} transactions{nextCursor ? ' (scroll for more)' : ''}
             </span>
           </div>
         </div>
@@ -118,10 +169,10 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
 
       {/* Summary */}
       <div className="bg-pastel-green bg-opacity-30 p-6 rounded-lg mb-6">
-        <h3 className="text-lg font-semibold text-green-700 mb-2">📊 Summary</h3>
+        <h3 className="text-lg font-semibold text-green-700 mb-2">📊 Summary of Loaded Transactions</h3>
         <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
           <div className="text-center">
-            <div className="text-2xl font-bold text-green-800">{filteredTransactions.length}</div>
+            <div className="text-2xl font-bold text-green-800">{transactions.length}</div>
             <div className="text-sm text-green-600">Transactions</div>
           </div>
           <div className="text-center">
@@ -130,7 +181,7 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
           </div>
           <div className="text-center">
             <div className="text-2xl font-bold text-green-800">
-              ${filteredTransactions.length > 0 ? (totalRevenue / filteredTransactions.length).toFixed(2) : '0.00'}
+              ${transactions.length > 0 ? (totalRevenue / transactions.length).toFixed(2) : '0.00'}
             </div>
             <div className="text-sm text-green-600">Average per Transaction</div>
           </div>
@@ -151,7 +202,7 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
               </tr>
             </thead>
             <tbody className="divide-y divide-gray-200">
-              {filteredTransactions.map((transaction) => {
+              {transactions.map((transaction) => {
                 const drink = drinks.find(d => d.id === transaction.drink_id);
                 return (
                   <tr key={transaction.id} className="hover:bg-pastel-purple hover:bg-opacity-20">
@@ -182,14 +233,19 @@ function TransactionHistory({ transactions, drinks, onTransactionDeleted, showMe
           </table>
         </div>
         
-        {filteredTransactions.length === 0 && (
+        {transactions.length === 0 && !loading && (
           <div className="text-center py-12">
             <div className="text-gray-400 text-lg">No transactions found</div>
             <div className="text-gray-500 text-sm mt-2">
-              {transactions.length === 0 ? 'No transactions have been recorded yet.' : 'Try adjusting your filters.'}
+              {Object.values(filters).some(Boolean) ? 'Try adjusting your filters.' : 'No transactions have been recorded yet.'}
             </div>
           </div>
         )}
+
+        <div ref={sentinelRef} />
+        {loading && (
+          <div className="text-center py-4 text-sm text-gray-500">Loading transactions...</div>
+        )}
       </div>
     </div>
   );
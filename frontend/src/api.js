@@ -0,0 +1,61 @@
+import axios from 'axios';
+
+const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+const MAX_CACHED_RESPONSES = 100;
+
+// Last response seen for each GET url, revalidated with its ETag
+const responses = new Map();
+
+// GET that sends the cached ETag as If-None-Match; on 304 the server skips
+// the query and the body, and the cached response is returned instead
+export async function cachedGet(path, config = {}) {
+  const url = `${API_BASE_URL}${path}`;
+  const key = axios.getUri({ url, params: config.params });
+  const cached = responses.get(key);
+
+  const response = await axios.get(url, {
+    ...config,
+    headers: cached ? { ...config.headers, 'If-None-Match': cached.headers.etag } : config.headers,
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304
+  });
+  if (response.status === 304 && cached) {
+    return cached;
+  }
+
+  responses.delete(key);
+  if (response.headers.etag) {
+    responses.set(key, response);
+    if (responses.size > MAX_CACHED_RESPONSES) {
+      responses.delete(responses.keys().next().value);
+    }
+  }
+  return response;
+}
+
+const RETRY_TIMEOUT_MS = 5000;
+const RETRY_ATTEMPTS = 4;
+
+function newIdempotencyKey() {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// POST a create request with an Idempotency-Key, retrying timeouts, network
+// errors and 5xx responses. Every attempt sends the same key, so the server
+// records the create once however many attempts reach it.
+export async function postWithRetry(path, data) {
+  const headers = { 'Idempotency-Key': newIdempotencyKey() };
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await axios.post(`${API_BASE_URL}${path}`, data, { headers, timeout: RETRY_TIMEOUT_MS });
+    } catch (err) {
+      const retryable = !err.response || err.response.status >= 500;
+      if (!retryable || attempt >= RETRY_ATTEMPTS) {
+        throw err;
+      }
+      await new Promise(resolve => setTimeout(resolve, 250 * 2 ** (attempt - 1)));
+    }
+  }
+}
@@ -0,0 +1,39 @@
+import { useEffect, useRef } from 'react';
+
+const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+
+// Subscribe to the server's change feed. handlers maps event types such as
+// 'balance.updated' to callbacks receiving the parsed event data. The browser
+// reconnects on its own and resumes from the last event it saw.
+export function useServerEvents(handlers) {
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+
+  useEffect(() => {
+    const source = new EventSource(`${API_BASE_URL}/api/events`);
+    const listeners = Object.keys(handlersRef.current).map((type) => {
+      const listener = (e) => handlersRef.current[type](JSON.parse(e.data));
+      source.addEventListener(type, listener);
+      return [type, listener];
+    });
+    return () => {
+      listeners.forEach(([type, listener]) => source.removeEventListener(type, listener));
+      source.close();
+    };
+  }, []);
+}
+
+// Replace a guest's row with an updated balance, keeping highest debt first.
+// Events can arrive out of order, so a balance older than the row's (by the
+// ledger's rev) is ignored.
+export function applyBalanceUpdate(balances, update) {
+  const current = balances.find(guest => guest.guest_name === update.guest_name);
+  if (current && current.rev > update.rev) {
+    return balances;
+  }
+  const others = balances.filter(guest => guest.guest_name !== update.guest_name);
+  if (update.total_owed === 0 && update.total_paid === 0) {
+    return others;
+  }
+  return [...others, update].sort((a, b) => b.balance - a.balance);
+}